@@ -0,0 +1,52 @@
+"""
+حذف السلال الخاملة على دفعات وإحصائيات السلال المهجورة
+
+الحذف يتقدم بالمعرف (id > آخر معرف محذوف) فكل دفعة تبدأ من حيث انتهت سابقتها
+دون إعادة فحص الصفوف، وكل دفعة في معاملة قصيرة بجملتي DELETE فقط: لا توجد
+إشارات على Cart و CartItem فيحذف Django بالمسار السريع دون تحميل الصفوف.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+
+from .models import Cart, CartItem
+
+
+def delete_in_batches(carts, batch_size=1000, start_after=0, max_batches=None, sleep=0):
+    """
+    يولد (آخر معرف محذوف، عدد السلال المحذوفة) بعد كل دفعة
+
+    start_after يسمح بالاستئناف من نقطة سابقة، و sleep تبطئ الحذف بين الدفعات
+    حتى لا يزاحم حركة قاعدة البيانات في ساعات العمل.
+    """
+    last_id = start_after
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(carts.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            Cart.objects.filter(id__in=ids).delete()
+        last_id = ids[-1]
+        batches += 1
+        yield last_id, len(ids)
+        if sleep:
+            time.sleep(sleep)
+
+
+def abandoned_cart_stats(carts):
+    """
+    لكل منتج باستعلام تجميع واحد: عدد السلال المهجورة التي تحتويه (carts)
+    والكمية (units) والقيمة بسعر المنتج الحالي (value)
+    """
+    value = ExpressionWrapper(
+        F('quantity') * F('product__price'), output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+    return (
+        CartItem.objects.filter(cart__in=carts)
+        .order_by()
+        .values('product_id', 'product__name')
+        .annotate(carts=Count('cart_id', distinct=True), units=Sum('quantity'), value=Sum(value))
+        .order_by('-carts', '-units', 'product_id')
+    )
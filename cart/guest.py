@@ -0,0 +1,104 @@
+"""
+سلال الضيوف في الكاش
+
+سلة الضيف مفتاحها رمز عشوائي محفوظ في الجلسة (ويبقى بعد تغيير مفتاح الجلسة عند
+تسجيل الدخول)، وقيمتها صفوف مضغوطة (المنتج، التنويع، الكمية) بمدة صلاحية
+GUEST_CART_TTL تتجدد مع كل تعديل. لا تكتب في قاعدة البيانات إلا عند تسجيل
+الدخول (الدمج في سلة المستخدم) أو عند إتمام الطلب.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Prefetch
+
+from products.models import Product, ProductAttributeValue, ProductVariation
+from .models import CartItem, cart_totals
+
+SESSION_KEY = 'guest_cart'
+DEFAULT_TTL = 60 * 60 * 24 * 7
+
+
+def get_guest_cache():
+    return caches[getattr(settings, 'GUEST_CART_CACHE_ALIAS', 'default')]
+
+
+class GuestCart:
+    """
+    تعرض نفس ما يحتاجه CartSerializer من Cart: المعرف والعناصر والإجماليات
+    """
+    pk = id = None
+    created_at = updated_at = None
+
+    def __init__(self, token):
+        self.token = token
+        self._items = None
+
+    @classmethod
+    def for_session(cls, session, create=False):
+        token = session.get(SESSION_KEY)
+        if token is None:
+            if not create:
+                return None
+            token = session[SESSION_KEY] = uuid.uuid4().hex
+        return cls(token)
+
+    @property
+    def cache_key(self):
+        return f"guest_cart:{self.token}"
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'GUEST_CART_TTL', DEFAULT_TTL)
+
+    def get_quantities(self):
+        lines = get_guest_cache().get(self.cache_key) or ()
+        return {(product_id, variation_id): quantity for product_id, variation_id, quantity in lines}
+
+    def set_quantities(self, quantities):
+        lines = tuple(
+            (product_id, variation_id, quantity) for (product_id, variation_id), quantity in quantities.items()
+        )
+        if lines:
+            get_guest_cache().set(self.cache_key, lines, self.ttl)
+        else:
+            get_guest_cache().delete(self.cache_key)
+        self._items = None
+
+    def clear(self):
+        self.set_quantities({})
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = self.load_items()
+        return self._items
+
+    def load_items(self):
+        """
+        عناصر غير محفوظة مع منتجاتها وتنويعاتها؛ تسقط المنتجات التي لم تعد نشطة
+        """
+        quantities = self.get_quantities()
+        if not quantities:
+            return []
+        products = Product.objects.filter(is_active=True).for_listing().in_bulk(
+            {product_id for product_id, _ in quantities}
+        )
+        variation_ids = {variation_id for _, variation_id in quantities} - {None}
+        variations = {}
+        if variation_ids:
+            variations = ProductVariation.objects.filter(is_active=True).select_related('product').prefetch_related(
+                Prefetch('attributes', queryset=ProductAttributeValue.objects.select_related('attribute'))
+            ).in_bulk(variation_ids)
+
+        items = []
+        for (product_id, variation_id), quantity in quantities.items():
+            product = products.get(product_id)
+            variation = variations.get(variation_id) if variation_id else None
+            if product is None or (variation_id and variation is None):
+                continue
+            items.append(CartItem(product=product, variation=variation, quantity=quantity))
+        return items
+
+    def get_totals(self):
+        return cart_totals(self.items)
@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cart.cleanup import delete_in_batches
+from cart.guest import DEFAULT_TTL
+from cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        "حذف سلال الضيوف المهجورة من قاعدة البيانات على دفعات "
+        "(سلال الضيوف في الكاش تنتهي وحدها بانتهاء GUEST_CART_TTL)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="عمر السلة بالأيام منذ آخر تعديل (الافتراضي مدة صلاحية سلال الضيوف)",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'GUEST_CART_TTL', DEFAULT_TTL) // (60 * 60 * 24)
+        batch_size = options['batch_size']
+        carts = Cart.objects.filter(user__isnull=True, updated_at__lt=timezone.now() - timedelta(days=days))
+
+        deleted = sum(count for _, count in delete_in_batches(carts, batch_size=batch_size))
+
+        self.stdout.write(self.style.SUCCESS(f"تم حذف {deleted} سلة ضيف مهجورة"))
@@ -0,0 +1,103 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cart.cleanup import abandoned_cart_stats, delete_in_batches
+from cart.models import Cart
+
+DEFAULT_CHECKPOINT_FILE = settings.BASE_DIR / 'purge_stale_carts.checkpoint.json'
+
+
+def checkpoint_path():
+    return getattr(settings, 'CART_PURGE_CHECKPOINT_FILE', DEFAULT_CHECKPOINT_FILE)
+
+
+def read_checkpoint():
+    try:
+        with open(checkpoint_path()) as checkpoint:
+            data = json.load(checkpoint)
+    except FileNotFoundError:
+        return None
+    return {'cutoff': datetime.fromisoformat(data['cutoff']), 'last_id': data['last_id']}
+
+
+def write_checkpoint(cutoff, last_id):
+    # الكتابة في ملف مؤقت ثم استبداله حتى لا يبقى ملف نصف مكتوب إذا توقف الأمر
+    path = checkpoint_path()
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as checkpoint:
+        json.dump({'cutoff': cutoff.isoformat(), 'last_id': last_id}, checkpoint)
+    os.replace(temporary, path)
+
+
+def clear_checkpoint():
+    try:
+        os.remove(checkpoint_path())
+    except FileNotFoundError:
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "حذف السلال الخاملة على دفعات مع إحصائيات المنتجات في السلال المهجورة. "
+        "يحفظ التقدم في ملف (CART_PURGE_CHECKPOINT_FILE) بعد كل دفعة ويستأنف منه عند إعادة التشغيل"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="عمر السلة بالأيام منذ آخر تعديل")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0, help="ثوانٍ للانتظار بين الدفعات")
+        parser.add_argument('--max-batches', type=int, default=None, help="التوقف بعد عدد من الدفعات")
+        parser.add_argument('--stats', type=int, default=20, help="عدد المنتجات في تقرير السلال المهجورة (0 للتخطي)")
+        parser.add_argument('--dry-run', action='store_true', help="عرض الإحصائيات دون حذف")
+        parser.add_argument('--restart', action='store_true', help="تجاهل نقطة الاستئناف المحفوظة")
+        parser.add_argument(
+            '--start-after', type=int, default=None,
+            help="البدء بعد معرف سلة محدد بدلاً من نقطة الاستئناف المحفوظة (مع حد --days)",
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = None
+        if options['start_after'] is None and not options['restart']:
+            checkpoint = read_checkpoint()
+        if checkpoint:
+            # نفس الحد الزمني للتشغيل الأول حتى لا تتغير مجموعة السلال المستهدفة
+            cutoff, last_id = checkpoint['cutoff'], checkpoint['last_id']
+            self.stdout.write(f"استئناف الحذف بعد السلة #{last_id}")
+        else:
+            cutoff, last_id = timezone.now() - timedelta(days=options['days']), options['start_after'] or 0
+        carts = Cart.objects.filter(updated_at__lt=cutoff)
+
+        if options['stats'] and not checkpoint:
+            self.write_stats(carts, options['stats'])
+        if options['dry_run']:
+            return
+
+        deleted = 0
+        for last_id, count in delete_in_batches(
+            carts, batch_size=options['batch_size'], start_after=last_id,
+            max_batches=options['max_batches'], sleep=options['sleep'],
+        ):
+            deleted += count
+            write_checkpoint(cutoff, last_id)
+
+        if carts.filter(id__gt=last_id).exists():
+            self.stdout.write(self.style.WARNING(
+                f"تم حذف {deleted} سلة حتى السلة #{last_id}؛ شغل الأمر مرة أخرى للمتابعة "
+                f"(أو مع --start-after {last_id})"
+            ))
+        else:
+            clear_checkpoint()
+            self.stdout.write(self.style.SUCCESS(f"تم حذف {deleted} سلة خاملة"))
+
+    def write_stats(self, carts, limit):
+        self.stdout.write("المنتجات الأكثر وجوداً في السلال المهجورة:")
+        for row in abandoned_cart_stats(carts)[:limit]:
+            self.stdout.write(
+                f"  #{row['product_id']} {row['product__name']}: "
+                f"{row['carts']} سلة، {row['units']} قطعة، {row['value']} ريال"
+            )
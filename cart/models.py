@@ -1,38 +1,85 @@
 from django.db import models
+from django.db.models import Prefetch
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 
+from products.models import ProductAttributeValue, ProductImage
+
+
+def cart_totals(items):
+    """
+    عدد القطع والسعر والوزن الإجمالي في مرور واحد على العناصر
+    """
+    totals = {'total_items': 0, 'total_price': Decimal('0.00'), 'total_weight': Decimal('0.00')}
+    for item in items:
+        totals['total_items'] += item.quantity
+        totals['total_price'] += item.total_price
+        if item.product.weight:
+            totals['total_weight'] += item.product.weight * item.quantity
+    return totals
+
+
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        """
+        جلب عناصر السلة مع منتجاتها وتنويعاتها وصورها بعدد ثابت من الاستعلامات
+        """
+        return self.prefetch_related(Prefetch('items', queryset=CartItem.objects.with_related()))
+
+
+class CartItemQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related(
+            'product__category', 'product__brand', 'product__rating_summary', 'variation__product',
+        ).prefetch_related(
+            Prefetch(
+                'product__images',
+                queryset=ProductImage.objects.order_by('-is_primary', 'order', 'created_at'),
+                to_attr='ordered_images',
+            ),
+            Prefetch('variation__attributes', queryset=ProductAttributeValue.objects.select_related('attribute')),
+        ).order_by('added_at', 'id')
+
+
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, blank=True, null=True, verbose_name="المستخدم")
     session_key = models.CharField(max_length=40, blank=True, null=True, verbose_name="مفتاح الجلسة")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "سلة تسوق"
         verbose_name_plural = "سلال التسوق"
+        indexes = [
+            models.Index(fields=['session_key'], name='cart_session_key_idx'),
+            models.Index(fields=['updated_at'], name='cart_updated_at_idx'),
+        ]
 
     def __str__(self):
         if self.user:
             return f"سلة {self.user.username}"
         return f"سلة ضيف {self.session_key}"
 
+    def get_totals(self):
+        """
+        تستخدم العناصر المجلوبة مسبقاً عبر Cart.objects.with_items() إن وجدت
+        """
+        return cart_totals(self.items.all())
+
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.get_totals()['total_items']
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.get_totals()['total_price']
 
     @property
     def total_weight(self):
-        total = Decimal('0.00')
-        for item in self.items.all():
-            if item.product.weight:
-                total += item.product.weight * item.quantity
-        return total
+        return self.get_totals()['total_weight']
 
     def clear(self):
         self.items.all().delete()
@@ -45,6 +92,8 @@ class CartItem(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     class Meta:
         verbose_name = "عنصر سلة تسوق"
         verbose_name_plural = "عناصر سلة التسوق"
@@ -66,8 +115,8 @@ class CartItem(models.Model):
     @property
     def is_available(self):
         if self.variation:
-            return self.variation.stock_quantity >= self.quantity
-        return self.product.stock_quantity >= self.quantity
+            return self.variation.available_stock >= self.quantity
+        return self.product.available_stock >= self.quantity
 
 class SavedForLater(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="المستخدم")
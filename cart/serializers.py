@@ -17,50 +17,49 @@ class CartItemSerializer(serializers.ModelSerializer):
         ]
 
 class CartSerializer(serializers.ModelSerializer):
+    """
+    يفضل تمرير سلة من Cart.objects.with_items() حتى يبقى عدد الاستعلامات ثابتاً
+    """
     items = CartItemSerializer(many=True, read_only=True)
-    total_items = serializers.ReadOnlyField()
-    total_price = serializers.ReadOnlyField()
-    total_weight = serializers.ReadOnlyField()
     
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_items', 'total_price', 'total_weight', 'created_at', 'updated_at']
+        fields = ['id', 'items', 'created_at', 'updated_at']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data.update(instance.get_totals())
+        return data
 
 class AddToCartSerializer(serializers.Serializer):
+    """
+    التحقق من شكل الطلب فقط؛ وجود المنتج والمخزون يتحقق منهما
+    apply_cart_operations لكل العناصر معاً باستعلام واحد
+    """
     product_id = serializers.IntegerField()
     variation_id = serializers.IntegerField(required=False, allow_null=True)
     quantity = serializers.IntegerField(min_value=1, default=1)
-    
-    def validate_product_id(self, value):
-        from products.models import Product
-        try:
-            product = Product.objects.get(id=value, is_active=True)
-            if not product.is_in_stock:
-                raise serializers.ValidationError("هذا المنتج غير متوفر حالياً.")
-            return value
-        except Product.DoesNotExist:
-            raise serializers.ValidationError("المنتج غير موجود.")
-    
+
+class CartOperationSerializer(serializers.Serializer):
+    ACTION_CHOICES = [
+        ('add', 'إضافة'),
+        ('update', 'تعديل الكمية'),
+        ('remove', 'حذف'),
+    ]
+
+    action = serializers.ChoiceField(choices=ACTION_CHOICES)
+    product_id = serializers.IntegerField()
+    variation_id = serializers.IntegerField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+
     def validate(self, data):
-        from products.models import Product, ProductVariation
-        
-        product = Product.objects.get(id=data['product_id'])
-        variation_id = data.get('variation_id')
-        quantity = data['quantity']
-        
-        if variation_id:
-            try:
-                variation = ProductVariation.objects.get(id=variation_id, product=product, is_active=True)
-                if variation.stock_quantity < quantity:
-                    raise serializers.ValidationError(f"الكمية المطلوبة غير متوفرة. المتوفر: {variation.stock_quantity}")
-            except ProductVariation.DoesNotExist:
-                raise serializers.ValidationError("تنويع المنتج غير موجود.")
-        else:
-            if product.stock_quantity < quantity:
-                raise serializers.ValidationError(f"الكمية المطلوبة غير متوفرة. المتوفر: {product.stock_quantity}")
-        
+        if data['action'] != 'remove' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': "الكمية مطلوبة."})
         return data
 
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
 class UpdateCartItemSerializer(serializers.Serializer):
     quantity = serializers.IntegerField(min_value=1)
     
@@ -68,9 +67,9 @@ class UpdateCartItemSerializer(serializers.Serializer):
         cart_item = self.context.get('cart_item')
         if cart_item:
             if cart_item.variation:
-                available_stock = cart_item.variation.stock_quantity
+                available_stock = cart_item.variation.available_stock
             else:
-                available_stock = cart_item.product.stock_quantity
+                available_stock = cart_item.product.available_stock
             
             if value > available_stock:
                 raise serializers.ValidationError(f"الكمية المطلوبة غير متوفرة. المتوفر: {available_stock}")
@@ -0,0 +1,156 @@
+"""
+عمليات السلة
+
+apply_cart_operations تطبق مجموعة من عمليات الإضافة والتعديل والحذف: استعلام IN
+واحد للمنتجات وآخر للتنويعات للتحقق من المخزون، ثم كتابة واحدة. سلال المستخدمين
+تكتب في معاملة واحدة بـ bulk_create و bulk_update، وسلال الضيوف تكتب في الكاش.
+إذا فشل التحقق في أي عملية لا يكتب شيء.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from products.models import Product, ProductVariation
+from .guest import SESSION_KEY, GuestCart
+from .models import Cart, CartItem
+
+
+def get_cart(request, create=True):
+    """
+    سلة المستخدم الحالي، أو سلة الضيف من الكاش
+    """
+    if request.user.is_authenticated:
+        if create:
+            return Cart.objects.get_or_create(user=request.user)[0]
+        return Cart.objects.filter(user=request.user).first()
+    return GuestCart.for_session(request.session, create=create)
+
+
+def available_stock(product, variation):
+    return variation.available_stock if variation else product.available_stock
+
+
+def resolve_quantities(quantities, operations, strict=True):
+    """
+    حساب الكميات النهائية من الكميات الحالية {(المنتج، التنويع): الكمية}
+    تعيد (الكميات الجديدة، قائمة أخطاء بنفس ترتيب العمليات)
+
+    مع strict=False تسقط العناصر غير الصالحة وتخفض الكميات إلى المتوفر بدلاً
+    من رفض العملية، وهو المطلوب عند دمج سلة الضيف.
+    """
+    # الحذف لا يحتاج المنتج: عنصر منتج أو تنويع أوقف بيعه يجب أن يبقى قابلاً للحذف
+    checked = [operation for operation in operations if operation['action'] != 'remove']
+    product_ids = {operation['product_id'] for operation in checked}
+    variation_ids = {operation.get('variation_id') for operation in checked} - {None}
+    products = Product.objects.filter(is_active=True).in_bulk(product_ids)
+    variations = (
+        ProductVariation.objects.filter(is_active=True).in_bulk(variation_ids) if variation_ids else {}
+    )
+
+    quantities = dict(quantities)
+    errors = []
+    for operation in operations:
+        key = (operation['product_id'], operation.get('variation_id'))
+        product = products.get(key[0])
+        variation = variations.get(key[1]) if key[1] else None
+        error = {}
+        if operation['action'] == 'remove':
+            # حذف عنصر غير موجود لا يعد خطأ حتى تبقى المزامنة قابلة للإعادة
+            quantities.pop(key, None)
+        elif product is None:
+            error['product_id'] = ["المنتج غير موجود."]
+        elif key[1] and (variation is None or variation.product_id != product.id):
+            error['variation_id'] = ["تنويع المنتج غير موجود."]
+        elif operation['action'] == 'update' and key not in quantities:
+            # التعديل للعناصر الموجودة فقط؛ الإضافة عبر add
+            error['item'] = ["العنصر غير موجود في السلة."]
+        else:
+            quantity = operation['quantity']
+            if operation['action'] == 'add':
+                quantity += quantities.get(key, 0)
+            stock = available_stock(product, variation)
+            if quantity <= stock:
+                quantities[key] = quantity
+            elif strict:
+                error['quantity'] = [f"الكمية المطلوبة غير متوفرة. المتوفر: {stock}"]
+            elif stock:
+                quantities[key] = stock
+        errors.append(error if strict else {})
+    return quantities, errors
+
+
+def apply_cart_operations(cart, operations, strict=True):
+    """
+    operations: قواميس فيها action و product_id و variation_id و quantity
+    تعيد قائمة أخطاء بنفس ترتيب العمليات إذا فشل التحقق، وإلا None
+    """
+    if isinstance(cart, GuestCart):
+        quantities, errors = resolve_quantities(cart.get_quantities(), operations, strict)
+        if any(errors):
+            return errors
+        cart.set_quantities(quantities)
+        return None
+
+    with transaction.atomic():
+        # قفل صف السلة أولاً: قفل العناصر وحده لا يمنع طلبين متزامنين على سلة فارغة
+        # من إضافة نفس المنتج فيفشل الثاني بقيد (cart, product, variation)
+        Cart.objects.select_for_update().only('pk').get(pk=cart.pk)
+        items = {
+            (item.product_id, item.variation_id): item
+            for item in CartItem.objects.select_for_update().filter(cart=cart)
+        }
+        quantities, errors = resolve_quantities(
+            {key: item.quantity for key, item in items.items()}, operations, strict
+        )
+        if any(errors):
+            return errors
+
+        now = timezone.now()
+        removed = [item.id for key, item in items.items() if key not in quantities]
+        changed = []
+        for key, item in items.items():
+            if key in quantities and quantities[key] != item.quantity:
+                item.quantity = quantities[key]
+                item.updated_at = now
+                changed.append(item)
+        created = [
+            CartItem(cart=cart, product_id=product_id, variation_id=variation_id, quantity=quantity)
+            for (product_id, variation_id), quantity in quantities.items()
+            if (product_id, variation_id) not in items
+        ]
+
+        if removed:
+            CartItem.objects.filter(id__in=removed).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+        if created:
+            CartItem.objects.bulk_create(created)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=now)
+    return None
+
+
+def persist_guest_cart(guest_cart, cart):
+    """
+    نقل عناصر سلة الضيف إلى سلة في قاعدة البيانات بكتابة مجمعة واحدة ثم حذفها من الكاش
+    """
+    operations = [
+        {'action': 'add', 'product_id': product_id, 'variation_id': variation_id, 'quantity': quantity}
+        for (product_id, variation_id), quantity in guest_cart.get_quantities().items()
+    ]
+    if operations:
+        apply_cart_operations(cart, operations, strict=False)
+    guest_cart.clear()
+    return cart
+
+
+def merge_guest_cart(session, user):
+    """
+    دمج سلة الضيف في سلة المستخدم عند تسجيل الدخول؛ تجمع الكميات للعناصر المكررة
+    """
+    guest_cart = GuestCart.for_session(session)
+    if guest_cart is None:
+        return None
+    del session[SESSION_KEY]
+    if not guest_cart.get_quantities():
+        return None
+    cart = Cart.objects.get_or_create(user=user)[0]
+    return persist_guest_cart(guest_cart, cart)
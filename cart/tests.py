@@ -1,3 +1,328 @@
+import os
+import re
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ecommerce_platform.testing import ProductFactoryMixin, QueryPlanTestMixin
+from products.models import (
+    Category, Brand, Product, ProductImage, ProductAttribute, ProductAttributeValue, ProductVariation
+)
+from .cleanup import abandoned_cart_stats, delete_in_batches
+from .models import Cart, CartItem
+from .serializers import CartSerializer
+from .services import apply_cart_operations
+
+
+class CartTestMixin(ProductFactoryMixin):
+    product_sku_prefix = 'CART'
+    product_defaults = {'price': Decimal('10.00'), 'stock_quantity': 20, 'weight': Decimal('0.50')}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="shopper")
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name="ملابس")
+        self.brand = Brand.objects.create(name="ماركة")
+        self.color = ProductAttribute.objects.create(name="اللون", is_variation=True)
+
+    def add_line(self, index, quantity=1, with_variation=False):
+        product = self.create_product(index)
+        ProductImage.objects.create(product=product, image='products/a.jpg', is_primary=True)
+        variation = None
+        if with_variation:
+            variation = ProductVariation.objects.create(
+                product=product, sku=f"CART-{index}-V", price=Decimal('12.00'), stock_quantity=3,
+            )
+            variation.attributes.add(
+                ProductAttributeValue.objects.create(attribute=self.color, value=f"لون {index}")
+            )
+        return CartItem.objects.create(cart=self.cart, product=product, variation=variation, quantity=quantity)
+
+
+class CartTotalsTests(CartTestMixin, TestCase):
+    def test_totals_in_one_pass(self):
+        self.add_line(1, quantity=2)
+        self.add_line(2, quantity=1, with_variation=True)
+        cart = Cart.objects.with_items().get(pk=self.cart.pk)
+        with self.assertNumQueries(0):
+            totals = cart.get_totals()
+        self.assertEqual(totals, {
+            'total_items': 3,
+            'total_price': Decimal('32.00'),
+            'total_weight': Decimal('1.50'),
+        })
+        self.assertEqual(cart.total_price, Decimal('32.00'))
+
+    def test_serializing_large_cart_uses_fixed_queries(self):
+        for index in range(50):
+            self.add_line(index, with_variation=index % 2 == 0)
+        # السلة، العناصر مع منتجاتها وتنويعاتها، الصور، خصائص التنويعات
+        with self.assertNumQueries(4):
+            data = CartSerializer(Cart.objects.with_items().get(pk=self.cart.pk)).data
+        self.assertEqual(len(data['items']), 50)
+        self.assertEqual(data['total_items'], 50)
+        self.assertEqual(data['total_price'], Decimal('550.00'))
+        self.assertEqual(data['items'][0]['product']['primary_image']['is_primary'], True)
+        self.assertEqual(data['items'][0]['variation']['attributes'][0]['attribute_name'], "اللون")
+
+
+class CartQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def test_guest_cart_lookup_uses_index(self):
+        self.assertUsesIndex(Cart.objects.filter(session_key='abc'), 'cart_session_key_idx')
+
+
+class CartAPITests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.first = self.create_product(1)
+        self.second = self.create_product(2, stock_quantity=2)
+
+    def test_add_update_and_remove_item(self):
+        response = self.client.post(reverse('cart:cart-add'), {'product_id': self.first.id, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(reverse('cart:cart-add'), {'product_id': self.first.id, 'quantity': 1})
+        self.assertEqual(response.data['total_items'], 3)
+
+        item_id = response.data['items'][0]['id']
+        url = reverse('cart:cart-item', args=[item_id])
+        response = self.client.patch(url, {'quantity': 5}, format='json')
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_add_rejects_quantity_above_stock(self):
+        response = self.client.post(reverse('cart:cart-add'), {'product_id': self.second.id, 'quantity': 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantity', response.data)
+
+    def test_batch_applies_all_operations(self):
+        CartItem.objects.create(cart=self.cart, product=self.second, quantity=1)
+        third = self.create_product(3)
+        operations = [
+            {'action': 'add', 'product_id': self.first.id, 'quantity': 2},
+            {'action': 'update', 'product_id': self.second.id, 'quantity': 2},
+            {'action': 'add', 'product_id': third.id, 'quantity': 1},
+            {'action': 'remove', 'product_id': third.id},
+            {'action': 'add', 'product_id': self.first.id, 'quantity': 1},
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(CartItem.objects.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.first.id: 3, self.second.id: 2})
+        product_reads = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "products_product"' in query['sql']
+        ]
+        self.assertEqual(len(product_reads), 1)
+
+    def test_batch_is_all_or_nothing(self):
+        operations = [
+            {'action': 'add', 'product_id': self.first.id, 'quantity': 1},
+            {'action': 'add', 'product_id': self.second.id, 'quantity': 5},
+            {'action': 'add', 'product_id': 9999, 'quantity': 1},
+            {'action': 'update', 'product_id': self.first.id},
+        ]
+        response = self.client.post(reverse('cart:cart-batch'), {'operations': operations[:3]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['operations'][0], {})
+        self.assertIn('quantity', response.data['operations'][1])
+        self.assertIn('product_id', response.data['operations'][2])
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.post(reverse('cart:cart-batch'), {'operations': operations[3:]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_does_not_create_missing_item(self):
+        operations = [{'action': 'update', 'product_id': self.first.id, 'quantity': 2}]
+        response = self.client.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('item', response.data['operations'][0])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_batch_rejects_variation_of_other_product(self):
+        variation = ProductVariation.objects.create(product=self.second, sku="V-2", stock_quantity=5)
+        operations = [{'action': 'add', 'product_id': self.first.id, 'variation_id': variation.id, 'quantity': 1}]
+        response = self.client.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        self.assertIn('variation_id', response.data['operations'][0])
+
+    def test_deactivated_items_can_be_removed(self):
+        variation = ProductVariation.objects.create(product=self.second, sku="V-2", stock_quantity=2)
+        item = CartItem.objects.create(cart=self.cart, product=self.first, quantity=1)
+        CartItem.objects.create(cart=self.cart, product=self.second, variation=variation, quantity=1)
+        Product.objects.filter(pk=self.first.pk).update(is_active=False)
+        ProductVariation.objects.filter(pk=variation.pk).update(is_active=False)
+
+        self.assertEqual(self.client.delete(reverse('cart:cart-item', args=[item.id])).status_code, 204)
+        operations = [{'action': 'remove', 'product_id': self.second.id, 'variation_id': variation.id}]
+        response = self.client.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_cart_row_is_locked_before_items(self):
+        # على قواعد البيانات التي تدعم FOR UPDATE يوقف القفل الطلب المتزامن على السلة الفارغة
+        # قبل قراءة عناصرها، فلا يضيف الطلبان نفس المنتج
+        with CaptureQueriesContext(connection) as context:
+            apply_cart_operations(self.cart, [{'action': 'add', 'product_id': self.first.id, 'quantity': 1}])
+        tables = [
+            re.search(r'FROM "(\w+)"', query['sql']).group(1) for query in context.captured_queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertLess(tables.index('cart_cart'), tables.index('cart_cartitem'))
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_saved_for_later(self):
+        response = self.client.post(reverse('cart:saved-for-later'), {'product_id': self.first.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.client.get(reverse('cart:saved-for-later')).data), 1)
+        url = reverse('cart:saved-for-later-item', args=[response.data['id']])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+
+class GuestCartTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.set_password("secret-pass")
+        self.user.save()
+        self.guest = APIClient()
+        self.first = self.create_product(1)
+        self.second = self.create_product(2, stock_quantity=4)
+
+    def test_guest_cart_lives_in_cache(self):
+        self.assertEqual(self.guest.get(reverse('cart:cart-detail')).data['items'], [])
+        operations = [
+            {'action': 'add', 'product_id': self.first.id, 'quantity': 2},
+            {'action': 'add', 'product_id': self.second.id, 'quantity': 1},
+        ]
+        response = self.guest.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 3)
+        self.assertEqual(response.data['total_price'], Decimal('30.00'))
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.guest.post(reverse('cart:cart-add'), {'product_id': self.second.id, 'quantity': 9})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.guest.get(reverse('cart:cart-detail')).data['total_items'], 3)
+
+    def test_login_merges_guest_cart(self):
+        CartItem.objects.create(cart=self.cart, product=self.second, quantity=2)
+        operations = [
+            {'action': 'add', 'product_id': self.first.id, 'quantity': 2},
+            {'action': 'add', 'product_id': self.second.id, 'quantity': 2},
+        ]
+        self.guest.post(reverse('cart:cart-batch'), {'operations': operations}, format='json')
+        # نفاد جزء من المخزون بعد الإضافة يخفض الكمية المدموجة بدلاً من رفضها
+        Product.objects.filter(pk=self.second.pk).update(stock_quantity=3)
+
+        self.assertTrue(self.guest.login(username="shopper", password="secret-pass"))
+
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.first.id: 2, self.second.id: 3})
+        self.assertEqual(self.guest.get(reverse('cart:cart-detail')).data['total_items'], 5)
+
+        # السلة لا تدمج مرة ثانية عند تسجيل دخول لاحق
+        self.guest.logout()
+        self.assertTrue(self.guest.login(username="shopper", password="secret-pass"))
+        self.assertEqual(self.cart.items.get(product=self.first).quantity, 2)
+
+    def test_purge_guest_carts_command(self):
+        stale = Cart.objects.create(session_key="old")
+        CartItem.objects.create(cart=stale, product=self.first)
+        fresh = Cart.objects.create(session_key="new")
+        Cart.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=30))
+        Cart.objects.filter(pk=self.cart.pk).update(updated_at=timezone.now() - timedelta(days=30))
+
+        call_command('purge_guest_carts', batch_size=1, stdout=StringIO())
+
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {self.cart.pk, fresh.pk})
+        self.assertFalse(CartItem.objects.filter(cart_id=stale.pk).exists())
+
+
+class StaleCartPurgeTests(CartTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.checkpoint = os.path.join(directory, 'checkpoint.json')
+        self.enterContext(self.settings(CART_PURGE_CHECKPOINT_FILE=self.checkpoint))
+        self.first = self.create_product(1, price=Decimal('10.00'))
+        self.second = self.create_product(2, price=Decimal('25.00'))
+        self.stale = []
+        for index in range(5):
+            cart = Cart.objects.create(session_key=f"stale-{index}")
+            CartItem.objects.create(cart=cart, product=self.first, quantity=2)
+            if index % 2 == 0:
+                CartItem.objects.create(cart=cart, product=self.second, quantity=1)
+            self.stale.append(cart.pk)
+        Cart.objects.filter(pk__in=self.stale).update(updated_at=timezone.now() - timedelta(days=60))
+
+    def test_abandoned_cart_stats_in_one_query(self):
+        carts = Cart.objects.filter(updated_at__lt=timezone.now() - timedelta(days=30))
+        with self.assertNumQueries(1):
+            rows = list(abandoned_cart_stats(carts))
+        self.assertEqual(rows[0]['product_id'], self.first.id)
+        self.assertEqual((rows[0]['carts'], rows[0]['units'], rows[0]['value']), (5, 10, Decimal('100.00')))
+        self.assertEqual((rows[1]['carts'], rows[1]['units'], rows[1]['value']), (3, 3, Decimal('75.00')))
+
+    def test_each_batch_is_two_deletes(self):
+        carts = Cart.objects.filter(pk__in=self.stale)
+        batches = delete_in_batches(carts, batch_size=2)
+        with CaptureQueriesContext(connection) as context:
+            next(batches)
+        deletes = [query for query in context.captured_queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 2)
+        self.assertEqual(Cart.objects.filter(pk__in=self.stale).count(), 3)
+
+    def test_command_resumes_from_checkpoint(self):
+        output = StringIO()
+        call_command('purge_stale_carts', batch_size=2, max_batches=1, stdout=output)
+        self.assertIn("منتج 1", output.getvalue())
+        self.assertEqual(Cart.objects.filter(pk__in=self.stale).count(), 3)
+
+        # سلة تصبح خاملة بعد التشغيل الأول لا تدخل في نفس الجولة
+        Cart.objects.filter(pk=self.cart.pk).update(updated_at=timezone.now() - timedelta(days=60))
+        call_command('purge_stale_carts', batch_size=2, stdout=StringIO())
+        self.assertFalse(Cart.objects.filter(pk__in=self.stale).exists())
+        self.assertTrue(Cart.objects.filter(pk=self.cart.pk).exists())
+
+        call_command('purge_stale_carts', stats=0, stdout=StringIO())
+        self.assertFalse(Cart.objects.exists())
+
+    def test_checkpoint_survives_cache_clear(self):
+        call_command('purge_stale_carts', batch_size=2, max_batches=1, stats=0, stdout=StringIO())
+        self.assertTrue(os.path.exists(self.checkpoint))
+        # أمر جديد يعمل في عملية أخرى لا ترى الكاش المحلي للعملية السابقة
+        cache.clear()
+        output = StringIO()
+        call_command('purge_stale_carts', batch_size=2, stdout=output)
+        self.assertIn(f"استئناف الحذف بعد السلة #{self.stale[1]}", output.getvalue())
+        self.assertFalse(Cart.objects.filter(pk__in=self.stale).exists())
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_start_after(self):
+        output = StringIO()
+        call_command('purge_stale_carts', batch_size=2, max_batches=1, stats=0, stdout=output)
+        self.assertIn(f"--start-after {self.stale[1]}", output.getvalue())
+        os.remove(self.checkpoint)
+
+        call_command('purge_stale_carts', start_after=self.stale[2], stats=0, stdout=StringIO())
+        self.assertEqual(list(Cart.objects.filter(pk__in=self.stale).values_list('pk', flat=True)), [self.stale[2]])
 
-# Create your tests here.
+    def test_dry_run_keeps_carts(self):
+        call_command('purge_stale_carts', dry_run=True, stdout=StringIO())
+        self.assertEqual(Cart.objects.count(), 6)
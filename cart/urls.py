@@ -1,8 +1,16 @@
 from django.urls import path
+from . import views
 
 app_name = 'cart'
 
 urlpatterns = [
-    # سيتم إضافة URLs لاحقاً
-]
+    # Cart
+    path('', views.cart_detail, name='cart-detail'),
+    path('add/', views.add_to_cart, name='cart-add'),
+    path('items/<int:pk>/', views.cart_item, name='cart-item'),
+    path('batch/', views.cart_batch, name='cart-batch'),
 
+    # Saved for later
+    path('saved/', views.saved_for_later, name='saved-for-later'),
+    path('saved/<int:pk>/', views.saved_for_later_item, name='saved-for-later-item'),
+]
@@ -1,3 +1,136 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from products.models import ProductImage, ProductVariation
+from .models import Cart, CartItem, SavedForLater
+from .serializers import (
+    CartSerializer, AddToCartSerializer, UpdateCartItemSerializer, CartBatchSerializer,
+    SavedForLaterSerializer, SaveForLaterSerializer
+)
+from .services import get_cart, apply_cart_operations
 
-# Create your views here.
+EMPTY_CART = {
+    'id': None, 'items': [], 'created_at': None, 'updated_at': None,
+    'total_items': 0, 'total_price': '0.00', 'total_weight': '0.00',
+}
+
+def cart_response(cart, status_code=status.HTTP_200_OK):
+    if cart.pk is not None:
+        cart = Cart.objects.with_items().get(pk=cart.pk)
+    return Response(CartSerializer(cart).data, status=status_code)
+
+def apply_or_error(cart, operations, status_code=status.HTTP_200_OK, batch=False):
+    errors = apply_cart_operations(cart, operations)
+    if errors:
+        # العمليات المفردة تعيد خطأها مباشرة، والدفعات تعيد قائمة بترتيب العمليات
+        detail = {'operations': errors} if batch else errors[0]
+        return Response(detail, status=status.HTTP_400_BAD_REQUEST)
+    return cart_response(cart, status_code)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([AllowAny])
+def cart_detail(request):
+    """
+    API endpoint لعرض السلة الحالية أو تفريغها
+    """
+    cart = get_cart(request, create=False)
+    if cart is None:
+        if request.method == 'DELETE':
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(EMPTY_CART)
+    if request.method == 'DELETE':
+        cart.clear()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return cart_response(cart)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def add_to_cart(request):
+    """
+    API endpoint لإضافة منتج إلى السلة؛ تزيد الكمية إذا كان المنتج موجوداً
+    """
+    serializer = AddToCartSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart = get_cart(request)
+    return apply_or_error(cart, [{'action': 'add', **serializer.validated_data}], status.HTTP_201_CREATED)
+
+@api_view(['PATCH', 'DELETE'])
+@permission_classes([AllowAny])
+def cart_item(request, pk):
+    """
+    API endpoint لتعديل كمية عنصر في السلة أو حذفه
+    عناصر سلة الضيف ليس لها معرفات، فتعدل عبر add و batch بمعرف المنتج
+    """
+    cart = get_cart(request, create=False)
+    if cart is None or cart.pk is None:
+        raise Http404
+    item = get_object_or_404(CartItem, pk=pk, cart=cart)
+    operation = {'product_id': item.product_id, 'variation_id': item.variation_id}
+    if request.method == 'DELETE':
+        errors = apply_cart_operations(cart, [{'action': 'remove', **operation}])
+        if errors:
+            return Response(errors[0], status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    serializer = UpdateCartItemSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return apply_or_error(cart, [{'action': 'update', **operation, **serializer.validated_data}])
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def cart_batch(request):
+    """
+    API endpoint لتطبيق عدة عمليات إضافة وتعديل وحذف في معاملة واحدة
+    إما أن تنجح كل العمليات أو لا يطبق أي منها
+    """
+    serializer = CartBatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return apply_or_error(get_cart(request), serializer.validated_data['operations'], batch=True)
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def saved_for_later(request):
+    """
+    API endpoint لعرض المنتجات المحفوظة للاحقاً أو حفظ منتج جديد
+    """
+    if request.method == 'GET':
+        saved = SavedForLater.objects.filter(user=request.user).select_related(
+            'product__category', 'product__brand', 'product__rating_summary', 'variation__product'
+        ).prefetch_related(
+            Prefetch(
+                'product__images',
+                queryset=ProductImage.objects.order_by('-is_primary', 'order', 'created_at'),
+                to_attr='ordered_images',
+            ),
+            'variation__attributes__attribute',
+        ).order_by('-saved_at')
+        return Response(SavedForLaterSerializer(saved, many=True).data)
+
+    serializer = SaveForLaterSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    product_id = serializer.validated_data['product_id']
+    variation_id = serializer.validated_data.get('variation_id')
+    if variation_id and not ProductVariation.objects.filter(
+        pk=variation_id, product_id=product_id, is_active=True
+    ).exists():
+        return Response({'variation_id': ["تنويع المنتج غير موجود."]}, status=status.HTTP_400_BAD_REQUEST)
+    saved, created = SavedForLater.objects.get_or_create(
+        user=request.user, product_id=product_id, variation_id=variation_id
+    )
+    return Response(
+        SavedForLaterSerializer(saved).data,
+        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+    )
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def saved_for_later_item(request, pk):
+    """
+    API endpoint لحذف منتج من المحفوظات
+    """
+    get_object_or_404(SavedForLater, pk=pk, user=request.user).delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
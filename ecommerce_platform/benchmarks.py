@@ -0,0 +1,57 @@
+"""
+أدوات مشتركة لأوامر قياس الأداء (benchmark_*)
+"""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def benchmark_database(on_disk=False):
+    """
+    تشغيل القياس على قاعدة بيانات مؤقتة بنفس طريقة قاعدة الاختبارات،
+    حتى لا تتأثر قاعدة البيانات الفعلية بالبيانات المولدة.
+    on_disk: استخدام ملف مؤقت بدلاً من الذاكرة (مطلوب للقياسات متعددة الخيوط على SQLite)
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if on_disk and connection.vendor == 'sqlite':
+        test_settings['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+
+
+def summarize(timings):
+    """
+    ملخص أزمنة بالميلي ثانية: المتوسط والوسيط و p99
+    """
+    timings = sorted(timings)
+    p99_index = min(len(timings) - 1, int(len(timings) * 0.99))
+    return {
+        'count': len(timings),
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[p99_index],
+    }
+
+
+def measure(func, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return summarize(timings)
+
+
+def format_stats(label, stats):
+    return f"{label}: mean={stats['mean']:.2f}ms p50={stats['p50']:.2f}ms p99={stats['p99']:.2f}ms (n={stats['count']})"
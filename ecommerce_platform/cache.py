@@ -0,0 +1,166 @@
+"""
+كاش الاستجابات لنقاط النهاية التي تقرأ الكتالوج فقط
+
+مفتاح الكاش مبني على المسار ومعاملات الاستعلام بعد ترتيبها واللغة ونوع المحتوى
+المطلوب، إضافة إلى رقم إصدار لكل نموذج تعتمد عليه الاستجابة. إشارات
+post_save/post_delete تزيد رقم إصدار النموذج فتصبح كل المفاتيح القديمة غير
+مستخدمة دون الحاجة لحذفها.
+
+يستخدم الكاش المحدد في RESPONSE_CACHE_ALIAS (الافتراضي 'default')، ويمكن
+تبديله إلى Redis من إعدادات CACHES فقط.
+"""
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language_from_request
+
+DEFAULT_TIMEOUT = 300
+STATS_KEYS = {'hits': 'response_cache:stats:hits', 'misses': 'response_cache:stats:misses'}
+
+
+def get_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def version_key(model):
+    return f"model_version:{model._meta.label_lower}"
+
+
+def get_model_versions(models):
+    """
+    أرقام إصدارات النماذج بقراءة واحدة من الكاش
+    """
+    cache = get_cache()
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # قيمة مبنية على الوقت حتى لا تتكرر مع إصدار سابق تم حذفه من الكاش
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_model_version(model):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), time.time_ns(), timeout=None)
+
+
+def _bump_on_commit(sender, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: bump_model_version(sender))
+
+
+def track_model_versions(*models):
+    """
+    ربط إشارات الحفظ والحذف بزيادة رقم إصدار النموذج، وتستدعى من ready()
+    """
+    for model in models:
+        for signal in (post_save, post_delete):
+            signal.connect(
+                _bump_on_commit, sender=model, weak=False,
+                dispatch_uid=f"track_model_version:{model._meta.label_lower}:{signal is post_save}",
+            )
+
+
+def _record(stat):
+    cache = get_cache()
+    key = STATS_KEYS[stat]
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many(STATS_KEYS.values())
+    stats = {stat: values.get(key, 0) for stat, key in STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / total, 4) if total else 0
+    return stats
+
+
+def response_cache_key(request, models):
+    params = sorted(
+        (key, value) for key in request.GET for value in request.GET.getlist(key)
+    )
+    payload = json.dumps({
+        'path': request.path,
+        'params': params,
+        'language': get_language_from_request(request),
+        'accept': request.META.get('HTTP_ACCEPT', ''),
+        'versions': get_model_versions(models),
+    }, sort_keys=True)
+    return f"response:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+
+def _is_private(request, response):
+    # الواجهة المرئية لـ DRF تعرض اسم المستخدم، والكوكيز خاصة بكل جلسة
+    if response.cookies:
+        return True
+    is_html = response.get('Content-Type', '').startswith('text/html')
+    return is_html and getattr(request, 'user', None) is not None and request.user.is_authenticated
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return header.strip() == '*' or etag in [tag.strip() for tag in header.split(',')]
+
+
+def _finalize(request, response, etag, status):
+    response['ETag'] = etag
+    response['X-Cache'] = status
+    patch_vary_headers(response, ('Accept', 'Accept-Language'))
+    return response
+
+
+def cache_response(*models, timeout=None):
+    """
+    تخزين استجابات GET الناجحة مع ETag، وتصبح غير صالحة عند تغير أي من models
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            cache = get_cache()
+            key = response_cache_key(request, models)
+            entry = cache.get(key)
+            if entry is not None:
+                _record('hits')
+                if _etag_matches(request, entry['etag']):
+                    return _finalize(request, HttpResponseNotModified(), entry['etag'], 'HIT')
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                return _finalize(request, response, entry['etag'], 'HIT')
+
+            _record('misses')
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+            if response.status_code != 200 or _is_private(request, response):
+                return response
+            etag = f'"{hashlib.md5(response.content).hexdigest()}"'
+            cache.set(key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': etag,
+            }, timeout if timeout is not None else getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+            if _etag_matches(request, etag):
+                return _finalize(request, HttpResponseNotModified(), etag, 'MISS')
+            return _finalize(request, response, etag, 'MISS')
+        return wrapper
+    return decorator
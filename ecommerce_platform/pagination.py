@@ -0,0 +1,128 @@
+"""
+ترقيم الصفحات بالمؤشر (keyset)
+
+الصفحة التالية تبدأ بعد آخر قيم الترتيب في الصفحة الحالية بدلاً من OFFSET،
+فتكلف الصفحة الألف مثل الأولى ما دام هناك فهرس على أعمدة الترتيب. يضاف id دائماً
+لكسر التعادل، والمؤشر قائمة القيم بصيغة JSON مرمزة بـ base64.
+"""
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPaginationMixin:
+    cursor_query_param = 'cursor'
+    # أعمدة الترتيب المسموح بها؛ id يسمح به دائماً
+    keyset_fields = ()
+    # قيم محسوبة بالـ annotate وليست حقولاً في النموذج: الاسم -> دالة التحويل من المؤشر
+    computed_fields = {}
+
+    def order_keyset(self, queryset):
+        self.ordering = self.get_keyset_ordering(queryset)
+        return queryset.order_by(*self.ordering)
+
+    def keyset_page(self, queryset, request):
+        """
+        صفحة من استعلام مرتب بـ order_keyset بعد المؤشر الحالي إن وجد
+        """
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            values = self.parse_values(queryset.model, self.decode_cursor(cursor))
+            queryset = queryset.filter(self.keyset_filter(values))
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_keyset_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        fields = [field.lstrip('-') for field in ordering]
+        if any(field not in self.keyset_fields for field in fields if field not in ('id', 'pk')):
+            raise NotFound("الترتيب المطلوب غير مدعوم في وضع المؤشر.")
+        if 'id' in fields or 'pk' in fields:
+            return ordering
+        descending = ordering[-1].startswith('-') if ordering else False
+        return ordering + ['-id' if descending else 'id']
+
+    def parse_values(self, model, values):
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound("مؤشر غير صالح.")
+        parsed = []
+        for field, value in zip(self.ordering, values):
+            try:
+                name = self.field_name(field)
+                if name in self.computed_fields:
+                    parsed.append(self.computed_fields[name](value))
+                else:
+                    parsed.append(model._meta.get_field(name).to_python(value))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound("مؤشر غير صالح.")
+        return parsed
+
+    def keyset_filter(self, values):
+        """
+        (f1 > v1) أو (f1 = v1 و f2 > v2) أو ... مع عكس المقارنة للترتيب التنازلي
+        """
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {self.field_name(previous): values[i] for i, previous in enumerate(self.ordering[:index])}
+            conditions.append(Q(**equal, **{f'{self.field_name(field)}__{lookup}': values[index]}))
+        # شرط مكرر على العمود الأول يسمح لقاعدة البيانات بالقفز في الفهرس إلى موضع المؤشر
+        first = self.ordering[0]
+        bound = Q(**{f"{self.field_name(first)}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return bound & reduce(or_, conditions)
+
+    @staticmethod
+    def field_name(field):
+        name = field.lstrip('-')
+        return 'id' if name == 'pk' else name
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, self.field_name(field)) for field in self.ordering]
+        payload = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound("مؤشر غير صالح.")
+
+    def get_keyset_next_link(self, url=None):
+        if not self.has_next:
+            return None
+        url = url or self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+
+class KeysetPagination(KeysetPaginationMixin, PageNumberPagination):
+    """
+    ترقيم بالمؤشر فقط، دون عدد إجمالي؛ للقوائم الطويلة التي تتصفح للأمام
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        return self.keyset_page(self.order_keyset(queryset), request)
+
+    def get_next_link(self):
+        return self.get_keyset_next_link()
+
+    def get_previous_link(self):
+        return None
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
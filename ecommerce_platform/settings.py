@@ -94,6 +94,54 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# يمكن استبدال الكاش المحلي بـ Redis دون تعديل الكود:
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ecommerce-default',
+    }
+}
+
+# كاش استجابات الكتالوج (ecommerce_platform.cache)
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = 300
+
+# سلال الضيوف تحفظ في الكاش ولا تكتب في قاعدة البيانات إلا عند تسجيل الدخول أو إتمام الطلب
+GUEST_CART_CACHE_ALIAS = 'default'
+GUEST_CART_TTL = 60 * 60 * 24 * 7
+# ملف نقطة استئناف أمر purge_stale_carts؛ يبقى بين مرات التشغيل بخلاف الكاش المحلي لكل عملية
+CART_PURGE_CHECKPOINT_FILE = BASE_DIR / 'purge_stale_carts.checkpoint.json'
+
+# مدة حجز المخزون أثناء إتمام الطلب قبل إعادته (products.inventory)
+STOCK_RESERVATION_TTL = 15 * 60
+# مدة كاش مجموع أجزاء المخزون المعروض للمنتجات المقسمة (ثوانٍ)
+STOCK_SHARD_CACHE_TIMEOUT = 5
+
+# مولد أرقام الطلبات (orders.numbering)؛ رقم العامل (0-1023) يجب أن يكون فريداً لكل عملية
+# عند تشغيل عدة خوادم. بدونه يستخدم معرف العملية ويعاد الحفظ برقم جديد عند التصادم
+ORDER_NUMBER_GENERATOR = 'orders.numbering.SnowflakeGenerator'
+ORDER_NUMBER_WORKER_ID = None
+
+# مدة حفظ الكوبونات في الكاش حسب الكود (orders.coupons)؛ تحذف عند حفظ الكوبون
+COUPON_CACHE_TIMEOUT = 60
+
+# بوابة الدفع (payments.gateway)؛ المهلة تشمل كل إعادات المحاولة، ومهلة المحاولة لكل طلب منفرد (ثوانٍ)
+PAYMENT_GATEWAY_CLIENT = 'payments.gateway.GatewayClient'
+PAYMENT_GATEWAY_URL = 'http://127.0.0.1:8700'
+PAYMENT_GATEWAY_API_KEY = ''
+PAYMENT_GATEWAY_POOL_SIZE = 20
+PAYMENT_GATEWAY_TIMEOUT = 10
+PAYMENT_GATEWAY_ATTEMPT_TIMEOUT = 3
+PAYMENT_GATEWAY_MAX_RETRIES = 3
+
+# مدة جدول طرق الدفع في ذاكرة كل عملية (payments.methods)؛ يعاد بناؤه فوراً في العملية التي تحفظ طريقة دفع
+PAYMENT_METHOD_TABLE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
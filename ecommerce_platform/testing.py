@@ -0,0 +1,62 @@
+"""
+أدوات الاختبار المشتركة بين التطبيقات
+
+QueryPlanTestMixin يشغل EXPLAIN على الاستعلامات المتكررة ويفشل إذا لجأت قاعدة
+البيانات إلى قراءة جدول كامل بدلاً من فهرس، و ProductFactoryMixin ينشئ منتجات
+الاختبار بقيم افتراضية يحددها كل تطبيق.
+"""
+import re
+from decimal import Decimal
+
+from django.db import connections, transaction
+
+from products.models import Product
+
+# SQLite: "SCAN products_product" دون USING INDEX، ولا يحسب "SCAN CONSTANT ROW"
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?!CONSTANT ROW)(\S+)(?: AS \S+)?$')
+POSTGRESQL_FULL_SCAN = re.compile(r'\bSeq Scan on (\S+)')
+
+
+def explain(queryset):
+    """
+    خطة تنفيذ الاستعلام مع الجداول التي تقرأ كاملة
+    """
+    connection = connections[queryset.db]
+    with transaction.atomic(using=queryset.db):
+        if connection.vendor == 'postgresql':
+            # الجداول الصغيرة في الاختبارات تجعل المسح المتسلسل أرخص دائماً
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+    pattern = POSTGRESQL_FULL_SCAN if connection.vendor == 'postgresql' else SQLITE_FULL_SCAN
+    scans = [match.group(1) for line in plan.splitlines() if (match := pattern.search(line.strip()))]
+    return plan, scans
+
+
+class QueryPlanTestMixin:
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan, scans = explain(queryset)
+        self.assertFalse(scans, f"مسح كامل للجدول {', '.join(scans)}:\n{plan}")
+        if index_name:
+            self.assertIn(index_name, plan)
+        return plan
+
+
+class ProductFactoryMixin:
+    """
+    ينشئ منتجاً برقم تسلسلي، ويتوقع self.category و self.brand (اختياري) من setUp
+    """
+    product_sku_prefix = 'SKU'
+    product_defaults = {'price': Decimal('100.00'), 'stock_quantity': 5}
+
+    def create_product(self, index, **kwargs):
+        defaults = {
+            'name': f"منتج {index}",
+            'description': "وصف",
+            'sku': f"{self.product_sku_prefix}-{index}",
+            'category': self.category,
+            'brand': getattr(self, 'brand', None),
+            **self.product_defaults,
+        }
+        defaults.update(kwargs)
+        return Product.objects.create(**defaults)
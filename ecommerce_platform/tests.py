@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from products.models import Brand, Category, Product
+from .cache import get_stats
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="أجهزة")
+        self.product = Product.objects.create(
+            name="جهاز", description="وصف", sku="DEV-1", category=self.category, price=Decimal('10.00'),
+        )
+        self.url = reverse('products:product-detail', args=[self.product.id])
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('Accept-Language', second['Vary'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_key_includes_query_params_and_language(self):
+        url = reverse('products:brand-list')
+        self.client.get(url, {'page': 1})
+        self.assertEqual(self.client.get(url, {'page': 1})['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')['X-Cache'], 'MISS')
+
+    def test_model_change_invalidates(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "جهاز جديد"
+            self.product.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], "جهاز جديد")
+
+    def test_unrelated_model_change_keeps_cache(self):
+        url = reverse('products:category-list')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Brand.objects.create(name="علامة")
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+    def test_home_page_and_stats(self):
+        self.assertEqual(self.client.get(reverse('home'))['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('home'))['X-Cache'], 'HIT')
+        self.assertEqual(get_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+        self.assertEqual(self.client.get(reverse('cache-stats')).status_code, 403)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_authenticate(admin)
+        self.assertEqual(self.client.get(reverse('cache-stats')).data['hits'], 1)
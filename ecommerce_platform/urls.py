@@ -33,6 +33,7 @@ urlpatterns = [
     path('api/accounts/', include('accounts.urls')),
     path('api/reviews/', include('reviews.urls')),
     path('api/payments/', include('payments.urls')),
+    path('api/cache-stats/', views.cache_stats, name='cache-stats'),
     
     # Django REST Framework browsable API
     path('api-auth/', include('rest_framework.urls')),
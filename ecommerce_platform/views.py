@@ -1,6 +1,11 @@
 from django.shortcuts import render
-from products.models import Product, Category
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from products.models import Product, Category, Brand
+from .cache import cache_response, get_stats
 
+@cache_response(Product, Category, Brand)
 def home(request):
     """
     عرض الصفحة الرئيسية
@@ -24,3 +29,10 @@ def home(request):
     
     return render(request, 'home.html', context)
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    إحصائيات كاش الاستجابات (عدد مرات الإصابة والإخفاق)
+    """
+    return Response(get_stats())
@@ -0,0 +1,104 @@
+"""
+خدمة كوبونات الخصم
+
+الكوبونات تحفظ في الكاش حسب الكود لمدة قصيرة (COUPON_CACHE_TIMEOUT) وتحذف منه
+عند حفظ الكوبون أو حذفه. النسخة المحفوظة تكفي لعرض الخصم والتحقق المبدئي، أما
+الاستخدام الفعلي فيمر دائماً بتحديث شرطي واحد في قاعدة البيانات:
+
+    UPDATE ... SET used_count = used_count + 1
+    WHERE id = ? AND (usage_limit IS NULL OR used_count < usage_limit)
+
+فلا يتجاوز عدد مرات الاستخدام usage_limit مهما تزامنت الطلبات، حتى لو كان
+used_count في الكاش قديماً.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Coupon
+
+DEFAULT_TIMEOUT = 60
+# يحفظ في الكاش للأكواد غير الموجودة حتى لا يضرب تخمين الأكواد قاعدة البيانات
+MISSING = 'missing'
+
+
+class CouponError(Exception):
+    pass
+
+
+def cache_key(code):
+    return f"coupon:{hashlib.md5(code.encode()).hexdigest()}"
+
+
+def get_coupon(code):
+    """
+    الكوبون النشط بالكود من الكاش، أو None
+    """
+    key = cache_key(code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code=code, is_active=True).first() or MISSING
+        cache.set(key, coupon, getattr(settings, 'COUPON_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return None if coupon == MISSING else coupon
+
+
+def invalidate_coupon(code):
+    cache.delete(cache_key(code))
+
+
+def check_coupon(coupon, subtotal, now=None):
+    """
+    خصم الكوبون على المجموع؛ ترفع CouponError برسالة للعميل إذا لم يكن صالحاً
+    """
+    now = now or timezone.now()
+    if coupon is None or not coupon.is_active or not coupon.valid_from <= now <= coupon.valid_until:
+        raise CouponError("كوبون الخصم غير صالح.")
+    if coupon.usage_limit is not None and coupon.used_count >= coupon.usage_limit:
+        raise CouponError("تم استنفاد عدد مرات استخدام الكوبون.")
+    if subtotal < coupon.minimum_amount:
+        raise CouponError(f"الحد الأدنى للطلب لاستخدام الكوبون: {coupon.minimum_amount}")
+    return min(coupon.calculate_discount(subtotal), subtotal).quantize(Decimal('0.01'))
+
+
+def redeem_coupon(coupon):
+    """
+    زيادة عداد الاستخدام إذا بقي رصيد؛ تعيد False إذا استنفد الكوبون
+    """
+    return Coupon.objects.filter(
+        Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')), pk=coupon.pk, is_active=True,
+    ).update(used_count=F('used_count') + 1) == 1
+
+
+def apply_coupon(code, subtotal):
+    """
+    التحقق من الكوبون واستخدامه؛ تستدعى داخل معاملة إتمام الطلب حتى يلغى الاستخدام إذا فشل الطلب
+    """
+    coupon = get_coupon(code)
+    discount = check_coupon(coupon, subtotal)
+    if not redeem_coupon(coupon):
+        invalidate_coupon(code)
+        raise CouponError("تم استنفاد عدد مرات استخدام الكوبون.")
+    return discount
+
+
+def validate_codes(codes, subtotal):
+    """
+    التحقق من عدة أكواد على نفس المجموع باستعلام واحد
+    تعيد {الكود: {'valid', 'discount', 'error'}} بترتيب الأكواد
+    """
+    coupons = {
+        coupon.code: coupon for coupon in Coupon.objects.filter(code__in=set(codes), is_active=True)
+    }
+    now = timezone.now()
+    results = {}
+    for code in codes:
+        try:
+            discount = check_coupon(coupons.get(code), subtotal, now)
+            results[code] = {'valid': True, 'discount': discount, 'error': None}
+        except CouponError as exc:
+            results[code] = {'valid': False, 'discount': Decimal('0.00'), 'error': str(exc)}
+    return results
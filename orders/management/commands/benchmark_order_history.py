@@ -0,0 +1,77 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, measure
+from orders.models import Order, OrderItem
+from orders.numbering import get_order_number_generator
+from products.models import Category, Product
+
+from .benchmark_order_numbers import ORDER_FIELDS
+
+
+class Command(BaseCommand):
+    help = "قياس زمن صفحات سجل طلبات عميل لديه آلاف الطلبات، وتفاصيل طلب واحد"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--items', type=int, default=3, help="متوسط عدد عناصر الطلب")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = self.populate(options['orders'], options['items'])
+            self.run(user, options['repeat'])
+
+    def populate(self, order_count, items_per_order):
+        self.stdout.write(f"إنشاء {order_count} طلب لعميل واحد...")
+        generator = get_order_number_generator()
+        now = timezone.now()
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench")
+            category = Category.objects.create(name="قياس")
+            products = Product.objects.bulk_create([
+                Product(name=f"منتج {i}", description="", sku=f"BENCH-{i}", category=category, price=10)
+                for i in range(50)
+            ])
+            orders = Order.objects.bulk_create([
+                Order(order_number=generator.next(), user=user, **ORDER_FIELDS)
+                for _ in range(order_count)
+            ], batch_size=500)
+            # created_at يضبط تلقائياً عند الإنشاء؛ توزيعه على سنوات يقترب من سجل حقيقي
+            for index, order in enumerate(orders):
+                order.created_at = now - timedelta(hours=order_count - index)
+            Order.objects.bulk_update(orders, ['created_at'], batch_size=500)
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order, product=product, quantity=1, unit_price=10, total_price=10,
+                    product_name=product.name, product_sku=product.sku,
+                )
+                for order in orders
+                for product in random.sample(products, random.randint(1, items_per_order * 2 - 1))
+            ], batch_size=2000)
+        return user
+
+    def run(self, user, repeat):
+        client = APIClient()
+        client.force_authenticate(user)
+        first = client.get('/api/orders/')
+        next_url = first.data['next']
+        pages = 1
+        while pages < 50 and next_url:
+            last = client.get(next_url)
+            next_url = last.data['next'] or next_url
+            pages += 1
+        order_number = first.data['results'][0]['order_number']
+
+        for label, url in (
+            ("الصفحة الأولى", '/api/orders/'),
+            (f"الصفحة {pages} (مؤشر)", next_url),
+            ("تفاصيل طلب", f'/api/orders/{order_number}/'),
+        ):
+            self.stdout.write(format_stats(label, measure(lambda: client.get(url), repeat)))
@@ -0,0 +1,93 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Count
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, summarize
+from orders import numbering
+from orders.models import Order
+
+ORDER_FIELDS = {
+    'email': "bench@example.com", 'phone': "0500000000",
+    'billing_first_name': "أ", 'billing_last_name': "ب", 'billing_address_line_1': "شارع",
+    'billing_city': "مدينة", 'billing_state': "منطقة", 'billing_postal_code': "00000", 'billing_country': "دولة",
+    'shipping_first_name': "أ", 'shipping_last_name': "ب", 'shipping_address_line_1': "شارع",
+    'shipping_city': "مدينة", 'shipping_state': "منطقة", 'shipping_postal_code': "00000", 'shipping_country': "دولة",
+    'subtotal': 10, 'total_amount': 10,
+}
+
+
+def create_orders(generator_class, attributes, count):
+    """
+    تعمل في عملية فرعية: إنشاء count طلب وإرجاع (الأزمنة، الأرقام المولدة، الإخفاقات، الأرقام مرتبة؟)
+    """
+    numbering._generator = generator_class()
+    for name, value in attributes.items():
+        setattr(numbering._generator, name, value)
+    timings, failures, numbers = [], 0, []
+    try:
+        while len(timings) + failures < count:
+            start = time.perf_counter()
+            try:
+                order = Order.objects.create(**ORDER_FIELDS)
+            except OperationalError:
+                # SQLite: "database is locked" بين العمليات
+                continue
+            except IntegrityError:
+                failures += 1
+                continue
+            timings.append((time.perf_counter() - start) * 1000)
+            numbers.append(order.order_number)
+    finally:
+        connection.close()
+    return timings, numbering._generator.issued, failures, numbers == sorted(numbers)
+
+
+class Command(BaseCommand):
+    help = "قياس إنشاء الطلبات من عدة عمليات متزامنة بمولد أرقام Snowflake مقارنة بالأرقام العشوائية القديمة"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--orders', type=int, default=2000, help="عدد الطلبات لكل عملية")
+        parser.add_argument(
+            '--legacy-digits', type=int, default=8,
+            help="عدد خانات الصيغة القديمة؛ تقليله يظهر أثر التصادمات بعدد طلبات أقل",
+        )
+
+    def handle(self, *args, **options):
+        generators = [
+            ("Snowflake", numbering.SnowflakeGenerator, {}),
+            (f"عشوائي {options['legacy_digits']} خانات", numbering.RandomGenerator, {'digits': options['legacy_digits']}),
+        ]
+        with benchmark_database(on_disk=True):
+            for label, generator_class, attributes in generators:
+                Order.objects.all().delete()
+                self.run(label, generator_class, attributes, options)
+
+    def run(self, label, generator_class, attributes, options):
+        connection.close()
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(options['processes']) as pool:
+            results = pool.starmap(create_orders, [(generator_class, attributes, options['orders'])] * options['processes'])
+        elapsed = time.perf_counter() - started
+
+        timings = [timing for result in results for timing in result[0]]
+        issued = sum(result[1] for result in results)
+        failures = sum(result[2] for result in results)
+        ordered = all(result[3] for result in results)
+        created = Order.objects.count()
+        duplicates = Order.objects.values('order_number').annotate(n=Count('id')).filter(n__gt=1).count()
+
+        self.stdout.write(f"{label}:")
+        self.stdout.write(
+            f"  {created} طلب من {options['processes']} عمليات في {elapsed:.2f}s ({created / elapsed:.0f} طلب/ث)، "
+            f"إعادة محاولات {issued - created - failures}، إخفاقات {failures}، "
+            f"متزايدة داخل كل عملية: {'نعم' if ordered else 'لا'}"
+        )
+        if timings:
+            self.stdout.write("  " + format_stats("زمن الإنشاء", summarize(timings)))
+        if duplicates:
+            self.stdout.write(self.style.ERROR(f"  {duplicates} رقم طلب مكرر!"))
@@ -1,9 +1,36 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 from decimal import Decimal
 import uuid
 
+from payments.models import Payment
+from .numbering import get_order_number_generator
+
+LIST_FIELDS = ('order_number', 'status', 'payment_status', 'total_amount', 'created_at')
+
+class OrderQuerySet(models.QuerySet):
+    def for_list(self, *fields):
+        """
+        أعمدة القائمة فقط بدلاً من أعمدة العناوين العريضة، مع عدد القطع محسوباً في SQL
+        """
+        items_quantity = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order').annotate(
+            total=Sum('quantity')
+        ).values('total')
+        return self.only(*LIST_FIELDS, *fields).annotate(
+            items_quantity=Coalesce(Subquery(items_quantity), 0)
+        )
+
+    def with_details(self):
+        return self.prefetch_related(
+            Prefetch('items', queryset=OrderItem.objects.order_by('id')),
+            'status_history',
+            Prefetch('payments', queryset=Payment.objects.select_related('payment_method')),
+        )
+
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'في الانتظار'),
@@ -70,23 +97,42 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = OrderQuerySet.as_manager()
+
     class Meta:
         verbose_name = "طلب"
         verbose_name_plural = "الطلبات"
         ordering = ['-created_at']
+        indexes = [
+            # id يكسر التعادل في ترقيم سجل الطلبات بالمؤشر
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"طلب #{self.order_number}"
 
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            self.order_number = self.generate_order_number()
-        super().save(*args, **kwargs)
+        if self.order_number:
+            return super().save(*args, **kwargs)
+        generator = get_order_number_generator()
+        if not generator.retry_on_collision:
+            self.order_number = generator.next()
+            return super().save(*args, **kwargs)
+        for attempt in range(generator.max_attempts):
+            self.order_number = generator.next()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                # إعادة المحاولة فقط إذا كان السبب تكرار رقم الطلب
+                last_attempt = attempt == generator.max_attempts - 1
+                if last_attempt or not Order.objects.filter(order_number=self.order_number).exists():
+                    self.order_number = ''
+                    raise
 
     def generate_order_number(self):
-        import random
-        import string
-        return ''.join(random.choices(string.digits, k=8))
+        return get_order_number_generator().next()
 
     @property
     def billing_full_name(self):
@@ -98,7 +144,14 @@ class Order(models.Model):
 
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        """
+        من Order.objects.for_list() أو العناصر المجلوبة مسبقاً إن وجدت، وإلا باستعلام تجميع
+        """
+        if hasattr(self, 'items_quantity'):
+            return self.items_quantity
+        if 'items' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(item.quantity for item in self.items.all())
+        return self.items.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items', verbose_name="الطلب")
@@ -132,6 +185,9 @@ class OrderStatusHistory(models.Model):
         verbose_name = "تاريخ حالة الطلب"
         verbose_name_plural = "تاريخ حالات الطلبات"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['order', '-created_at'], name='order_history_order_idx'),
+        ]
 
     def __str__(self):
         return f"طلب #{self.order.order_number} - {self.get_status_display()}"
@@ -0,0 +1,120 @@
+"""
+توليد أرقام الطلبات
+
+المولد يحدد بالإعداد ORDER_NUMBER_GENERATOR (مسار الصنف). الافتراضي
+SnowflakeGenerator: رقم من 19 خانة يتكون من الزمن بالميلي ثانية منذ EPOCH ثم
+رقم العامل ثم تسلسل داخل نفس الميلي ثانية:
+
+    | 41 بت: الزمن | 10 بت: العامل | 12 بت: التسلسل |
+
+فلا يحتاج أي استعلام لكل رقم، ولا يتكرر ما دام رقم العامل فريداً بين العمليات
+العاملة في نفس اللحظة، والأرقام تزيد مع الزمن فتضاف الصفوف في نهاية فهرس
+order_number بدلاً من توزيعها عشوائياً على صفحاته.
+
+التفرد مضمون فقط مع ORDER_NUMBER_WORKER_ID فريد لكل عملية. بدونه يستخدم معرف
+العملية mod 1024، وقد يتساوى لعمليتين (أو لعمليتين على خادمين مختلفين)، فيبقى
+الحفظ في هذه الحالة يعيد المحاولة برقم جديد إذا اصطدم بقيد التفرد.
+
+RandomGenerator يبقي الصيغة القديمة (8 أرقام عشوائية) ويعيد المحاولة برقم جديد
+إذا اصطدم الرقم بقيد التفرد.
+"""
+import os
+import random
+import string
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_GENERATOR = 'orders.numbering.SnowflakeGenerator'
+
+_generator = None
+
+
+class RandomGenerator:
+    """
+    الصيغة القديمة: أرقام عشوائية يحميها قيد التفرد
+    """
+    digits = 8
+    retry_on_collision = True
+    max_attempts = 5
+
+    def __init__(self):
+        self.issued = 0
+
+    def next(self):
+        self.issued += 1
+        return ''.join(random.choices(string.digits, k=self.digits))
+
+
+class SnowflakeGenerator:
+    EPOCH = 1704067200000  # 2024-01-01 UTC بالميلي ثانية
+    WORKER_BITS = 10
+    SEQUENCE_BITS = 12
+    width = 19
+    max_attempts = 5
+
+    def __init__(self, worker_id=None):
+        self.configured_worker_id = worker_id
+        self.lock = threading.Lock()
+        self.issued = 0
+        self.reset()
+
+    def reset(self):
+        # بعد fork (gunicorn --preload مثلاً) تحتاج العملية الجديدة رقم عامل وتسلسلاً خاصين بها
+        self.pid = os.getpid()
+        worker_id = self.configured_worker_id
+        if worker_id is None:
+            worker_id = getattr(settings, 'ORDER_NUMBER_WORKER_ID', None)
+        # رقم العامل المأخوذ من معرف العملية غير مضمون التفرد
+        self.retry_on_collision = worker_id is None
+        if worker_id is None:
+            worker_id = self.pid
+        self.worker_id = worker_id % (1 << self.WORKER_BITS)
+        self.last_timestamp = -1
+        self.sequence = 0
+
+    def now(self):
+        return int(time.time() * 1000) - self.EPOCH
+
+    def next(self):
+        with self.lock:
+            if os.getpid() != self.pid:
+                self.reset()
+            timestamp = self.now()
+            if timestamp < self.last_timestamp:
+                # رجوع ساعة النظام: نبقى على آخر زمن مستخدم حتى لا تتكرر الأرقام
+                timestamp = self.last_timestamp
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & ((1 << self.SEQUENCE_BITS) - 1)
+                if self.sequence == 0:
+                    while timestamp <= self.last_timestamp:
+                        timestamp = max(self.now(), timestamp)
+                        if timestamp <= self.last_timestamp:
+                            time.sleep(0.0001)
+            else:
+                self.sequence = 0
+            self.last_timestamp = timestamp
+            self.issued += 1
+            value = (
+                (timestamp << (self.WORKER_BITS + self.SEQUENCE_BITS))
+                | (self.worker_id << self.SEQUENCE_BITS)
+                | self.sequence
+            )
+        return str(value).zfill(self.width)
+
+
+def get_order_number_generator():
+    global _generator
+    if _generator is None:
+        _generator = import_string(getattr(settings, 'ORDER_NUMBER_GENERATOR', DEFAULT_GENERATOR))()
+    return _generator
+
+
+def reset_order_number_generator():
+    """
+    تستخدم في الاختبارات بعد تغيير الإعدادات
+    """
+    global _generator
+    _generator = None
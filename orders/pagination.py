@@ -0,0 +1,10 @@
+from ecommerce_platform.pagination import KeysetPagination
+
+
+class OrderPagination(KeysetPagination):
+    """
+    سجل الطلبات من الأحدث بالمؤشر على (created_at, id)؛ يستخدم فهرسي
+    order_user_created_idx و order_status_created_idx
+    """
+    page_size = 20
+    keyset_fields = ('created_at',)
@@ -0,0 +1,83 @@
+from rest_framework import serializers
+from payments.models import Payment
+from .models import Order, OrderItem, OrderStatusHistory
+
+SHIPPING_FIELDS = [
+    'shipping_first_name', 'shipping_last_name', 'shipping_company', 'shipping_address_line_1',
+    'shipping_address_line_2', 'shipping_city', 'shipping_state', 'shipping_postal_code', 'shipping_country',
+]
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = [
+            'id', 'product', 'variation', 'product_name', 'product_sku',
+            'quantity', 'unit_price', 'total_price'
+        ]
+
+class OrderStatusHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderStatusHistory
+        fields = ['status', 'notes', 'created_at']
+
+class OrderPaymentSerializer(serializers.ModelSerializer):
+    payment_method = serializers.CharField(source='payment_method.name', read_only=True)
+
+    class Meta:
+        model = Payment
+        fields = ['id', 'payment_method', 'amount', 'processing_fee', 'status', 'processed_at', 'created_at']
+
+class OrderListSerializer(serializers.ModelSerializer):
+    """
+    لقائمة من Order.objects.for_list(): أعمدة محدودة وعدد القطع محسوب مسبقاً
+    """
+    total_items = serializers.IntegerField(source='items_quantity', read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'order_number', 'status', 'payment_status', 'total_amount', 'total_items', 'created_at']
+
+class AdminOrderListSerializer(OrderListSerializer):
+    class Meta(OrderListSerializer.Meta):
+        fields = OrderListSerializer.Meta.fields + ['user', 'email', 'billing_first_name', 'billing_last_name']
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    total_items = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Order
+        exclude = ['user']
+
+class OrderDetailSerializer(OrderSerializer):
+    """
+    يفضل تمرير طلب من Order.objects.with_details() حتى يبقى عدد الاستعلامات ثابتاً
+    """
+    status_history = OrderStatusHistorySerializer(many=True, read_only=True)
+    payments = OrderPaymentSerializer(many=True, read_only=True)
+
+class CheckoutSerializer(serializers.ModelSerializer):
+    """
+    بيانات إتمام الطلب؛ عنوان الشحن اختياري ويؤخذ من عنوان الفاتورة إذا لم يرسل
+    """
+    coupon_code = serializers.CharField(required=False, allow_blank=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            'email', 'phone', 'notes', 'coupon_code',
+            'billing_first_name', 'billing_last_name', 'billing_company', 'billing_address_line_1',
+            'billing_address_line_2', 'billing_city', 'billing_state', 'billing_postal_code', 'billing_country',
+        ] + SHIPPING_FIELDS
+        extra_kwargs = {field: {'required': False} for field in SHIPPING_FIELDS}
+
+    def validate(self, data):
+        if not any(data.get(field) for field in SHIPPING_FIELDS):
+            for field in SHIPPING_FIELDS:
+                data[field] = data.get(field.replace('shipping_', 'billing_'), '')
+        return data
+
+class CouponValidationSerializer(serializers.Serializer):
+    codes = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=20
+    )
@@ -0,0 +1,137 @@
+"""
+إتمام الطلب: تحويل السلة إلى طلب
+
+checkout تعمل بعدد ثابت من الاستعلامات مهما كان عدد الأسطر: قراءة الأسطر ثم
+المنتجات والتنويعات باستعلامات IN، وخصم المخزون بجملة لكل جدول (reserve_stock)،
+وإنشاء عناصر الطلب بـ bulk_create. كل ذلك في معاملة واحدة، فإذا نفد مخزون سطر
+أو استنفد الكوبون لا يبقى طلب ولا خصم ولا استخدام للكوبون. reserve_stock تزيد
+أرقام إصدارات المنتجات والتنويعات بعد نجاح المعاملة، فتعرض صفحات الكتالوج المخزنة
+في الكاش المخزون بعد الطلب.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from cart.guest import GuestCart
+from cart.models import CartItem
+from products.inventory import InsufficientStock, commit_reservations, reserve_stock
+from products.models import Product, ProductVariation
+from .coupons import CouponError, apply_coupon
+from .models import Order, OrderItem, OrderStatusHistory
+
+ORDER_FIELDS = (
+    'email', 'phone', 'notes',
+    'billing_first_name', 'billing_last_name', 'billing_company', 'billing_address_line_1',
+    'billing_address_line_2', 'billing_city', 'billing_state', 'billing_postal_code', 'billing_country',
+    'shipping_first_name', 'shipping_last_name', 'shipping_company', 'shipping_address_line_1',
+    'shipping_address_line_2', 'shipping_city', 'shipping_state', 'shipping_postal_code', 'shipping_country',
+)
+
+
+class CheckoutError(Exception):
+    """
+    detail بنفس شكل أخطاء DRF: {الحقل: [الرسائل]}
+    """
+
+    def __init__(self, detail):
+        self.detail = detail
+        super().__init__(detail)
+
+
+def cart_lines(cart, lock=False):
+    """
+    أسطر السلة (المنتج، التنويع، الكمية)؛ مع lock تقفل أسطر سلة المستخدم حتى نهاية المعاملة
+    """
+    if isinstance(cart, GuestCart):
+        return [
+            (product_id, variation_id, quantity)
+            for (product_id, variation_id), quantity in cart.get_quantities().items()
+        ]
+    items = CartItem.objects.filter(cart=cart)
+    if lock:
+        items = items.select_for_update()
+    return list(items.order_by('added_at', 'id').values_list('product_id', 'variation_id', 'quantity'))
+
+
+def build_items(lines):
+    """
+    عناصر طلب غير محفوظة تحفظ اسم المنتج ورمزه وسعره وقت الطلب
+    تعيد (العناصر، معرفات المنتجات غير المتوفرة)
+    """
+    products = Product.objects.filter(is_active=True).only('name', 'sku', 'price').in_bulk(
+        {product_id for product_id, _, _ in lines}
+    )
+    variation_ids = {variation_id for _, variation_id, _ in lines} - {None}
+    variations = {}
+    if variation_ids:
+        variations = ProductVariation.objects.filter(is_active=True).only('product_id', 'sku', 'price').in_bulk(
+            variation_ids
+        )
+
+    items, unavailable = [], []
+    for product_id, variation_id, quantity in lines:
+        product = products.get(product_id)
+        variation = variations.get(variation_id) if variation_id else None
+        if product is None or (variation_id and (variation is None or variation.product_id != product_id)):
+            unavailable.append(product_id)
+            continue
+        # نفس ProductVariation.final_price دون جلب المنتج مرة أخرى
+        unit_price = variation.price if variation and variation.price else product.price
+        items.append(OrderItem(
+            product=product, variation=variation, quantity=quantity,
+            unit_price=unit_price, total_price=unit_price * quantity,
+            product_name=product.name, product_sku=variation.sku if variation else product.sku,
+        ))
+    return items, unavailable
+
+
+def checkout(cart, data, user=None):
+    """
+    إنشاء طلب من السلة وتفريغها؛ data فيها حقول العناوين والتواصل و coupon_code
+    ترفع CheckoutError إذا كانت السلة فارغة أو غير متوفرة أو الكوبون غير صالح
+    """
+    with transaction.atomic():
+        lines = cart_lines(cart, lock=True)
+        if not lines:
+            raise CheckoutError({'cart': ["السلة فارغة."]})
+        items, unavailable = build_items(lines)
+        if unavailable:
+            raise CheckoutError({'cart': [f"المنتج #{product_id} لم يعد متوفراً." for product_id in unavailable]})
+
+        subtotal = sum((item.total_price for item in items), Decimal('0.00'))
+        discount = Decimal('0.00')
+        if data.get('coupon_code'):
+            try:
+                discount = apply_coupon(data['coupon_code'], subtotal)
+            except CouponError as exc:
+                raise CheckoutError({'coupon_code': [str(exc)]})
+        order = Order.objects.create(
+            user=user, subtotal=subtotal, discount_amount=discount, total_amount=subtotal - discount,
+            **{field: data[field] for field in ORDER_FIELDS if field in data},
+        )
+
+        reference = f"order:{order.order_number}"
+        try:
+            reserve_stock(lines, reference=reference)
+        except InsufficientStock as exc:
+            raise CheckoutError({'cart': [str(exc)]})
+        commit_reservations(reference)
+
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        OrderStatusHistory.objects.create(order=order, status=order.status, notes="تم إنشاء الطلب", created_by=user)
+
+        if isinstance(cart, GuestCart):
+            transaction.on_commit(cart.clear)
+        else:
+            CartItem.objects.filter(cart=cart).delete()
+    return order
+
+
+def cart_subtotal(cart):
+    """
+    مجموع السلة بنفس أسعار إتمام الطلب، للتحقق من الكوبونات قبل الطلب
+    """
+    items, _ = build_items(cart_lines(cart))
+    return sum((item.total_price for item in items), Decimal('0.00'))
@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .coupons import invalidate_coupon
+from .models import Coupon
+
+
+@receiver(pre_save, sender=Coupon)
+def remember_previous_code(sender, instance, raw=False, **kwargs):
+    instance._previous_code = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_code = Coupon.objects.filter(pk=instance.pk).values_list('code', flat=True).first()
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_cached_coupon(sender, instance, **kwargs):
+    # الكود القديم أيضاً عند تغييره، حتى لا يبقى صالحاً من الكاش
+    codes = {instance.code, getattr(instance, '_previous_code', None)} - {None}
+
+    def invalidate():
+        for code in codes:
+            invalidate_coupon(code)
+
+    # بعد الالتزام حتى لا يعيد طلب متزامن قراءة القيمة القديمة إلى الكاش
+    transaction.on_commit(invalidate)
@@ -1,3 +1,446 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem
+from ecommerce_platform.testing import ProductFactoryMixin, QueryPlanTestMixin
+from payments.models import Payment, PaymentMethod
+from products.models import Category, Product, ProductVariation, StockReservation
+from . import numbering
+from .coupons import CouponError, apply_coupon, get_coupon, redeem_coupon, validate_codes
+from .models import Coupon, Order, OrderItem, OrderStatusHistory
+from .pagination import OrderPagination
+from .services import CheckoutError, checkout
+
+ADDRESS = {
+    'email': "buyer@example.com", 'phone': "0500000000",
+    'billing_first_name': "سارة", 'billing_last_name': "أحمد", 'billing_address_line_1': "شارع 1",
+    'billing_city': "الرياض", 'billing_state': "الرياض", 'billing_postal_code': "12345",
+    'billing_country': "السعودية",
+}
+
+
+class OrderQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="buyer")
+
+    def test_user_order_history_uses_index(self):
+        self.assertUsesIndex(Order.objects.filter(user=self.user), 'order_user_created_idx')
+
+    def test_orders_by_status_use_index(self):
+        self.assertUsesIndex(Order.objects.filter(status='pending'), 'order_status_created_idx')
+
+    def test_status_history_uses_index(self):
+        self.assertUsesIndex(OrderStatusHistory.objects.filter(order_id=1), 'order_history_order_idx')
+
+
+class CheckoutTestMixin(ProductFactoryMixin):
+    product_sku_prefix = 'ORD'
+    product_defaults = {'price': Decimal('10.00'), 'stock_quantity': 5}
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="buyer", password="pass12345")
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name="أجهزة")
+
+    def add_lines(self, count, quantity=1):
+        for index in range(count):
+            product = self.create_product(Product.objects.count() + 1)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def create_coupon(self, **kwargs):
+        defaults = {
+            'code': "SAVE10", 'name': "خصم", 'discount_type': 'percentage', 'discount_value': Decimal('10'),
+            'valid_from': timezone.now() - timedelta(days=1), 'valid_until': timezone.now() + timedelta(days=1),
+        }
+        defaults.update(kwargs)
+        return Coupon.objects.create(**defaults)
+
+
+class CheckoutServiceTests(CheckoutTestMixin, TestCase):
+    def test_checkout_snapshots_items_and_empties_cart(self):
+        product = self.create_product(1, price=Decimal('15.00'))
+        variation = ProductVariation.objects.create(
+            product=product, sku="ORD-1-RED", price=Decimal('18.00'), stock_quantity=4,
+        )
+        CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=product, variation=variation, quantity=3)
+
+        order = checkout(self.cart, ADDRESS, user=self.user)
+
+        self.assertEqual(order.subtotal, Decimal('84.00'))
+        self.assertEqual(order.total_amount, Decimal('84.00'))
+        self.assertEqual(order.shipping_city, "")
+        self.assertEqual(
+            list(order.items.order_by('id').values_list('product_sku', 'unit_price', 'total_price', 'quantity')),
+            [("ORD-1", Decimal('15.00'), Decimal('30.00'), 2), ("ORD-1-RED", Decimal('18.00'), Decimal('54.00'), 3)],
+        )
+        self.assertEqual(list(order.status_history.values_list('status', flat=True)), ['pending'])
+        product.refresh_from_db()
+        variation.refresh_from_db()
+        self.assertEqual((product.stock_quantity, variation.stock_quantity), (3, 1))
+        self.assertEqual(
+            set(StockReservation.objects.values_list('reference', 'status')),
+            {(f"order:{order.order_number}", 'committed')},
+        )
+        self.assertFalse(self.cart.items.exists())
+
+    @override_settings(ORDER_NUMBER_WORKER_ID=1)
+    def test_query_count_does_not_grow_with_lines(self):
+        # مع رقم عامل مضبوط لا يحتاج حفظ الطلب نقطة حفظ لإعادة المحاولة
+        numbering.reset_order_number_generator()
+        self.addCleanup(numbering.reset_order_number_generator)
+        self.add_lines(2)
+        with CaptureQueriesContext(connection) as small:
+            checkout(self.cart, ADDRESS, user=self.user)
+        self.add_lines(25)
+        cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            checkout(self.cart, ADDRESS, user=self.user)
+        self.assertEqual(len(small), len(large))
+        self.assertLessEqual(len(large), 17)
+        self.assertEqual(OrderItem.objects.count(), 27)
+
+    def test_insufficient_stock_rolls_back_order_and_coupon(self):
+        coupon = self.create_coupon()
+        self.add_lines(1, quantity=2)
+        self.add_lines(1, quantity=6)
+        with self.assertRaises(CheckoutError) as context:
+            checkout(self.cart, {**ADDRESS, 'coupon_code': "SAVE10"}, user=self.user)
+        self.assertIn('cart', context.exception.detail)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(sku="ORD-1").stock_quantity, 5)
+        self.assertEqual(self.cart.items.count(), 2)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 0)
+
+    def test_coupon_discount_and_usage_limit(self):
+        coupon = self.create_coupon(usage_limit=1)
+        self.add_lines(2, quantity=2)
+        order = checkout(self.cart, {**ADDRESS, 'coupon_code': "SAVE10"}, user=self.user)
+        self.assertEqual(order.discount_amount, Decimal('4.00'))
+        self.assertEqual(order.total_amount, Decimal('36.00'))
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+
+        self.add_lines(1)
+        with self.assertRaises(CheckoutError) as context:
+            checkout(self.cart, {**ADDRESS, 'coupon_code': "SAVE10"}, user=self.user)
+        self.assertIn('coupon_code', context.exception.detail)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_empty_cart_is_rejected(self):
+        with self.assertRaises(CheckoutError):
+            checkout(self.cart, ADDRESS, user=self.user)
+
+
+class CheckoutAPITests(CheckoutTestMixin, TestCase):
+    def test_user_checkout(self):
+        self.add_lines(2)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('orders:checkout'), ADDRESS, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['items']), 2)
+        self.assertEqual(response.data['shipping_city'], "الرياض")
+        self.assertEqual(Order.objects.get().user, self.user)
+
+    def test_guest_checkout_from_cached_cart(self):
+        product = self.create_product(1)
+        self.client.post(reverse('cart:cart-add'), {'product_id': product.id, 'quantity': 2}, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('orders:checkout'), ADDRESS, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(Order.objects.get().user)
+        self.assertEqual(self.client.get(reverse('cart:cart-detail')).data['total_items'], 0)
+
+    def test_checkout_invalidates_cached_product_stock(self):
+        product = self.create_product(1)
+        CartItem.objects.create(cart=self.cart, product=product, quantity=5)
+        url = reverse('products:product-detail', args=[product.id])
+        self.assertEqual(self.client.get(url).data['stock_quantity'], 5)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('orders:checkout'), ADDRESS, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock_quantity'], 0)
+        self.assertFalse(response.data['is_in_stock'])
+
+    def test_checkout_errors(self):
+        response = self.client.post(reverse('orders:checkout'), ADDRESS, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cart', response.data)
+        response = self.client.post(reverse('orders:checkout'), {'email': "x@example.com"}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('billing_city', response.data)
+
+
+class FixedClockGenerator(numbering.SnowflakeGenerator):
+    def __init__(self, *times):
+        self.times = list(times)
+        super().__init__(worker_id=5)
+
+    def now(self):
+        return self.times.pop(0) if len(self.times) > 1 else self.times[0]
+
+
+class SequenceGenerator(numbering.RandomGenerator):
+    def __init__(self, *numbers):
+        super().__init__()
+        self.numbers = list(numbers)
+
+    def next(self):
+        self.issued += 1
+        return self.numbers.pop(0)
+
+
+class OrderNumberTests(CheckoutTestMixin, TestCase):
+    def tearDown(self):
+        numbering.reset_order_number_generator()
+
+    def create_order(self, **kwargs):
+        return Order.objects.create(**{'subtotal': 10, 'total_amount': 10, **ADDRESS, **kwargs})
+
+    def test_default_numbers_are_unique_and_time_ordered(self):
+        numbers = [self.create_order().order_number for _ in range(50)]
+        self.assertEqual(len(set(numbers)), 50)
+        self.assertEqual(numbers, sorted(numbers))
+        self.assertTrue(all(len(number) == 19 and number.isdigit() for number in numbers))
+
+    def test_snowflake_layout_and_sequence_rollover(self):
+        generator = FixedClockGenerator(1000, 1000, 999, 1001)
+        first, second, after_clock_skew = (int(generator.next()) for _ in range(3))
+        self.assertEqual(first >> 22, 1000)
+        self.assertEqual((first >> 12) & 1023, 5)
+        self.assertEqual(second - first, 1)
+        # رجوع الساعة لا يعيد رقماً سابقاً
+        self.assertEqual(after_clock_skew - second, 1)
+
+        generator = FixedClockGenerator(7)
+        generator.next()
+        generator.sequence = 4095
+        generator.times = [7, 7, 8]
+        self.assertEqual(int(generator.next()) >> 22, 8)
+
+    def test_snowflake_without_worker_id_retries_on_collision(self):
+        # عمليتان بنفس باقي معرف العملية في نفس الميلي ثانية
+        numbering._generator = FixedClockGenerator(1000)
+        self.create_order()
+        with self.settings(ORDER_NUMBER_WORKER_ID=None):
+            numbering._generator = numbering.SnowflakeGenerator()
+        numbering._generator.worker_id = 5
+        numbering._generator.now = lambda: 1000
+        order = self.create_order()
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(int(order.order_number) & 4095, 1)
+        self.assertEqual(numbering._generator.issued, 2)
+
+    def test_configured_worker_id_skips_retry(self):
+        self.assertFalse(FixedClockGenerator(1000).retry_on_collision)
+        with self.settings(ORDER_NUMBER_WORKER_ID=7):
+            self.assertFalse(numbering.SnowflakeGenerator().retry_on_collision)
+        with self.settings(ORDER_NUMBER_WORKER_ID=None):
+            self.assertTrue(numbering.SnowflakeGenerator().retry_on_collision)
+
+    def test_legacy_format_retries_on_collision(self):
+        numbering._generator = SequenceGenerator("00000001", "00000001", "00000002")
+        self.create_order()
+        order = self.create_order()
+        self.assertEqual(order.order_number, "00000002")
+        self.assertEqual(numbering._generator.issued, 3)
+
+    def test_legacy_retry_does_not_hide_other_errors(self):
+        numbering._generator = SequenceGenerator("00000001")
+        with self.assertRaises(IntegrityError):
+            self.create_order(phone=None)
+        self.assertEqual(numbering._generator.issued, 1)
+
+
+class OrderHistoryAPITests(CheckoutTestMixin, QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product(1)
+        self.other = User.objects.create_user(username="other")
+        self.orders = [self.create_order(self.user, lines=index % 3 + 1) for index in range(45)]
+        self.create_order(self.other)
+        self.client.force_authenticate(self.user)
+
+    def create_order(self, user, lines=1):
+        order = Order.objects.create(**{'subtotal': 10, 'total_amount': 10, **ADDRESS}, user=user)
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order, product=self.product, quantity=2, unit_price=5, total_price=10,
+                product_name=self.product.name, product_sku=self.product.sku,
+            )
+            for _ in range(lines)
+        ])
+        return order
+
+    def test_list_is_one_narrow_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('orders:order-list'))
+        self.assertEqual(len(context), 1)
+        self.assertNotIn('billing_address_line_1', context.captured_queries[0]['sql'])
+        self.assertEqual(len(response.data['results']), 20)
+        latest = response.data['results'][0]
+        self.assertEqual(latest['order_number'], self.orders[-1].order_number)
+        self.assertEqual(latest['total_items'], self.orders[-1].total_items)
+
+    def test_cursor_pages_cover_history_once(self):
+        numbers, url = [], reverse('orders:order-list')
+        while url:
+            response = self.client.get(url)
+            numbers.extend(order['order_number'] for order in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(numbers, [order.order_number for order in reversed(self.orders)])
+
+    def test_cursor_query_uses_user_index(self):
+        paginator = OrderPagination()
+        queryset = paginator.order_keyset(Order.objects.for_list().filter(user=self.user).order_by('-created_at'))
+        values = [self.orders[10].created_at, self.orders[10].id]
+        plan = self.assertUsesIndex(queryset.filter(paginator.keyset_filter(values)), 'order_user_created_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_detail_loads_relations_with_fixed_queries(self):
+        order = self.orders[0]
+        method = PaymentMethod.objects.create(name="بطاقة", type='credit_card')
+        Payment.objects.create(order=order, payment_method=method, amount=10)
+        OrderStatusHistory.objects.create(order=order, status='pending')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('orders:order-detail', args=[order.order_number]))
+        self.assertEqual(len(context), 4)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertEqual(response.data['payments'][0]['payment_method'], "بطاقة")
+        self.assertEqual(len(response.data['status_history']), 1)
+
+    def test_customers_only_see_their_orders(self):
+        foreign = Order.objects.get(user=self.other)
+        response = self.client.get(reverse('orders:order-detail', args=[foreign.order_number]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(reverse('orders:admin-order-list')).status_code, 403)
+
+    def test_admin_list_filters(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='shipped')
+        self.client.force_authenticate(User.objects.create_user(username="admin", is_staff=True))
+        response = self.client.get(reverse('orders:admin-order-list'), {'status': 'shipped'})
+        self.assertEqual([order['id'] for order in response.data['results']], [self.orders[0].id])
+        response = self.client.get(reverse('orders:admin-order-list'), {'user': self.other.id})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(self.client.get(reverse('orders:admin-order-list'), {'user': 'x'}).status_code, 400)
+
+
+class CouponServiceTests(CheckoutTestMixin, TestCase):
+    def test_active_coupons_are_cached_and_invalidated_on_save(self):
+        coupon = self.create_coupon()
+        self.assertEqual(get_coupon("SAVE10"), coupon)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_coupon("SAVE10").discount_value, Decimal('10'))
+
+        coupon.discount_value = Decimal('20')
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon.save()
+        self.assertEqual(get_coupon("SAVE10").discount_value, Decimal('20'))
+
+    def test_renamed_code_is_invalidated(self):
+        coupon = self.create_coupon()
+        self.assertEqual(get_coupon("SAVE10"), coupon)
+        coupon.code = "SAVE20"
+        with self.captureOnCommitCallbacks(execute=True):
+            coupon.save()
+        self.assertIsNone(get_coupon("SAVE10"))
+        self.assertEqual(get_coupon("SAVE20"), coupon)
+        with self.assertRaises(CouponError):
+            apply_coupon("SAVE10", Decimal('100'))
+
+    def test_unknown_codes_are_cached_as_missing(self):
+        self.assertIsNone(get_coupon("NOPE"))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_coupon("NOPE"))
+
+    def test_apply_validates_and_redeems(self):
+        self.create_coupon(minimum_amount=Decimal('50'), maximum_discount=Decimal('8'), usage_limit=2)
+        with self.assertRaises(CouponError):
+            apply_coupon("SAVE10", Decimal('40'))
+        self.assertEqual(apply_coupon("SAVE10", Decimal('100')), Decimal('8.00'))
+        self.assertEqual(apply_coupon("SAVE10", Decimal('100')), Decimal('8.00'))
+        # النسخة في الكاش ما زالت ترى used_count = 0؛ التحديث الشرطي هو الحكم
+        with self.assertRaises(CouponError):
+            apply_coupon("SAVE10", Decimal('100'))
+        self.assertEqual(Coupon.objects.get().used_count, 2)
+
+    def test_batch_validation_uses_one_query(self):
+        self.create_coupon()
+        self.create_coupon(code="BIG", minimum_amount=Decimal('500'))
+        self.create_coupon(code="OLD", valid_until=timezone.now() - timedelta(hours=1))
+        self.create_coupon(code="FLAT", discount_type='fixed', discount_value=Decimal('50'))
+        with self.assertNumQueries(1):
+            results = validate_codes(["SAVE10", "BIG", "OLD", "FLAT", "NOPE"], Decimal('30'))
+        self.assertEqual(
+            {code: (result['valid'], result['discount']) for code, result in results.items()},
+            {
+                "SAVE10": (True, Decimal('3.00')), "BIG": (False, 0), "OLD": (False, 0),
+                "FLAT": (True, Decimal('30.00')), "NOPE": (False, 0),
+            },
+        )
+
+    def test_validate_endpoint_uses_cart_subtotal(self):
+        self.create_coupon()
+        self.add_lines(2, quantity=2)
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            reverse('orders:validate-coupons'), {'codes': ["SAVE10", "NOPE"]}, format='json'
+        )
+        self.assertEqual(response.data['subtotal'], "40.00")
+        self.assertEqual(
+            [(result['code'], result['valid'], result['discount']) for result in response.data['results']],
+            [("SAVE10", True, "4.00"), ("NOPE", False, "0.00")],
+        )
+
+
+class CouponConcurrencyTests(TransactionTestCase):
+    def test_usage_limit_is_never_exceeded(self):
+        coupon = Coupon.objects.create(
+            code="LIMITED", name="محدود", discount_type='fixed', discount_value=Decimal('5'), usage_limit=5,
+            valid_from=timezone.now() - timedelta(days=1), valid_until=timezone.now() + timedelta(days=1),
+        )
+        redeemed = []
+        start = threading.Barrier(20)
+
+        def worker():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        redeemed.append(redeem_coupon(coupon))
+                        break
+                    except OperationalError:
+                        # SQLite: "database table is locked" بين الخيوط
+                        continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(redeemed.count(True), 5)
+        self.assertEqual(len(redeemed), 20)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 5)
@@ -1,8 +1,12 @@
 from django.urls import path
+from . import views
 
 app_name = 'orders'
 
 urlpatterns = [
-    # سيتم إضافة URLs لاحقاً
+    path('', views.order_list, name='order-list'),
+    path('admin/', views.admin_order_list, name='admin-order-list'),
+    path('checkout/', views.checkout_view, name='checkout'),
+    path('coupons/validate/', views.validate_coupons, name='validate-coupons'),
+    path('<str:order_number>/', views.order_detail, name='order-detail'),
 ]
-
@@ -1,3 +1,93 @@
-from django.shortcuts import render
+from decimal import Decimal
 
-# Create your views here.
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from cart.services import get_cart
+from .coupons import validate_codes
+from .models import Order
+from .pagination import OrderPagination
+from .serializers import (
+    CheckoutSerializer, OrderSerializer, OrderListSerializer, AdminOrderListSerializer, OrderDetailSerializer,
+    CouponValidationSerializer
+)
+from .services import CheckoutError, cart_subtotal, checkout
+
+def paginated_orders(request, queryset, serializer_class):
+    paginator = OrderPagination()
+    page = paginator.paginate_queryset(queryset.order_by('-created_at'), request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def checkout_view(request):
+    """
+    API endpoint لإتمام الطلب من السلة الحالية (للمستخدمين والضيوف)
+    """
+    serializer = CheckoutSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart = get_cart(request, create=False)
+    if cart is None:
+        return Response({'cart': ["السلة فارغة."]}, status=status.HTTP_400_BAD_REQUEST)
+    user = request.user if request.user.is_authenticated else None
+    try:
+        order = checkout(cart, serializer.validated_data, user=user)
+    except CheckoutError as exc:
+        return Response(exc.detail, status=status.HTTP_400_BAD_REQUEST)
+    return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def validate_coupons(request):
+    """
+    API endpoint للتحقق من عدة أكواد خصم على السلة الحالية دون استخدامها
+    """
+    serializer = CouponValidationSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    cart = get_cart(request, create=False)
+    subtotal = cart_subtotal(cart) if cart is not None else Decimal('0.00')
+    results = validate_codes(serializer.validated_data['codes'], subtotal)
+    return Response({
+        'subtotal': str(subtotal),
+        'results': [
+            {'code': code, **result, 'discount': str(result['discount'])} for code, result in results.items()
+        ],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_list(request):
+    """
+    API endpoint لسجل طلبات المستخدم الحالي من الأحدث
+    """
+    return paginated_orders(request, Order.objects.for_list().filter(user=request.user), OrderListSerializer)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def admin_order_list(request):
+    """
+    API endpoint لكل الطلبات للإدارة مع التصفية بالحالة أو المستخدم
+    """
+    queryset = Order.objects.for_list('user', 'email', 'billing_first_name', 'billing_last_name')
+    if request.query_params.get('status'):
+        queryset = queryset.filter(status=request.query_params['status'])
+    user_id = request.query_params.get('user')
+    if user_id:
+        if not user_id.isdigit():
+            return Response({'user': ["معرف المستخدم غير صالح."]}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(user_id=user_id)
+    return paginated_orders(request, queryset, AdminOrderListSerializer)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def order_detail(request, order_number):
+    """
+    API endpoint لتفاصيل طلب مع عناصره وسجل حالاته ودفعاته
+    """
+    queryset = Order.objects.with_details()
+    if not request.user.is_staff:
+        queryset = queryset.filter(user=request.user)
+    order = get_object_or_404(queryset, order_number=order_number)
+    return Response(OrderDetailSerializer(order).data)
@@ -0,0 +1,128 @@
+"""
+بوابة دفع وهمية داخل العملية للاختبارات والقياس دون شبكة
+
+خادم HTTP/1.1 بسيط على asyncio يدعم الاتصالات الدائمة ويحاكي:
+- زمن استجابة بتوزيع أسي حول latency (ذيل طويل مثل البوابات الحقيقية)
+- failure_rate: رد 503 مؤقت لا يحفظ، فتنجح إعادة المحاولة بنفس المفتاح
+- decline_rate: رفض نهائي (402) للعملية
+- stall_rate: طلبات تعلق stall ثانية لاختبار المهل
+- transfer_encoding: 'chunked' يرسل الردود مقطعة بدلاً من Content-Length، وأي قيمة
+  أخرى ترسل كما هي مع الجسم دون تأطير لاختبار الردود التي لا يفهمها العميل
+
+الردود تحفظ حسب Idempotency-Key فتكرار الطلب يعيد نفس الرد دون عملية جديدة،
+و charges يعد العمليات المنفذة فعلاً للتحقق من عدم الخصم مرتين.
+"""
+import asyncio
+import itertools
+import json
+import random
+
+REASONS = {200: 'OK', 400: 'Bad Request', 402: 'Payment Required', 404: 'Not Found', 503: 'Service Unavailable'}
+
+
+class FakeGateway:
+    def __init__(self, latency=0.02, failure_rate=0.0, decline_rate=0.0, stall_rate=0.0, stall=30.0, seed=None,
+                 transfer_encoding=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.transfer_encoding = transfer_encoding
+        self.random = random.Random(seed)
+        self.responses = {}
+        self.ids = itertools.count(1)
+        self.requests = 0
+        self.connections = 0
+        self.charges = 0
+        self.refunds = 0
+        self.server = None
+        self.tasks = set()
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+        self.url = f"http://{self.host}:{self.port}"
+        return self
+
+    async def close(self):
+        self.server.close()
+        # الطلبات العالقة لا تنتهي وحدها
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b"\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                method, path, _ = request_line.decode().split(' ', 2)
+                headers = {}
+                while (line := await reader.readuntil(b"\r\n")) != b"\r\n":
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                status, response = await self.respond(method, path, headers, json.loads(body) if body else {})
+                writer.write(self.encode(status, json.dumps(response).encode()))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.tasks.discard(task)
+            writer.close()
+
+    def encode(self, status, data):
+        head = f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+        if self.transfer_encoding is None:
+            return f"{head}Content-Length: {len(data)}\r\n\r\n".encode() + data
+        if self.transfer_encoding == 'chunked':
+            middle = len(data) // 2
+            chunks = b''.join(
+                f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n" for chunk in (data[:middle], data[middle:]) if chunk
+            )
+            return f"{head}Transfer-Encoding: chunked\r\n\r\n".encode() + chunks + b"0\r\n\r\n"
+        return f"{head}Transfer-Encoding: {self.transfer_encoding}\r\n\r\n".encode() + data
+
+    async def respond(self, method, path, headers, body):
+        self.requests += 1
+        if self.random.random() < self.stall_rate:
+            await asyncio.sleep(self.stall)
+        else:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency) if self.latency else 0)
+
+        if method != 'POST' or path not in ('/charges', '/refunds'):
+            return 404, {'message': "غير موجود"}
+        key = headers.get('idempotency-key')
+        if not key:
+            return 400, {'message': "Idempotency-Key مطلوب"}
+        if key in self.responses:
+            return self.responses[key]
+        if self.random.random() < self.failure_rate:
+            return 503, {'message': "البوابة غير متاحة مؤقتاً"}
+
+        if self.random.random() < self.decline_rate:
+            result = 402, {'status': 'failed', 'message': "تم رفض العملية"}
+        elif path == '/charges':
+            self.charges += 1
+            result = 200, {'id': f"ch_{next(self.ids)}", 'status': 'succeeded', 'amount': body.get('amount')}
+        else:
+            self.refunds += 1
+            result = 200, {
+                'id': f"re_{next(self.ids)}", 'status': 'succeeded', 'charge': body.get('charge'),
+                'amount': body.get('amount'),
+            }
+        self.responses[key] = result
+        return result
@@ -0,0 +1,408 @@
+"""
+عميل بوابة الدفع (asyncio)
+
+كل الاتصال بالبوابة يتم في حلقة asyncio داخل خيط خلفي (GatewayWorker)، فخيط
+الطلب يكتفي بتعليم الدفعة "قيد المعالجة" وجدولتها بعد نجاح المعاملة ثم يعود
+فوراً، وتكتب النتيجة في Payment عند وصولها (الاستردادات في payments.refunds).
+
+- الاتصالات: مجمع اتصالات HTTP/1.1 دائمة (keep-alive) بحد أقصى PAYMENT_GATEWAY_POOL_SIZE،
+  فلا يدفع كل طلب ثمن فتح اتصال (و TLS) جديد، ولا يتجاوز عدد الطلبات المتزامنة حجم المجمع.
+- المهل: لكل عملية موعد نهائي (PAYMENT_GATEWAY_TIMEOUT) يشمل كل المحاولات، ولكل
+  محاولة مهلة أقصر (PAYMENT_GATEWAY_ATTEMPT_TIMEOUT) حتى لا يستهلك طلب عالق الموعد كله.
+- إعادة المحاولة: عند أخطاء الاتصال والمهل و 429 و 5xx فقط، بتأخير أسي عشوائي
+  (full jitter) حتى لا تعود كل الطلبات الفاشلة إلى البوابة في نفس اللحظة.
+- مفتاح عدم التكرار (Idempotency-Key) ثابت لكل دفعة أو استرداد، فإعادة المحاولة أو
+  إعادة المعالجة بعد انقطاع لا تخصم من العميل مرتين.
+
+إذا استنفدت المحاولات دون رد نهائي تبقى الدفعة "قيد المعالجة" لأن نتيجتها غير
+معروفة، ويعيد process_payments إرسالها لاحقاً بنفس المفتاح.
+"""
+import asyncio
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Payment
+
+DEFAULT_CLIENT = 'payments.gateway.GatewayClient'
+DEFAULT_URL = 'http://127.0.0.1:8700'
+DEFAULT_POOL_SIZE = 20
+DEFAULT_TIMEOUT = 10
+DEFAULT_ATTEMPT_TIMEOUT = 3
+DEFAULT_MAX_RETRIES = 3
+CURRENCY = 'SAR'
+# حالات تعني أن الطلب لم ينفذ أو أن تكراره بنفس المفتاح آمن
+RETRYABLE_STATUSES = {408, 409, 425, 429}
+OPEN_STATUSES = ('pending', 'processing')
+
+
+class GatewayError(Exception):
+    def __init__(self, message, status=None, response=None, retryable=False):
+        self.status = status
+        self.response = response
+        self.retryable = retryable
+        super().__init__(message)
+
+
+class GatewayTimeout(GatewayError):
+    def __init__(self, message="انتهت مهلة الاتصال ببوابة الدفع"):
+        super().__init__(message, retryable=True)
+
+
+class Connection:
+    """
+    اتصال HTTP/1.1 واحد يرسل طلبات JSON ويقرأ الرد كاملاً حسب Content-Length أو
+    Transfer-Encoding: chunked أو حتى إغلاق الاتصال
+
+    الاتصال لا يعود للمجمع إلا إذا قرئ الرد كله بتأطير معروف، حتى لا تبقى بقايا رد
+    على الاتصال فتفسد الطلب التالي.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    @property
+    def closed(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    async def request(self, method, host, path, headers, body):
+        data = json.dumps(body).encode()
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}", "Content-Type: application/json",
+                 f"Content-Length: {len(data)}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        self.reusable = False
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + data)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        response_headers = await self.read_headers()
+        payload, framed = await self.read_body(status, response_headers)
+        self.reusable = framed and response_headers.get('connection', '').lower() != 'close'
+        return status, json.loads(payload) if payload else {}
+
+    async def read_headers(self):
+        headers = {}
+        while (line := await self.reader.readuntil(b"\r\n")) != b"\r\n":
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return headers
+
+    async def read_body(self, status, headers):
+        """
+        (جسم الرد، هل انتهى الرد بحد معروف يسمح بإعادة استخدام الاتصال)
+        ترفع ValueError للتأطير غير المدعوم فيغلق الاتصال ويعاد الطلب
+        """
+        encoding = headers.get('transfer-encoding', '').lower()
+        if encoding:
+            if [part.strip() for part in encoding.split(',')] != ['chunked']:
+                raise ValueError(f"ترميز نقل غير مدعوم: {encoding}")
+            return await self.read_chunked(), True
+        if 'content-length' in headers:
+            return await self.reader.readexactly(int(headers['content-length'])), True
+        if status in (204, 304) or 100 <= status < 200:
+            return b'', True
+        # بدون طول ولا تقطيع: الرد ينتهي بإغلاق الخادم للاتصال
+        return await self.reader.read(), False
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size_line = await self.reader.readuntil(b"\r\n")
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # الحقول الختامية (trailers) إن وجدت ثم السطر الفارغ
+                await self.read_headers()
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            if await self.reader.readexactly(2) != b"\r\n":
+                raise ValueError("تقطيع غير صالح في رد بوابة الدفع")
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    اتصالات دائمة بحد أقصى size؛ الطلب الزائد ينتظر اتصالاً حراً بدلاً من فتح اتصال جديد
+    keep_alive=False يغلق الاتصال بعد كل طلب (للمقارنة في القياس)
+    """
+
+    def __init__(self, host, port, size=DEFAULT_POOL_SIZE, use_ssl=False, keep_alive=True):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.ssl = ssl.create_default_context() if use_ssl else None
+        self.keep_alive = keep_alive
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def acquire(self):
+        await self.slots.acquire()
+        while self.idle:
+            connection = self.idle.pop()
+            if not connection.closed:
+                return connection
+            connection.close()
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        except BaseException:
+            self.slots.release()
+            raise
+        self.opened += 1
+        return Connection(reader, writer)
+
+    def release(self, connection, reuse=True):
+        if reuse and self.keep_alive and connection.reusable and not connection.closed:
+            self.idle.append(connection)
+        else:
+            connection.close()
+        self.slots.release()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class GatewayClient:
+    """
+    عميل البوابة؛ ينشأ ويستخدم داخل حلقة asyncio واحدة لأن المجمع مرتبط بها
+    البدائل (PAYMENT_GATEWAY_CLIENT) توفر نفس الواجهة: charge و refund غير متزامنتين،
+    و close، و concurrency لعدد الطلبات المتزامنة
+    """
+
+    def __init__(self, url=None, api_key=None, pool_size=None, timeout=None, attempt_timeout=None,
+                 max_retries=None, backoff=0.05, max_backoff=2.0, keep_alive=True):
+        parts = urlsplit(url or getattr(settings, 'PAYMENT_GATEWAY_URL', DEFAULT_URL))
+        secure = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.base_path = parts.path.rstrip('/')
+        self.api_key = api_key if api_key is not None else getattr(settings, 'PAYMENT_GATEWAY_API_KEY', '')
+        self.timeout = timeout or getattr(settings, 'PAYMENT_GATEWAY_TIMEOUT', DEFAULT_TIMEOUT)
+        self.attempt_timeout = attempt_timeout or getattr(
+            settings, 'PAYMENT_GATEWAY_ATTEMPT_TIMEOUT', DEFAULT_ATTEMPT_TIMEOUT
+        )
+        self.max_retries = max_retries if max_retries is not None else getattr(
+            settings, 'PAYMENT_GATEWAY_MAX_RETRIES', DEFAULT_MAX_RETRIES
+        )
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.pool = ConnectionPool(
+            self.host, parts.port or (443 if secure else 80),
+            size=pool_size or getattr(settings, 'PAYMENT_GATEWAY_POOL_SIZE', DEFAULT_POOL_SIZE),
+            use_ssl=secure, keep_alive=keep_alive,
+        )
+        self.concurrency = self.pool.size
+        self.retries = 0
+
+    async def send(self, path, body, headers, deadline):
+        loop = asyncio.get_running_loop()
+        # انتظار اتصال حر يحسب من الموعد النهائي فقط وليس من مهلة المحاولة
+        async with asyncio.timeout_at(deadline):
+            connection = await self.pool.acquire()
+        try:
+            async with asyncio.timeout_at(min(deadline, loop.time() + self.attempt_timeout)):
+                result = await connection.request('POST', self.host, self.base_path + path, headers, body)
+        except BaseException:
+            # اتصال قطع في منتصف طلب (مهلة أو خطأ) لا يعاد للمجمع
+            self.pool.release(connection, reuse=False)
+            raise
+        self.pool.release(connection)
+        return result
+
+    async def post(self, path, body, idempotency_key, timeout=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        headers = {'Idempotency-Key': idempotency_key}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+
+        attempt = 0
+        while True:
+            try:
+                status, response = await self.send(path, body, headers, deadline)
+            except TimeoutError:
+                error = GatewayTimeout()
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                error = GatewayError(f"تعذر الاتصال ببوابة الدفع: {exc}", retryable=True)
+            else:
+                if status < 300:
+                    return response
+                error = GatewayError(
+                    response.get('message') or f"رفضت بوابة الدفع الطلب ({status})", status=status,
+                    response=response, retryable=status >= 500 or status in RETRYABLE_STATUSES,
+                )
+
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if not error.retryable or attempt >= self.max_retries or loop.time() + delay >= deadline:
+                raise error
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    async def charge(self, payment_id, amount, reference=''):
+        return await self.post('/charges', {
+            'amount': str(amount), 'currency': CURRENCY, 'reference': reference,
+            'metadata': {'payment_id': payment_id},
+        }, idempotency_key=f"payment-{payment_id}")
+
+    async def refund(self, refund_id, transaction_id, amount):
+        return await self.post('/refunds', {
+            'charge': transaction_id, 'amount': str(amount), 'metadata': {'refund_id': refund_id},
+        }, idempotency_key=f"refund-{refund_id}")
+
+    def close(self):
+        self.pool.close()
+
+
+def get_gateway_client(**options):
+    return import_string(getattr(settings, 'PAYMENT_GATEWAY_CLIENT', DEFAULT_CLIENT))(**options)
+
+
+def result_fields(response=None, error=None):
+    """
+    الحقول التي تكتب في الدفعة أو الاسترداد؛ None إذا كانت النتيجة غير معروفة بعد
+    """
+    now = timezone.now()
+    if error is None:
+        succeeded = response.get('status') == 'succeeded'
+        return {
+            'status': 'completed' if succeeded else 'failed', 'transaction_id': response.get('id', ''),
+            'gateway_response': response, 'processed_at': now, 'updated_at': now,
+        }
+    if error.retryable:
+        return None
+    return {
+        'status': 'failed', 'gateway_response': error.response or {'error': str(error)},
+        'processed_at': now, 'updated_at': now,
+    }
+
+
+def record_result(model, pk, response=None, error=None):
+    """
+    كتابة النتيجة بتحديث شرطي: النتيجة المتأخرة لا تغير سجلاً أغلق بالفعل
+    تعيد الحالة الجديدة، أو 'processing' إذا بقيت النتيجة غير معروفة
+    """
+    fields = result_fields(response, error)
+    if fields is None:
+        model.objects.filter(pk=pk, status__in=OPEN_STATUSES).update(
+            status='processing', gateway_response={'error': str(error)}, updated_at=timezone.now(),
+        )
+        return 'processing'
+    model.objects.filter(pk=pk, status__in=OPEN_STATUSES).update(**fields)
+    return fields['status']
+
+
+def claim_payments(payment_ids=None, limit=None):
+    """
+    تعليم الدفعات المفتوحة "قيد المعالجة" وإرجاع (المعرف، المبلغ الإجمالي، رقم الطلب)
+    """
+    payments = Payment.objects.filter(status__in=OPEN_STATUSES)
+    if payment_ids is not None:
+        payments = payments.filter(pk__in=payment_ids)
+    rows = list(
+        payments.order_by('pk').values_list('pk', 'amount', 'processing_fee', 'order__order_number')[:limit]
+    )
+    Payment.objects.filter(pk__in=[row[0] for row in rows], status='pending').update(
+        status='processing', updated_at=timezone.now(),
+    )
+    return [(pk, amount + fee, order_number) for pk, amount, fee, order_number in rows]
+
+
+async def charge_payment(client, payment_id, amount, reference=''):
+    try:
+        response, error = await client.charge(payment_id, amount, reference), None
+    except GatewayError as exc:
+        response, error = None, exc
+    return await sync_to_async(record_result)(Payment, payment_id, response, error)
+
+
+async def process_payments(client, payment_ids=None, limit=None):
+    """
+    إرسال الدفعات المفتوحة بالتوازي (بحدود حجم المجمع)؛ تعيد [(المعرف، الحالة، الزمن بالميلي ثانية)]
+    """
+    # الموعد النهائي يبدأ عند بدء الدفعة فعلاً، لا وهي تنتظر دورها خلف آلاف الدفعات
+    slots = asyncio.Semaphore(client.concurrency)
+
+    async def run(payment_id, amount, reference):
+        async with slots:
+            start = time.perf_counter()
+            status = await charge_payment(client, payment_id, amount, reference)
+            return payment_id, status, (time.perf_counter() - start) * 1000
+
+    claimed = await sync_to_async(claim_payments)(payment_ids, limit)
+    return await asyncio.gather(*[run(*row) for row in claimed])
+
+
+class GatewayWorker:
+    """
+    حلقة asyncio في خيط خلفي تملك عميل البوابة؛ submit تعيد concurrent.futures.Future فوراً
+    """
+
+    def __init__(self, **client_options):
+        self.client_options = client_options
+        self.lock = threading.Lock()
+        self.loop = None
+        self.pid = None
+
+    def start(self):
+        with self.lock:
+            # بعد fork لا يوجد الخيط الخلفي في العملية الجديدة
+            if self.loop is not None and self.pid == os.getpid():
+                return
+            self.loop = asyncio.new_event_loop()
+            self.pid = os.getpid()
+            ready = threading.Event()
+            threading.Thread(target=self.run, args=(ready,), name='payment-gateway', daemon=True).start()
+            ready.wait()
+
+    def run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        self.client = get_gateway_client(**self.client_options)
+        ready.set()
+        self.loop.run_forever()
+
+    def submit(self, coroutine_function, *args):
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coroutine_function(self.client, *args), self.loop)
+
+    def stop(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                return
+            loop, self.loop = self.loop, None
+            loop.call_soon_threadsafe(self.client.close)
+            loop.call_soon_threadsafe(loop.stop)
+
+
+_worker = None
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        _worker = GatewayWorker()
+    return _worker
+
+
+def submit_payment(payment):
+    """
+    من خيط الطلب: تعليم الدفعة "قيد المعالجة" وإرسالها للبوابة بعد نجاح المعاملة دون انتظار الرد
+    """
+    Payment.objects.filter(pk=payment.pk, status='pending').update(status='processing', updated_at=timezone.now())
+    payment.status = 'processing'
+    transaction.on_commit(lambda: get_worker().submit(process_payments, [payment.pk]))
+
@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import Counter
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, summarize
+from orders.management.commands.benchmark_order_numbers import ORDER_FIELDS
+from orders.models import Order
+from payments.fake_gateway import FakeGateway
+from payments.gateway import GatewayClient, process_payments
+from payments.models import Payment, PaymentMethod
+
+
+class Command(BaseCommand):
+    help = "قياس معالجة الدفعات عبر بوابة وهمية: الإنتاجية وزمن p99 مع مجمع اتصالات ومقارنة باتصال لكل طلب"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=2000)
+        parser.add_argument('--pool-size', type=int, default=20)
+        parser.add_argument('--latency', type=float, default=0.02, help="متوسط زمن البوابة (ثوانٍ)")
+        parser.add_argument('--failure-rate', type=float, default=0.05, help="نسبة أخطاء 503 المؤقتة")
+        parser.add_argument('--decline-rate', type=float, default=0.02)
+        parser.add_argument('--stall-rate', type=float, default=0.002, help="نسبة الطلبات العالقة")
+        parser.add_argument('--attempt-timeout', type=float, default=0.5)
+        parser.add_argument('--timeout', type=float, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True):
+            order = Order.objects.create(**ORDER_FIELDS)
+            method = PaymentMethod.objects.create(name="بطاقة", type='credit_card')
+            for label, keep_alive in (("مجمع اتصالات دائمة", True), ("اتصال جديد لكل طلب", False)):
+                Payment.objects.all().delete()
+                Payment.objects.bulk_create([
+                    Payment(order=order, payment_method=method, amount=Decimal('100.00'))
+                    for _ in range(options['payments'])
+                ])
+                asyncio.run(self.run(label, keep_alive, options))
+
+    async def run(self, label, keep_alive, options):
+        async with FakeGateway(
+            latency=options['latency'], failure_rate=options['failure_rate'],
+            decline_rate=options['decline_rate'], stall_rate=options['stall_rate'], seed=1,
+        ) as gateway:
+            client = GatewayClient(
+                url=gateway.url, pool_size=options['pool_size'], timeout=options['timeout'],
+                attempt_timeout=options['attempt_timeout'], keep_alive=keep_alive,
+            )
+            started = time.perf_counter()
+            results = await process_payments(client)
+            elapsed = time.perf_counter() - started
+            # الدفعات المعلقة تعاد بنفس مفتاح عدم التكرار فتأخذ نتيجتها دون خصم جديد
+            recovered = await process_payments(client)
+            client.close()
+
+        statuses = Counter(status for _, status, _ in results)
+        completed = await sync_to_async(Payment.objects.filter(status='completed').count)()
+        self.stdout.write(f"{label}:")
+        self.stdout.write(
+            f"  {len(results)} دفعة في {elapsed:.2f}s ({len(results) / elapsed:.0f} دفعة/ث)، "
+            f"اتصالات مفتوحة {client.pool.opened}، إعادات محاولة {client.retries}، "
+            f"مكتمل {statuses['completed']}، مرفوض {statuses['failed']}، معلق {statuses['processing']}"
+        )
+        self.stdout.write("  " + format_stats("زمن الدفعة", summarize([timing for _, _, timing in results])))
+        self.stdout.write(
+            f"  إعادة معالجة المعلق: {len(recovered)} دفعة، عمليات البوابة {gateway.charges}، "
+            f"الدفعات المكتملة {completed}"
+        )
+        if gateway.charges != completed:
+            self.stdout.write(self.style.ERROR(
+                f"  عمليات البوابة {gateway.charges} لا تطابق الدفعات المكتملة {completed}!"
+            ))
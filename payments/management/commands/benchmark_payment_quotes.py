@@ -0,0 +1,52 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, measure
+from payments.methods import invalidate_method_table, quote, quote_amounts
+from payments.models import PaymentMethod
+
+
+class Command(BaseCommand):
+    help = "قياس حساب طرق الدفع المؤهلة ورسومها: الطريقة القديمة لكل طريقة مقارنة بالجدول المحفوظ والحساب الجماعي"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--methods', type=int, default=8)
+        parser.add_argument('--carts', type=int, default=1000, help="عدد المبالغ في الحساب الجماعي")
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            types = [choice for choice, _ in PaymentMethod.PAYMENT_TYPES]
+            PaymentMethod.objects.bulk_create([
+                PaymentMethod(
+                    name=f"طريقة {index}", type=types[index % len(types)],
+                    processing_fee_percentage=Decimal(index % 4) / 2, processing_fee_fixed=Decimal(index % 3),
+                    minimum_amount=Decimal(index * 10),
+                    maximum_amount=Decimal(5000 + index * 500) if index % 2 else None,
+                )
+                for index in range(options['methods'])
+            ])
+            invalidate_method_table()
+            amounts = [Decimal(random.randint(100, 800_000)) / 100 for _ in range(options['carts'])]
+            amount = amounts[0]
+
+            self.stdout.write(format_stats(
+                "مبلغ واحد - الطريقة القديمة", measure(lambda: self.naive(amount), options['repeat'])
+            ))
+            self.stdout.write(format_stats("مبلغ واحد - quote", measure(lambda: quote(amount), options['repeat'])))
+            repeat = max(1, options['repeat'] // 20)
+            self.stdout.write(format_stats(
+                f"{len(amounts)} مبلغ - الطريقة القديمة", measure(lambda: [self.naive(a) for a in amounts], repeat)
+            ))
+            self.stdout.write(format_stats(
+                f"{len(amounts)} مبلغ - quote_amounts", measure(lambda: quote_amounts(amounts), repeat)
+            ))
+
+    def naive(self, amount):
+        return [
+            (method, method.calculate_processing_fee(amount))
+            for method in PaymentMethod.objects.filter(is_active=True)
+            if method.minimum_amount <= amount and (method.maximum_amount is None or amount <= method.maximum_amount)
+        ]
@@ -0,0 +1,51 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.models import Wallet, WalletTransaction
+from payments.wallets import credit_in_batches
+
+
+class Command(BaseCommand):
+    help = (
+        "إيداع مبلغ ثابت في كل المحافظ النشطة (استرداد نقدي أو مكافأة) على دفعات؛ "
+        "إعادة التشغيل بنفس --reference لا تودع مرتين"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--amount', required=True)
+        parser.add_argument('--reference', required=True, help="مرجع الحملة، يمنع الإيداع المكرر")
+        parser.add_argument(
+            '--reason', default='cashback', choices=[choice for choice, _ in WalletTransaction.TRANSACTION_REASONS]
+        )
+        parser.add_argument('--description', default='')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            amount = Decimal(options['amount'])
+        except InvalidOperation:
+            raise CommandError("المبلغ غير صالح")
+        if amount <= 0:
+            raise CommandError("المبلغ يجب أن يكون أكبر من صفر")
+
+        total = 0
+        for credited in credit_in_batches(
+            ((wallet_id, amount) for wallet_id in self.active_wallet_ids(options['batch_size'])),
+            reason=options['reason'], reference_id=options['reference'],
+            description=options['description'], batch_size=options['batch_size'],
+        ):
+            total += credited
+            self.stdout.write(f"تم الإيداع في {total} محفظة...")
+        self.stdout.write(self.style.SUCCESS(f"تم إيداع {amount} في {total} محفظة"))
+
+    def active_wallet_ids(self, batch_size):
+        # قراءة المعرفات بالمؤشر (pk > آخر معرف) بدلاً من مؤشر مفتوح أثناء الكتابة
+        last_id = 0
+        wallets = Wallet.objects.filter(is_active=True).order_by('pk')
+        while True:
+            ids = list(wallets.filter(pk__gt=last_id).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            yield from ids
+            last_id = ids[-1]
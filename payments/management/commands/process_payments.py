@@ -0,0 +1,27 @@
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from payments.gateway import get_gateway_client, process_payments
+
+
+class Command(BaseCommand):
+    help = "إرسال الدفعات المفتوحة لبوابة الدفع، ومنها ما بقي قيد المعالجة بعد انقطاع البوابة"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        counts = Counter(status for _, status, _ in async_to_sync(self.process)(options['limit']))
+        self.stdout.write(self.style.SUCCESS(
+            f"تمت معالجة {sum(counts.values())}: مكتمل {counts['completed']}، فشل {counts['failed']}، "
+            f"بانتظار إعادة المحاولة {counts['processing']}"
+        ))
+
+    async def process(self, limit):
+        client = get_gateway_client()
+        try:
+            return await process_payments(client, limit=limit)
+        finally:
+            client.close()
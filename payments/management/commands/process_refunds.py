@@ -0,0 +1,22 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+
+from payments.refunds import DEFAULT_BATCH_SIZE, process_refunds
+
+
+class Command(BaseCommand):
+    help = "معالجة الاستردادات المفتوحة على دفعات؛ آمن لإعادة التشغيل بعد انقطاع دون استرداد مرتين"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, help="أقصى عدد طلبات متزامنة للبوابة")
+        parser.add_argument('--limit', type=int)
+
+    def handle(self, *args, **options):
+        counts = async_to_sync(process_refunds)(
+            batch_size=options['batch_size'], concurrency=options['concurrency'], limit=options['limit'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"تمت معالجة {sum(counts.values())} استرداد: مكتمل {counts['completed']}، فشل {counts['failed']}، "
+            f"بانتظار إعادة المحاولة {counts['processing']}"
+        ))
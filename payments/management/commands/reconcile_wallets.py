@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from payments.wallets import reconcile_wallets
+
+
+class Command(BaseCommand):
+    help = "مقارنة أرصدة المحافظ بمجموع قيودها، وتصحيحها من القيود مع --fix"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        mismatched = reconcile_wallets(fix=options['fix'], batch_size=options['batch_size'])
+        for wallet_id, balance, ledger in mismatched[:50]:
+            self.stdout.write(f"محفظة #{wallet_id}: الرصيد {balance}، مجموع القيود {ledger}")
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("كل الأرصدة مطابقة للقيود"))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"تم تصحيح {len(mismatched)} محفظة"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(mismatched)} محفظة غير مطابقة؛ استخدم --fix للتصحيح"))
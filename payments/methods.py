@@ -0,0 +1,74 @@
+"""
+جدول طرق الدفع المتاحة ورسومها
+
+صفحة إتمام الطلب تطلب طرق الدفع مع كل تغيير في السلة، فبدلاً من قراءة كل
+PaymentMethod واستدعاء calculate_processing_fee لكل واحدة، يحفظ جدول الطرق النشطة
+في ذاكرة العملية بقيم جاهزة (النسبة مقسومة على 100). يعاد بناؤه عند حفظ طريقة دفع
+أو حذفها، وبعد PAYMENT_METHOD_TABLE_TIMEOUT ثانية حتى تلحق العمليات الأخرى بالتغيير.
+
+quote_amounts تحسب لعدة مبالغ في استدعاء واحد: لكل طريقة يحدد نطاق المبالغ المؤهلة
+بالبحث الثنائي في المبالغ المرتبة بدلاً من فحص كل مبلغ مع كل طريقة، وتحسب الرسوم
+مرة واحدة لكل مبلغ مختلف.
+"""
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+
+from .models import PaymentMethod
+
+DEFAULT_TIMEOUT = 60
+CENT = Decimal('0.01')
+
+MethodRow = namedtuple('MethodRow', 'id name type minimum maximum rate fixed')
+
+_table = None
+_expires_at = 0
+
+
+def get_method_table():
+    """
+    طرق الدفع النشطة بترتيب العرض من ذاكرة العملية
+    """
+    global _table, _expires_at
+    if _table is None or time.monotonic() >= _expires_at:
+        rows = PaymentMethod.objects.filter(is_active=True).order_by('name', 'id').values_list(
+            'id', 'name', 'type', 'minimum_amount', 'maximum_amount', 'processing_fee_percentage',
+            'processing_fee_fixed',
+        )
+        _table = tuple(
+            MethodRow(pk, name, kind, minimum, maximum, percentage / 100, fixed)
+            for pk, name, kind, minimum, maximum, percentage, fixed in rows
+        )
+        _expires_at = time.monotonic() + getattr(settings, 'PAYMENT_METHOD_TABLE_TIMEOUT', DEFAULT_TIMEOUT)
+    return _table
+
+
+def invalidate_method_table():
+    global _table
+    _table = None
+
+
+def quote_amounts(amounts):
+    """
+    الطرق المؤهلة لكل مبلغ (الحد الأدنى <= المبلغ <= الحد الأقصى) مع الرسوم والإجمالي
+    تعيد قائمة بنفس ترتيب amounts؛ المبالغ المتساوية تتشارك نفس القائمة
+    """
+    amounts = [Decimal(amount) for amount in amounts]
+    distinct = sorted(set(amounts))
+    quotes = {amount: [] for amount in distinct}
+    for method in get_method_table():
+        start = bisect_left(distinct, method.minimum)
+        end = len(distinct) if method.maximum is None else bisect_right(distinct, method.maximum)
+        for amount in distinct[start:end]:
+            fee = (amount * method.rate + method.fixed).quantize(CENT, ROUND_HALF_UP)
+            quotes[amount].append({
+                'id': method.id, 'name': method.name, 'type': method.type, 'fee': fee, 'total': amount + fee,
+            })
+    return [quotes[amount] for amount in amounts]
+
+
+def quote(amount):
+    return quote_amounts([amount])[0]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_payment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='wallettransaction',
+            index=models.Index(fields=['reference_id', 'wallet'], name='wallet_tx_reference_idx'),
+        ),
+    ]
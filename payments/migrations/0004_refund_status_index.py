@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_wallet_transaction_reference_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='refund',
+            index=models.Index(fields=['status', 'id'], name='refund_status_idx'),
+        ),
+    ]
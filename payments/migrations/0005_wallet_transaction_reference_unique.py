@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 05:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_refund_status_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='wallettransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('reference_id', ''), _negated=True), fields=('wallet', 'reference_id', 'type'), name='wallet_tx_reference_unique'),
+        ),
+    ]
@@ -61,6 +61,9 @@ class Payment(models.Model):
         verbose_name = "دفعة"
         verbose_name_plural = "الدفعات"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['order', 'status'], name='payment_order_status_idx'),
+        ]
 
     def __str__(self):
         return f"دفعة #{self.id} - طلب #{self.order.order_number}"
@@ -103,6 +106,11 @@ class Refund(models.Model):
         verbose_name = "استرداد"
         verbose_name_plural = "الاستردادات"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment', 'status'], name='refund_payment_status_idx'),
+            # معالجة الاستردادات المفتوحة على دفعات بالمؤشر (payments.refunds)
+            models.Index(fields=['status', 'id'], name='refund_status_idx'),
+        ]
 
     def __str__(self):
         return f"استرداد #{self.id} - {self.amount} ريال"
@@ -150,6 +158,18 @@ class WalletTransaction(models.Model):
         verbose_name = "معاملة محفظة"
         verbose_name_plural = "معاملات المحافظ"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['wallet', '-created_at'], name='wallet_tx_wallet_created_idx'),
+            # تخطي المحافظ المودعة سابقاً عند إعادة تشغيل إيداع جماعي بنفس المرجع
+            models.Index(fields=['reference_id', 'wallet'], name='wallet_tx_reference_idx'),
+        ]
+        constraints = [
+            # لا يودع أو يسحب نفس المرجع مرتين من المحفظة ولو تزامن تشغيلان للإيداع الجماعي
+            models.UniqueConstraint(
+                fields=['wallet', 'reference_id', 'type'], condition=~models.Q(reference_id=''),
+                name='wallet_tx_reference_unique',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.get_type_display()} - {self.amount} ريال"
@@ -0,0 +1,218 @@
+"""
+معالجة الاستردادات على دفعات
+
+process_refunds تمر على الاستردادات المفتوحة بالمؤشر (id) دفعة بعد دفعة:
+1. claim_refunds: قراءة الدفعة وتعليمها "قيد المعالجة" بجملة واحدة.
+2. الاستردادات المدفوعة بالبطاقة ترسل للبوابة بالتوازي بحد أقصى concurrency طلب.
+   المدفوعة من المحفظة (digital_wallet) تعاد للمحفظة دون البوابة.
+3. apply_results: في معاملة واحدة تقفل الاستردادات التي ما زالت مفتوحة، وتودع مبالغ
+   المحافظ بـ credit_in_batches، وتكتب نتائج الاستردادات (save_results)، ثم تحدث
+   Payment.status و Order.payment_status بجملة UPDATE لكل جدول من مجموع المسترد.
+
+الاستكمال بعد انقطاع لا يسترد مرتين: طلبات البوابة تحمل مفتاح عدم تكرار ثابتاً لكل
+استرداد فتعيد البوابة نفس النتيجة للاسترداد الذي بقي "قيد المعالجة"، وإيداع المحفظة
+يتم في نفس المعاملة التي تغلق الاسترداد فإما أن يحدثا معاً أو لا يحدث أي منهما.
+"""
+import asyncio
+from collections import Counter, defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
+from django.utils import timezone
+
+from orders.models import Order
+from .gateway import DEFAULT_POOL_SIZE, OPEN_STATUSES, GatewayError, get_gateway_client, get_worker, result_fields
+from .models import Payment, Refund, Wallet
+from .wallets import ZERO, credit_in_batches
+
+DEFAULT_BATCH_SIZE = 200
+WALLET_PAYMENT_TYPE = 'digital_wallet'
+
+
+def claim_refunds(after=0, batch_size=DEFAULT_BATCH_SIZE, refund_ids=None):
+    """
+    الاستردادات المفتوحة التالية بعد المعرف after مع تعليمها "قيد المعالجة"
+    تعيد [(المعرف، معاملة الدفع، المبلغ، نوع طريقة الدفع، مستخدم الطلب)]
+    """
+    refunds = Refund.objects.filter(pk__gt=after, status__in=OPEN_STATUSES)
+    if refund_ids is not None:
+        refunds = refunds.filter(pk__in=refund_ids)
+    rows = list(refunds.order_by('pk').values_list(
+        'pk', 'payment__transaction_id', 'amount', 'payment__payment_method__type', 'payment__order__user_id',
+    )[:batch_size])
+    Refund.objects.filter(pk__in=[row[0] for row in rows], status='pending').update(
+        status='processing', updated_at=timezone.now(),
+    )
+    return rows
+
+
+async def send_refunds(client, rows, concurrency):
+    """
+    إرسال الاستردادات للبوابة بالتوازي؛ تعيد [(المعرف، الرد، الخطأ)]
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(refund_id, transaction_id, amount):
+        if not transaction_id:
+            return refund_id, None, GatewayError("الدفعة ليس لها معاملة في بوابة الدفع")
+        async with slots:
+            try:
+                return refund_id, await client.refund(refund_id, transaction_id, amount), None
+            except GatewayError as exc:
+                return refund_id, None, exc
+
+    return await asyncio.gather(*[send(refund_id, transaction_id, amount) for refund_id, transaction_id, amount, *_ in rows])
+
+
+def refunded_total():
+    """
+    مجموع الاستردادات المكتملة للدفعة الخارجية
+    """
+    totals = Refund.objects.filter(payment=OuterRef('pk'), status='completed').order_by().values('payment')
+    return Coalesce(
+        Subquery(totals.annotate(total=Sum('amount')).values('total')), Value(ZERO),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def order_refunded_total():
+    # عبر دفعات الطلب وليس بربط الاستردادات بالطلب، حتى يبحث الاستعلام بفهرسي (order, status)
+    # و (payment, status) بدلاً من المرور على كل الاستردادات المكتملة لكل طلب
+    totals = Payment.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    return Coalesce(
+        Subquery(totals.annotate(total=Sum(refunded_total())).values('total')), Value(ZERO),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def refund_status(total, amount_field, default_field):
+    return Case(
+        When(GreaterThanOrEqual(total, F(amount_field)), then=Value('refunded')),
+        When(GreaterThan(total, Value(ZERO)), then=Value('partially_refunded')),
+        default=F(default_field),
+    )
+
+
+def update_refunded_statuses(payment_ids):
+    now = timezone.now()
+    Payment.objects.filter(pk__in=payment_ids, status__in=('completed', 'partially_refunded', 'refunded')).update(
+        status=refund_status(refunded_total(), 'amount', 'status'), updated_at=now,
+    )
+    Order.objects.filter(pk__in=Payment.objects.filter(pk__in=payment_ids).values('order_id')).update(
+        payment_status=refund_status(order_refunded_total(), 'total_amount', 'payment_status'),
+        updated_at=now,
+    )
+
+
+def save_results(results, now):
+    """
+    results: {المعرف: (الحالة، معرف المعاملة، رد البوابة)}
+    الحقول المشتركة بجملة لكل حالة، والمختلفة لكل صف بـ executemany؛ bulk_update يبني
+    تعبير CASE لكل صف وحقل فيقضي وقته في Python لا في قاعدة البيانات
+    """
+    by_status = defaultdict(list)
+    for refund_id, (status, _, _) in results.items():
+        by_status[status].append(refund_id)
+    for status, ids in by_status.items():
+        Refund.objects.filter(pk__in=ids).update(
+            status=status, processed_at=None if status == 'processing' else now, updated_at=now,
+        )
+
+    field = Refund._meta.get_field('gateway_response')
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(Refund._meta.db_table)} SET {quote('transaction_id')} = %s, "
+            f"{quote('gateway_response')} = %s WHERE {quote('id')} = %s",
+            [
+                (transaction_id, field.get_db_prep_save(response, connection), refund_id)
+                for refund_id, (_, transaction_id, response) in results.items()
+            ],
+        )
+
+
+def apply_results(gateway_results, wallet_rows):
+    """
+    كتابة نتائج دفعة واحدة وإيداع المحافظ في معاملة واحدة؛ تعيد عدد الاستردادات لكل حالة
+    الاستردادات التي أغلقتها عملية أخرى في الأثناء تتخطى
+    """
+    now = timezone.now()
+    ids = [row[0] for row in gateway_results] + [row[0] for row in wallet_rows]
+    with transaction.atomic():
+        refunds = dict(
+            Refund.objects.select_for_update().filter(pk__in=ids, status__in=OPEN_STATUSES)
+            .order_by('pk').values_list('pk', 'payment_id')
+        )
+        results = {}
+        for refund_id, response, error in gateway_results:
+            if refund_id in refunds:
+                fields = result_fields(response, error) or {'status': 'processing', 'gateway_response': {'error': str(error)}}
+                results[refund_id] = (fields['status'], fields.get('transaction_id', ''), fields['gateway_response'])
+
+        wallet_rows = [row for row in wallet_rows if row[0] in refunds]
+        wallets = dict(Wallet.objects.select_for_update().filter(
+            user_id__in={user_id for *_, user_id in wallet_rows}, is_active=True,
+        ).order_by('pk').values_list('user_id', 'pk'))
+        entries, credited = [], []
+        for refund_id, _, amount, _, user_id in wallet_rows:
+            if user_id in wallets:
+                entries.append((wallets[user_id], amount))
+                credited.append(refund_id)
+                results[refund_id] = ('completed', '', {'wallet_id': wallets[user_id]})
+            else:
+                results[refund_id] = ('failed', '', {'error': "لا توجد محفظة نشطة للعميل"})
+        if entries:
+            # المرجع فريد لمجموعة الاستردادات لأنها تغلق في نفس المعاملة ولا تعود مفتوحة
+            for _ in credit_in_batches(
+                entries, 'refund', reference_id=f"refunds:{min(credited)}-{max(credited)}",
+                description=f"استرداد {len(credited)} طلب",
+            ):
+                pass
+
+        if results:
+            save_results(results, now)
+        update_refunded_statuses({
+            refunds[refund_id] for refund_id, (status, _, _) in results.items() if status == 'completed'
+        })
+    return Counter(status for status, _, _ in results.values())
+
+
+async def process_refunds(client=None, refund_ids=None, batch_size=DEFAULT_BATCH_SIZE, concurrency=None, limit=None):
+    """
+    معالجة الاستردادات المفتوحة دفعة بعد دفعة؛ تعيد عدد الاستردادات لكل حالة
+    الاستردادات التي بقيت "قيد المعالجة" (نتيجة غير معروفة) تعاد في التشغيل التالي
+    """
+    own_client = client is None
+    client = client or get_gateway_client()
+    concurrency = concurrency or getattr(client, 'concurrency', None) or getattr(
+        settings, 'PAYMENT_GATEWAY_POOL_SIZE', DEFAULT_POOL_SIZE
+    )
+    counts, after, claimed = Counter(), 0, 0
+    try:
+        while limit is None or claimed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - claimed)
+            rows = await sync_to_async(claim_refunds)(after, size, refund_ids)
+            if not rows:
+                break
+            after, claimed = rows[-1][0], claimed + len(rows)
+            wallet_rows = [row for row in rows if row[3] == WALLET_PAYMENT_TYPE]
+            gateway_rows = [row for row in rows if row[3] != WALLET_PAYMENT_TYPE]
+            results = await send_refunds(client, gateway_rows, concurrency)
+            counts.update(await sync_to_async(apply_results)(results, wallet_rows))
+    finally:
+        if own_client:
+            client.close()
+    return counts
+
+
+def submit_refund(refund):
+    """
+    من خيط الطلب: تعليم الاسترداد "قيد المعالجة" ومعالجته بعد نجاح المعاملة دون انتظار البوابة
+    """
+    Refund.objects.filter(pk=refund.pk, status='pending').update(status='processing', updated_at=timezone.now())
+    refund.status = 'processing'
+    transaction.on_commit(lambda: get_worker().submit(process_refunds, [refund.pk]))
@@ -0,0 +1,7 @@
+from rest_framework import serializers
+
+
+class PaymentQuoteSerializer(serializers.Serializer):
+    amounts = serializers.ListField(
+        child=serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0), max_length=100
+    )
@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .methods import invalidate_method_table
+from .models import PaymentMethod
+
+
+@receiver(post_save, sender=PaymentMethod)
+@receiver(post_delete, sender=PaymentMethod)
+def invalidate_cached_methods(sender, instance, **kwargs):
+    # بعد الالتزام حتى لا يعيد طلب متزامن بناء الجدول من البيانات القديمة
+    transaction.on_commit(invalidate_method_table)
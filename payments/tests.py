@@ -1,3 +1,477 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ecommerce_platform.testing import QueryPlanTestMixin
+from orders.models import Order
+from . import gateway
+from .fake_gateway import FakeGateway
+from .gateway import GatewayClient, GatewayWorker, process_payments
+from .methods import get_method_table, invalidate_method_table, quote, quote_amounts
+from .models import Payment, PaymentMethod, Refund, Wallet, WalletTransaction
+from .refunds import claim_refunds, process_refunds
+from .wallets import InsufficientBalance, credit, credit_in_batches, debit, reconcile_wallets
+
+
+class PaymentQueryPlanTests(QueryPlanTestMixin, TestCase):
+    def test_order_payments_by_status_use_index(self):
+        queryset = Payment.objects.filter(order_id=1, status='completed')
+        self.assertUsesIndex(queryset, 'payment_order_status_idx')
+
+    def test_refunds_by_status_use_index(self):
+        self.assertUsesIndex(Refund.objects.filter(payment_id=1, status='pending'), 'refund_payment_status_idx')
+
+    def test_open_refunds_use_status_index(self):
+        queryset = Refund.objects.filter(pk__gt=0, status__in=('pending', 'processing')).order_by('pk')
+        self.assertUsesIndex(queryset, 'refund_status_idx')
+
+    def test_wallet_transactions_use_index(self):
+        self.assertUsesIndex(WalletTransaction.objects.filter(wallet_id=1), 'wallet_tx_wallet_created_idx')
+
+
+class WalletTestMixin:
+    def create_wallets(self, count, balance=Decimal('0.00')):
+        start = User.objects.count()
+        users = User.objects.bulk_create([User(username=f"wallet-{start + index}") for index in range(count)])
+        return Wallet.objects.bulk_create([Wallet(user=user, balance=balance) for user in users])
+
+
+class WalletServiceTests(WalletTestMixin, TestCase):
+    def setUp(self):
+        self.wallet = self.create_wallets(1)[0]
+
+    def test_credit_and_debit_append_ledger_entries(self):
+        credit(self.wallet, Decimal('50'), 'refund', reference_id="R-1")
+        entry = debit(self.wallet, Decimal('20'), 'purchase')
+        self.assertEqual((entry.balance_before, entry.balance_after), (Decimal('50'), Decimal('30')))
+        self.assertEqual(self.wallet.balance, Decimal('30'))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('30'))
+        self.assertEqual(self.wallet.transactions.count(), 2)
+
+    def test_debit_cannot_overdraw(self):
+        credit(self.wallet, Decimal('10'), 'bonus')
+        with self.assertRaises(InsufficientBalance):
+            debit(self.wallet, Decimal('10.01'), 'purchase')
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('10'))
+        self.assertEqual(self.wallet.transactions.count(), 1)
+
+    def test_batch_credit_is_set_based_and_idempotent(self):
+        wallets = [self.wallet] + self.create_wallets(24)
+        Wallet.objects.filter(pk=wallets[-1].pk).update(is_active=False)
+        entries = [(wallet.pk, Decimal('5')) for wallet in wallets]
+        with CaptureQueriesContext(connection) as context:
+            counts = list(credit_in_batches(entries, 'cashback', reference_id="CASHBACK-1", batch_size=10))
+        self.assertEqual(counts, [10, 10, 4])
+        writes = [query for query in context.captured_queries if query['sql'].startswith(('UPDATE', 'INSERT'))]
+        self.assertEqual(len(writes), 6)
+
+        # إعادة التشغيل بنفس المرجع لا تودع مرتين
+        self.assertEqual(sum(credit_in_batches(entries, 'cashback', reference_id="CASHBACK-1")), 0)
+        self.assertEqual(Wallet.objects.filter(balance=Decimal('5')).count(), 24)
+        self.assertEqual(reconcile_wallets(), [])
+
+    def test_batch_credit_reads_done_wallets_under_lock(self):
+        with CaptureQueriesContext(connection) as context:
+            list(credit_in_batches([(self.wallet.pk, Decimal('5'))], 'cashback', reference_id="CASHBACK-1"))
+        reads = [query['sql'] for query in context.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertIn('"payments_wallet"', reads[0])
+        self.assertIn('"payments_wallettransaction"', reads[1])
+
+    def test_reference_is_unique_per_wallet_and_type(self):
+        credit(self.wallet, Decimal('5'), 'cashback', reference_id="CASHBACK-1")
+        debit(self.wallet, Decimal('5'), 'purchase', reference_id="CASHBACK-1")
+        credit(self.wallet, Decimal('1'), 'bonus')
+        credit(self.wallet, Decimal('1'), 'bonus')
+        with self.assertRaises(IntegrityError):
+            credit(self.wallet, Decimal('5'), 'cashback', reference_id="CASHBACK-1")
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('2'))
+
+    def test_reconcile_rederives_balance_from_ledger(self):
+        other = self.create_wallets(1)[0]
+        credit(self.wallet, Decimal('40'), 'refund')
+        debit(self.wallet, Decimal('15'), 'purchase')
+        credit(other, Decimal('7'), 'bonus')
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('99'))
+
+        self.assertEqual(reconcile_wallets(), [(self.wallet.pk, Decimal('99'), Decimal('25'))])
+        reconcile_wallets(fix=True)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('25'))
+        self.assertEqual(reconcile_wallets(), [])
+
+    def test_commands(self):
+        self.create_wallets(3)
+        out = StringIO()
+        call_command('credit_wallets', amount='2.50', reference="EID", stdout=out)
+        self.assertIn("4 محفظة", out.getvalue())
+        Wallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('1'))
+        out = StringIO()
+        call_command('reconcile_wallets', '--fix', stdout=out)
+        self.assertIn("تم تصحيح 1 محفظة", out.getvalue())
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('2.50'))
+
+
+class WalletConcurrencyTests(WalletTestMixin, TransactionTestCase):
+    def test_concurrent_batch_credits_with_same_reference_credit_once(self):
+        wallets = self.create_wallets(5)
+        entries = [(wallet.pk, Decimal('5')) for wallet in wallets]
+        errors = []
+        start = threading.Barrier(5)
+
+        def worker():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        list(credit_in_batches(entries, 'cashback', reference_id="CASHBACK-1", batch_size=2))
+                        break
+                    except OperationalError:
+                        # SQLite: "database table is locked" بين الخيوط
+                        continue
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(WalletTransaction.objects.count(), 5)
+        self.assertEqual(set(Wallet.objects.values_list('balance', flat=True)), {Decimal('5')})
+        self.assertEqual(reconcile_wallets(), [])
+
+    def test_concurrent_debits_never_overdraw(self):
+        wallet = self.create_wallets(1)[0]
+        credit(wallet, Decimal('50'), 'bonus')
+        results = []
+        start = threading.Barrier(10)
+
+        def worker():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        debit(Wallet(pk=wallet.pk), Decimal('10'), 'purchase')
+                        results.append(True)
+                        break
+                    except InsufficientBalance:
+                        results.append(False)
+                        break
+                    except OperationalError:
+                        # SQLite: "database table is locked" بين الخيوط
+                        continue
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 5)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal('0'))
+        self.assertEqual(reconcile_wallets(), [])
+        balances = list(wallet.transactions.order_by('id').values_list('balance_before', 'balance_after'))
+        self.assertTrue(all(after == before - 10 for before, after in balances[1:]))
+
+
+class PaymentTestMixin:
+    def create_payments(self, count, method_type='credit_card', user=None, **kwargs):
+        order = Order.objects.create(
+            user=user, email="buyer@example.com", phone="0500000000", billing_first_name="سارة",
+            billing_last_name="أحمد", billing_address_line_1="شارع 1", billing_city="الرياض",
+            billing_state="الرياض", billing_postal_code="12345", billing_country="السعودية",
+            subtotal=100 * count, total_amount=100 * count,
+        )
+        method = PaymentMethod.objects.create(name="طريقة دفع", type=method_type)
+        return Payment.objects.bulk_create([
+            Payment(order=order, payment_method=method, amount=Decimal('100.00'), processing_fee=Decimal('2.50'),
+                    **kwargs)
+            for _ in range(count)
+        ])
+
+
+class GatewayTests(PaymentTestMixin, TestCase):
+    async def create_payments_async(self, count, **kwargs):
+        return await sync_to_async(self.create_payments)(count, **kwargs)
+
+    async def process(self, fake, **client_options):
+        async with fake:
+            client = GatewayClient(url=fake.url, backoff=0.001, **client_options)
+            try:
+                return await process_payments(client), client
+            finally:
+                client.close()
+
+    async def test_charge_writes_result_back(self):
+        payment = (await self.create_payments_async(1))[0]
+        fake = FakeGateway(latency=0)
+        results, _ = await self.process(fake)
+        self.assertEqual([status for _, status, _ in results], ['completed'])
+        await payment.arefresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(payment.transaction_id, payment.gateway_response['id'])
+        self.assertEqual(payment.gateway_response['amount'], '102.50')
+        self.assertIsNotNone(payment.processed_at)
+
+    async def test_transient_failures_are_retried_without_double_charging(self):
+        await self.create_payments_async(20)
+        fake = FakeGateway(latency=0, failure_rate=0.5, seed=3)
+        results, client = await self.process(fake, max_retries=10)
+        self.assertTrue(all(status == 'completed' for _, status, _ in results))
+        self.assertGreater(client.retries, 0)
+        self.assertEqual(fake.charges, 20)
+
+    async def test_decline_fails_payment_without_retry(self):
+        payment = (await self.create_payments_async(1))[0]
+        fake = FakeGateway(latency=0, decline_rate=1)
+        _, client = await self.process(fake)
+        self.assertEqual((client.retries, fake.requests), (0, 1))
+        await payment.arefresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.gateway_response['status'], 'failed')
+
+    async def test_deadline_leaves_payment_processing_for_idempotent_recovery(self):
+        payment = (await self.create_payments_async(1))[0]
+        fake = FakeGateway(latency=0, stall_rate=1, stall=0.3)
+        started = time.perf_counter()
+        results, _ = await self.process(fake, timeout=0.2, attempt_timeout=0.05)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual([status for _, status, _ in results], ['processing'])
+
+        # البوابة نفذت العملية بعد انتهاء المهلة؛ إعادة الإرسال بنفس المفتاح تعيد نفس النتيجة
+        fake.stall_rate = 0
+        async with fake:
+            await asyncio.sleep(0.3)
+            client = GatewayClient(url=fake.url)
+            await process_payments(client)
+            client.close()
+        await payment.arefresh_from_db()
+        self.assertEqual(payment.status, 'completed')
+        self.assertEqual(fake.charges, 1)
+
+    async def test_pool_reuses_connections(self):
+        await self.create_payments_async(30)
+        fake = FakeGateway(latency=0.001)
+        _, client = await self.process(fake, pool_size=3)
+        self.assertEqual((client.pool.opened, fake.connections), (3, 3))
+        self.assertEqual(fake.charges, 30)
+
+    async def test_chunked_responses_are_decoded_and_connection_reused(self):
+        await self.create_payments_async(5)
+        fake = FakeGateway(latency=0, transfer_encoding='chunked')
+        results, client = await self.process(fake, pool_size=1)
+        self.assertEqual([status for _, status, _ in results], ['completed'] * 5)
+        self.assertEqual((client.pool.opened, fake.connections), (1, 1))
+
+    async def test_unknown_framing_closes_connection(self):
+        payment = (await self.create_payments_async(1))[0]
+        fake = FakeGateway(latency=0, transfer_encoding='gzip')
+        results, client = await self.process(fake, pool_size=1, max_retries=2)
+        # لا تسجل نتيجة لم تقرأ؛ كل محاولة على اتصال جديد
+        self.assertEqual([status for _, status, _ in results], ['processing'])
+        self.assertEqual(client.pool.opened, 3)
+        self.assertEqual(client.pool.idle, [])
+        await payment.arefresh_from_db()
+        self.assertEqual(payment.status, 'processing')
+
+class GatewayWorkerTests(PaymentTestMixin, TransactionTestCase):
+    def test_submit_payment_returns_before_gateway_responds(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        fake = asyncio.run_coroutine_threadsafe(FakeGateway(latency=0.2).start(), loop).result()
+        worker = GatewayWorker(url=fake.url)
+        old_worker, gateway._worker = gateway._worker, worker
+        try:
+            payment = self.create_payments(1)[0]
+            started = time.perf_counter()
+            with transaction.atomic():
+                gateway.submit_payment(payment)
+            self.assertLess(time.perf_counter() - started, 0.2)
+            self.assertEqual(Payment.objects.get(pk=payment.pk).status, 'processing')
+
+            for _ in range(100):
+                try:
+                    payment.refresh_from_db()
+                except OperationalError:
+                    # SQLite: "database table is locked" أثناء الكتابة من خيط البوابة
+                    continue
+                if payment.status != 'processing':
+                    break
+                time.sleep(0.05)
+            self.assertEqual(payment.status, 'completed')
+        finally:
+            gateway._worker = old_worker
+            worker.stop()
+            asyncio.run_coroutine_threadsafe(fake.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+
+
+class RefundBatchTests(PaymentTestMixin, WalletTestMixin, TestCase):
+    def setUp(self):
+        self.card_payments = self.create_payments(4, status='completed')
+        Payment.objects.filter(pk__in=[payment.pk for payment in self.card_payments]).update(
+            transaction_id=F('id'),
+        )
+        self.wallet = self.create_wallets(1)[0]
+        self.wallet_payment = self.create_payments(
+            1, method_type='digital_wallet', user=self.wallet.user, status='completed',
+        )[0]
+
+    def create_refunds(self, amounts):
+        return Refund.objects.bulk_create([
+            Refund(payment=payment, amount=Decimal(amount), reason='damaged_shipping')
+            for payment, amount in amounts
+        ])
+
+    def run_batch(self, fake, **options):
+        async def run():
+            async with fake:
+                client = GatewayClient(url=fake.url, backoff=0.001)
+                try:
+                    return await process_refunds(client, **options)
+                finally:
+                    client.close()
+        return async_to_sync(run)()
+
+    def test_batch_updates_refunds_payments_orders_and_wallets(self):
+        first, second, third, fourth = self.card_payments
+        self.create_refunds([
+            (first, '100'), (second, '40'), (third, '100'), (self.wallet_payment, '30'), (self.wallet_payment, '20'),
+        ])
+        fake = FakeGateway(latency=0)
+        with CaptureQueriesContext(connection) as context:
+            counts = self.run_batch(fake, batch_size=2)
+        self.assertEqual(counts, {'completed': 5})
+        self.assertEqual(fake.refunds, 3)
+        self.assertEqual(Refund.objects.filter(status='completed').exclude(transaction_id='').count(), 3)
+
+        statuses = dict(Payment.objects.values_list('pk', 'status'))
+        self.assertEqual(
+            [statuses[payment.pk] for payment in (first, second, third, fourth, self.wallet_payment)],
+            ['refunded', 'partially_refunded', 'refunded', 'completed', 'partially_refunded'],
+        )
+        self.assertEqual(Order.objects.get(pk=first.order_id).payment_status, 'partially_refunded')
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('50'))
+        self.assertEqual(reconcile_wallets(), [])
+
+        # الكتابات ثابتة لكل دفعة وليست لكل استرداد
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "payments_payment"')]
+        self.assertEqual(len(updates), 3)
+
+    def test_rerun_after_crash_does_not_refund_twice(self):
+        refunds = self.create_refunds([(self.card_payments[0], '100'), (self.wallet_payment, '30')])
+        fake = FakeGateway(latency=0)
+
+        # انقطاع بعد وصول الطلب للبوابة وقبل كتابة النتيجة
+        claim_refunds()
+
+        async def crash():
+            async with fake:
+                client = GatewayClient(url=fake.url)
+                await client.refund(refunds[0].pk, self.card_payments[0].transaction_id, '100')
+                client.close()
+        async_to_sync(crash)()
+        self.assertEqual(set(Refund.objects.values_list('status', flat=True)), {'processing'})
+
+        self.assertEqual(self.run_batch(fake), {'completed': 2})
+        self.assertEqual(self.run_batch(fake), {})
+        self.assertEqual(fake.refunds, 1)
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal('30'))
+        self.assertEqual(self.wallet.transactions.count(), 1)
+
+    def test_declines_and_unknown_results(self):
+        no_transaction = self.create_payments(1, status='completed')[0]
+        self.create_refunds([(self.card_payments[0], '10'), (no_transaction, '10')])
+        counts = self.run_batch(FakeGateway(latency=0, decline_rate=1))
+        self.assertEqual(counts, {'failed': 2})
+        self.assertEqual(Payment.objects.get(pk=self.card_payments[0].pk).status, 'completed')
+
+        refund = self.create_refunds([(self.card_payments[1], '10')])[0]
+        self.assertEqual(self.run_batch(FakeGateway(latency=0, failure_rate=1)), {'processing': 1})
+        refund.refresh_from_db()
+        self.assertEqual(refund.status, 'processing')
+
+    def test_command(self):
+        self.create_refunds([(self.wallet_payment, '30')])
+        out = StringIO()
+        call_command('process_refunds', stdout=out)
+        self.assertIn("تمت معالجة 1 استرداد: مكتمل 1", out.getvalue())
+
+
+class PaymentMethodQuoteTests(TestCase):
+    def setUp(self):
+        invalidate_method_table()
+        self.card = PaymentMethod.objects.create(
+            name="بطاقة", type='credit_card', processing_fee_percentage=Decimal('2.50'),
+            processing_fee_fixed=Decimal('1.00'), minimum_amount=Decimal('10.00'),
+        )
+        self.cod = PaymentMethod.objects.create(
+            name="عند الاستلام", type='cash_on_delivery', processing_fee_fixed=Decimal('15.00'),
+            maximum_amount=Decimal('500.00'),
+        )
+        PaymentMethod.objects.create(name="معطلة", type='bank_transfer', is_active=False)
+
+    def test_eligibility_and_fees_match_model(self):
+        self.assertEqual([method['id'] for method in quote('5')], [self.cod.pk])
+        self.assertEqual([method['id'] for method in quote('500')], [self.card.pk, self.cod.pk])
+        self.assertEqual([method['id'] for method in quote('500.01')], [self.card.pk])
+
+        card = quote('99.99')[0]
+        self.assertEqual(card['fee'], Decimal('3.50'))
+        self.assertEqual(card['fee'], self.card.calculate_processing_fee(Decimal('99.99')).quantize(Decimal('0.01')))
+        self.assertEqual(card['total'], Decimal('103.49'))
+
+    def test_batch_matches_single_quotes_without_queries(self):
+        amounts = ['0', '10', '250.50', '10', '500', '9999']
+        get_method_table()
+        with self.assertNumQueries(0):
+            batch = quote_amounts(amounts)
+            singles = [quote(amount) for amount in amounts]
+        self.assertEqual(batch, singles)
+
+    def test_table_rebuilt_after_save(self):
+        self.assertEqual(len(get_method_table()), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cod.is_active = False
+            self.cod.save()
+        with self.assertNumQueries(1):
+            self.assertEqual([method['id'] for method in quote('100')], [self.card.pk])
+
+    def test_api(self):
+        client = APIClient()
+        response = client.get(reverse('payments:payment-methods'), {'amount': ['20', '600']})
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data['results']
+        self.assertEqual(first['amount'], '20.00')
+        self.assertEqual([method['fee'] for method in first['methods']], ['1.50', '15.00'])
+        self.assertEqual([method['name'] for method in second['methods']], ["بطاقة"])
+
+        # دون مبلغ: مجموع السلة الحالية (فارغة)
+        response = client.get(reverse('payments:payment-methods'))
+        self.assertEqual(response.data['results'][0]['amount'], '0.00')
+        self.assertEqual(client.get(reverse('payments:payment-methods'), {'amount': '-1'}).status_code, 400)
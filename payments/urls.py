@@ -1,8 +1,8 @@
 from django.urls import path
+from . import views
 
 app_name = 'payments'
 
 urlpatterns = [
-    # سيتم إضافة URLs لاحقاً
+    path('methods/', views.payment_methods, name='payment-methods'),
 ]
-
@@ -1,3 +1,31 @@
-from django.shortcuts import render
+from decimal import Decimal
 
-# Create your views here.
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from cart.services import get_cart
+from orders.services import cart_subtotal
+from .methods import quote_amounts
+from .serializers import PaymentQuoteSerializer
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def payment_methods(request):
+    """
+    API endpoint لطرق الدفع المتاحة ورسومها لمبلغ أو عدة مبالغ (?amount=...)، أو لمجموع السلة الحالية
+    """
+    serializer = PaymentQuoteSerializer(data={'amounts': request.query_params.getlist('amount')})
+    serializer.is_valid(raise_exception=True)
+    amounts = serializer.validated_data['amounts']
+    if not amounts:
+        cart = get_cart(request, create=False)
+        amounts = [cart_subtotal(cart) if cart is not None else Decimal('0.00')]
+    return Response({
+        'results': [
+            {
+                'amount': str(amount),
+                'methods': [{**method, 'fee': str(method['fee']), 'total': str(method['total'])} for method in methods],
+            }
+            for amount, methods in zip(amounts, quote_amounts(amounts))
+        ],
+    })
@@ -0,0 +1,159 @@
+"""
+المحافظ كسجل قيود
+
+كل تغيير في الرصيد يضيف WalletTransaction ولا تعدل القيود بعد إنشائها. العملية
+المفردة تقفل صف المحفظة (select_for_update) فيكون balance_before و balance_after
+صحيحين مهما تزامنت العمليات، ويرفض السحب إذا لم يكفِ الرصيد المقروء تحت القفل.
+
+الإيداع الجماعي (استرداد نقدي أو استردادات لآلاف المحافظ) يعمل على دفعات: لكل
+دفعة قراءة الأرصدة مع القفل، ثم bulk_create للقيود، ثم UPDATE واحد يضيف لكل
+محفظة مبلغ قيدها الجديد، بعدد ثابت من الجمل لكل دفعة مهما كان حجمها. المرجع (reference_id)
+يجعل الإيداع قابلاً للإعادة: المحافظ التي لها قيد بنفس المرجع (تقرأ بعد القفل) لا تودع
+مرتين، وقيد wallet_tx_reference_unique يرفض التكرار إن حدث رغم ذلك.
+
+reconcile_wallets تعيد حساب الأرصدة من القيود باستعلام تجميع واحد وتصلح
+المختلف منها عند الطلب.
+"""
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Wallet, WalletTransaction
+
+ZERO = Decimal('0.00')
+
+
+class InsufficientBalance(Exception):
+    def __init__(self, wallet_id, requested):
+        self.wallet_id = wallet_id
+        self.requested = requested
+        super().__init__(f"رصيد المحفظة #{wallet_id} لا يكفي لسحب {requested}")
+
+
+def get_wallet(user):
+    return Wallet.objects.get_or_create(user=user)[0]
+
+
+def post_transaction(wallet, kind, amount, reason, reference_id='', description=''):
+    """
+    إضافة قيد وتحديث الرصيد مع قفل صف المحفظة؛ تعيد القيد وتحدث wallet.balance
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError("المبلغ يجب أن يكون أكبر من صفر")
+    delta = amount if kind == 'credit' else -amount
+    with transaction.atomic():
+        balance = Wallet.objects.select_for_update().filter(pk=wallet.pk, is_active=True).values_list(
+            'balance', flat=True
+        ).first()
+        if balance is None:
+            raise Wallet.DoesNotExist("المحفظة غير موجودة أو غير نشطة")
+        if balance + delta < 0:
+            raise InsufficientBalance(wallet.pk, amount)
+        Wallet.objects.filter(pk=wallet.pk).update(balance=F('balance') + delta)
+        entry = WalletTransaction.objects.create(
+            wallet_id=wallet.pk, type=kind, amount=amount, reason=reason, reference_id=reference_id,
+            description=description, balance_before=balance, balance_after=balance + delta,
+        )
+    wallet.balance = entry.balance_after
+    return entry
+
+
+def credit(wallet, amount, reason, reference_id='', description=''):
+    return post_transaction(wallet, 'credit', amount, reason, reference_id, description)
+
+
+def debit(wallet, amount, reason, reference_id='', description=''):
+    return post_transaction(wallet, 'debit', amount, reason, reference_id, description)
+
+
+def credit_in_batches(entries, reason, reference_id, description='', batch_size=1000):
+    """
+    إيداع (المحفظة، المبلغ) لكل عنصر في entries؛ يولد عدد المحافظ المودعة بعد كل دفعة
+    المحافظ غير النشطة وتلك التي لها قيد بنفس reference_id تتخطى
+    """
+    if not reference_id:
+        raise ValueError("الإيداع الجماعي يحتاج مرجعاً")
+    entries = iter(entries)
+    while True:
+        chunk = {}
+        for wallet_id, amount in islice(entries, batch_size):
+            chunk[wallet_id] = chunk.get(wallet_id, ZERO) + Decimal(amount)
+        if not chunk:
+            return
+        with transaction.atomic():
+            balances = dict(
+                Wallet.objects.select_for_update().filter(pk__in=chunk, is_active=True)
+                .order_by('pk').values_list('pk', 'balance')
+            )
+            # بعد القفل: تشغيل متزامن بنفس المرجع يكون قد أودع وانتهى، فيظهر قيده هنا
+            done = set(WalletTransaction.objects.filter(
+                wallet_id__in=balances, reference_id=reference_id, type='credit'
+            ).values_list('wallet_id', flat=True))
+            amounts = {
+                wallet_id: chunk[wallet_id] for wallet_id in balances
+                if wallet_id not in done and chunk[wallet_id] > 0
+            }
+            if amounts:
+                WalletTransaction.objects.bulk_create([
+                    WalletTransaction(
+                        wallet_id=wallet_id, type='credit', amount=amount, reason=reason,
+                        reference_id=reference_id, description=description,
+                        balance_before=balances[wallet_id], balance_after=balances[wallet_id] + amount,
+                    )
+                    for wallet_id, amount in amounts.items()
+                ])
+                # الرصيد يضاف من القيد نفسه: جملة واحدة بدلاً من CASE بفرع لكل محفظة
+                entry = WalletTransaction.objects.filter(
+                    wallet=OuterRef('pk'), reference_id=reference_id, type='credit'
+                )
+                Wallet.objects.filter(pk__in=amounts).update(
+                    balance=F('balance') + Subquery(entry.values('amount')[:1])
+                )
+        yield len(amounts)
+
+
+def ledger_balance():
+    return Coalesce(
+        Sum(Case(
+            When(transactions__type='credit', then=F('transactions__amount')),
+            When(transactions__type='debit', then=-F('transactions__amount')),
+        )),
+        Value(ZERO),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def mismatched_wallets(wallets=None):
+    """
+    (المحفظة، الرصيد المخزن، رصيد القيود) للمحافظ المختلفة، بتجميع واحد على القيود
+    """
+    wallets = Wallet.objects.all() if wallets is None else wallets
+    return (
+        wallets.order_by().values('pk', 'balance').annotate(ledger=ledger_balance())
+        .filter(~Q(balance=F('ledger'))).values_list('pk', 'balance', 'ledger').order_by('pk')
+    )
+
+
+def reconcile_wallets(fix=False, batch_size=1000):
+    """
+    تعيد قائمة المحافظ المختلفة؛ مع fix يعاد حسابها تحت القفل ويكتب رصيد القيود
+    """
+    mismatched = list(mismatched_wallets())
+    if fix:
+        ids = [wallet_id for wallet_id, _, _ in mismatched]
+        for start in range(0, len(ids), batch_size):
+            chunk = Wallet.objects.filter(pk__in=ids[start:start + batch_size])
+            with transaction.atomic():
+                list(chunk.select_for_update().order_by('pk').values_list('pk', flat=True))
+                # إعادة الحساب بعد القفل: قد تكون عملية جارية وقت القراءة الأولى
+                current = {wallet_id: ledger for wallet_id, balance, ledger in mismatched_wallets(chunk)}
+                if current:
+                    Wallet.objects.filter(pk__in=current).update(balance=Case(
+                        *[When(pk=wallet_id, then=Value(ledger)) for wallet_id, ledger in current.items()],
+                        output_field=DecimalField(max_digits=10, decimal_places=2),
+                    ))
+    return mismatched
@@ -0,0 +1,182 @@
+"""
+حساب خيارات الفلترة (facets) لمجموعة الفلاتر الحالية
+
+يتم جلب كل الأعداد في استعلام واحد مجمّع حسب (الفئة، العلامة التجارية، مميز،
+متوفر، شريحة السعر)، ثم تحسب كل facet في بايثون مع تجاهل الفلتر الخاص بها
+حتى تظهر الخيارات البديلة بأعدادها. النتائج تخزن في الكاش تحت مفتاح يمثل
+مجموعة الفلاتر بعد توحيدها مع أرقام إصدارات النماذج المؤثرة فيها، فتصبح غير
+صالحة عند تغير أي منتج أو فئة أو علامة تجارية أو مراجعة.
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, IntegerField, Max, Min, Value, When
+
+from ecommerce_platform.cache import get_model_versions
+from reviews.models import Review
+from .filters import filter_products, parse_bool, parse_decimal
+from .models import Brand, Category, Product
+from .search import get_search_backend, normalize_arabic
+
+VERSION_MODELS = (Product, Category, Brand, Review)
+DEFAULT_PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+DEFAULT_TIMEOUT = 300
+
+# أبعاد الـ facets التي تفلتر في بايثون: (اسم الفلتر، الحقل في الصف)
+FACET_DIMENSIONS = (
+    ('category', 'category_id'),
+    ('brand', 'brand_id'),
+    ('is_featured', 'is_featured'),
+    ('in_stock_only', 'in_stock'),
+)
+
+
+def parse_id(value):
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_filters(params):
+    """
+    توحيد الفلاتر حتى تشترك الطلبات المتكافئة في نفس مفتاح الكاش
+    """
+    filters = {
+        'category': parse_id(params.get('category')),
+        'brand': parse_id(params.get('brand')),
+        'is_featured': parse_bool(params.get('is_featured')),
+        'in_stock_only': parse_bool(params.get('in_stock_only')) or None,
+        'min_price': parse_decimal(params.get('min_price')),
+        'max_price': parse_decimal(params.get('max_price')),
+        'min_rating': parse_decimal(params.get('min_rating')),
+        # النص كما يصل لـ ?search= في قائمة المنتجات؛ محرك البحث يوحده ويجذعه بنفسه
+        'search': params.get('search', '').strip() or None,
+    }
+    for key in ('min_price', 'max_price', 'min_rating'):
+        if filters[key] is not None:
+            filters[key] = filters[key].normalize()
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def price_buckets():
+    return getattr(settings, 'PRODUCT_FACET_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+
+
+def price_bucket_expression(boundaries):
+    whens = [
+        When(price__lt=upper, then=Value(index))
+        for index, upper in enumerate(boundaries[1:])
+    ]
+    return Case(*whens, default=Value(len(boundaries) - 1), output_field=IntegerField())
+
+
+def grouped_rows(filters):
+    queryset = Product.objects.filter(is_active=True)
+    queryset = filter_products(queryset, {
+        key: str(filters[key]) for key in ('min_price', 'max_price', 'min_rating') if key in filters
+    })
+    if 'search' in filters:
+        queryset = queryset.filter(id__in=get_search_backend().search(
+            Product.objects.all(), filters['search']
+        ).values('id'))
+    return (
+        queryset.order_by()
+        .annotate(
+            in_stock=Case(When(stock_quantity__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField()),
+            price_bucket=price_bucket_expression(price_buckets()),
+        )
+        .values(
+            'category_id', 'category__name', 'category__is_active',
+            'brand_id', 'brand__name', 'brand__is_active',
+            'is_featured', 'in_stock', 'price_bucket',
+        )
+        .annotate(count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+    )
+
+
+def row_matches(row, filters, skip=None):
+    for name, field in FACET_DIMENSIONS:
+        if name == skip or name not in filters:
+            continue
+        expected = filters[name]
+        if row[field] not in expected if isinstance(expected, set) else row[field] != expected:
+            return False
+    return True
+
+
+def compute_facets(filters):
+    rows = list(grouped_rows(filters))
+    if 'category' in filters:
+        # الفئة المحددة تشمل كل فروعها
+        category = Category.objects.filter(pk=filters['category']).first()
+        filters = dict(filters, category=set(category.get_descendant_ids()) if category else set())
+    matching = [row for row in rows if row_matches(row, filters)]
+
+    boundaries = price_buckets()
+    bucket_counts = defaultdict(int)
+    for row in matching:
+        bucket_counts[row['price_bucket']] += row['count']
+    buckets = [
+        {
+            'min': boundaries[index],
+            'max': boundaries[index + 1] if index + 1 < len(boundaries) else None,
+            'count': bucket_counts[index],
+        }
+        for index in range(len(boundaries))
+        if bucket_counts[index]
+    ]
+
+    def grouped_counts(skip, key_field, name_field, active_field):
+        counts, names = defaultdict(int), {}
+        for row in rows:
+            if row[key_field] is not None and row[active_field] and row_matches(row, filters, skip):
+                counts[row[key_field]] += row['count']
+                names[row[key_field]] = row[name_field]
+        return [
+            {'id': key, 'name': names[key], 'count': count}
+            for key, count in sorted(counts.items(), key=lambda item: (-item[1], names[item[0]]))
+        ]
+
+    def boolean_counts(skip, field):
+        counts = {True: 0, False: 0}
+        for row in rows:
+            if row_matches(row, filters, skip):
+                counts[row[field]] += row['count']
+        return {'true': counts[True], 'false': counts[False]}
+
+    return {
+        'total': sum(row['count'] for row in matching),
+        'price_range': {
+            'min_price': min((row['min_price'] for row in matching), default=None),
+            'max_price': max((row['max_price'] for row in matching), default=None),
+        },
+        'price_buckets': buckets,
+        'brands': grouped_counts('brand', 'brand_id', 'brand__name', 'brand__is_active'),
+        'categories': grouped_counts('category', 'category_id', 'category__name', 'category__is_active'),
+        'in_stock': boolean_counts('in_stock_only', 'in_stock'),
+        'featured': boolean_counts('is_featured', 'is_featured'),
+    }
+
+
+def cache_key(filters):
+    if 'search' in filters:
+        # النصوص التي تتطابق بعد التوحيد تعطي نفس نتائج البحث
+        filters = dict(filters, search=' '.join(normalize_arabic(filters['search']).split()))
+    versions = get_model_versions(VERSION_MODELS)
+    payload = json.dumps([filters, versions], sort_keys=True, default=str)
+    return f"product_facets:{hashlib.md5(payload.encode()).hexdigest()}"
+
+
+def get_facets(params):
+    filters = normalize_filters(params)
+    key = cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, getattr(settings, 'PRODUCT_FACETS_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+    return facets
+
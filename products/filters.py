@@ -0,0 +1,87 @@
+from decimal import Decimal, InvalidOperation
+
+import django_filters
+from rest_framework import filters
+
+from .models import Category, Product
+from .search import get_search_backend
+
+
+def parse_decimal(value):
+    try:
+        number = Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+    return number if number is not None and number.is_finite() else None
+
+
+def parse_bool(value):
+    if value is None or value == '':
+        return None
+    return value.lower() == 'true'
+
+
+def filter_products(queryset, params):
+    """
+    فلاتر السعر والتوفر والتقييم المشتركة بين قائمة المنتجات وخيارات الفلترة
+    """
+    # فلترة حسب السعر
+    min_price = parse_decimal(params.get('min_price'))
+    max_price = parse_decimal(params.get('max_price'))
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+
+    # فلترة المنتجات المتوفرة فقط
+    if parse_bool(params.get('in_stock_only')):
+        queryset = queryset.filter(stock_quantity__gt=0)
+
+    # فلترة حسب التقييم
+    # يعتمد على عمود Product.rating المفهرس بدلاً من تجميع المراجعات في كل طلب
+    min_rating = parse_decimal(params.get('min_rating'))
+    if min_rating is not None:
+        queryset = queryset.filter(rating__gte=min_rating)
+
+    return queryset
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    بحث عبر فهرس البحث النصي بدلاً من icontains على كل حقل
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return get_search_backend().search(queryset, query)
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """
+    ترتيب نتائج البحث حسب الصلة ما لم يطلب العميل ترتيباً آخر
+    """
+
+    def get_default_ordering(self, view):
+        if view.request.query_params.get(filters.SearchFilter.search_param, '').strip():
+            return ['-search_rank', '-created_at']
+        return super().get_default_ordering(view)
+
+
+class ProductFilter(django_filters.FilterSet):
+    """
+    فلترة الفئة تشمل فروعها عبر نطاق على مسار الفئة المفهرس
+    """
+    category = django_filters.NumberFilter(method='filter_category')
+
+    class Meta:
+        model = Product
+        fields = ['category', 'brand', 'is_featured']
+
+    def filter_category(self, queryset, name, value):
+        category = Category.objects.filter(pk=value).only('path').first()
+        if category is None:
+            return queryset.none()
+        start, end = category.path_range()
+        return queryset.filter(category__path__gte=start, category__path__lt=end)
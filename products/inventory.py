@@ -0,0 +1,304 @@
+"""
+حجز المخزون عند إتمام الطلب
+
+كل سطر يخصم بشرط في نفس الجملة:
+    UPDATE ... SET stock_quantity = stock_quantity - n WHERE id = ? AND stock_quantity >= n
+فلا يمكن أن يصبح المخزون سالباً مهما تزامنت الطلبات، ولا حاجة لقراءة المخزون
+قبل الخصم. reserve_stock تخصم كل أسطر الجدول بجملة واحدة (الكمية لكل معرف عبر
+CASE) وتنجح فقط إذا عدلت كل الصفوف؛ وإلا تعاد المحاولة سطراً سطراً لتحديد السطر
+غير المتوفر. الجداول تخصم بترتيب ثابت (المنتجات ثم التنويعات) حتى لا تتقاطع
+أقفال طلبين فيحدث deadlock.
+
+الحجز صالح لمدة STOCK_RESERVATION_TTL ثانية؛ الحجوزات التي تنتهي قبل تأكيدها
+تعيد كمياتها إلى المخزون عبر release_expired_reservations.
+
+المنتجات كثيرة الطلب (عروض الفلاش) يمكن توزيع مخزونها على N صف في StockShard
+عبر shard_stock: الخصم يختار جزءاً عشوائياً وينتقل للأجزاء الأخرى إذا نفد.
+خصم الصف الأصلي مشروط بـ stock_shards = 0، فلا يخصم منه بعد التقسيم حتى لو
+كانت قائمة المنتجات المقسمة في الكاش قديمة.
+
+الخصم والإرجاع بـ update() لا يطلقان post_save، فكل كتابة ناجحة للمخزون تزيد رقم
+إصدار جدولها بعد نجاح المعاملة (stock_changed) حتى لا تعرض استجابات الكتالوج المخزنة
+في الكاش مخزوناً قديماً.
+"""
+import random
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ecommerce_platform.cache import bump_model_version
+from .models import Product, ProductVariation, StockReservation, StockShard
+
+DEFAULT_TTL = 15 * 60
+SHARDED_TARGETS_KEY = 'stock_shards:targets'
+SHARDED_TARGETS_TIMEOUT = 60
+
+
+class StockUnavailable(Exception):
+    """
+    فشل الخصم المجمع؛ تستخدم داخلياً للتراجع إلى الخصم سطراً سطراً
+    """
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, variation_id, requested):
+        self.product_id = product_id
+        self.variation_id = variation_id
+        self.requested = requested
+        super().__init__(f"الكمية المطلوبة ({requested}) غير متوفرة للمنتج #{product_id}")
+
+
+def stock_target(product_id, variation_id):
+    """
+    الصف الذي يحمل مخزون السطر: التنويع إن وجد وإلا المنتج
+    """
+    if variation_id:
+        return ProductVariation, variation_id
+    return Product, product_id
+
+
+def stock_changed(model):
+    """
+    زيادة رقم إصدار الجدول بعد نجاح المعاملة؛ لا تنفذ إذا تراجعت نقطة الحفظ الحالية
+    """
+    transaction.on_commit(partial(bump_model_version, model))
+
+
+def lock_order(key):
+    product_id, variation_id = key
+    return (1, variation_id) if variation_id else (0, product_id)
+
+
+def normalize_lines(lines):
+    """
+    جمع الأسطر المكررة وترتيبها بترتيب الأقفال الثابت
+    lines: (المنتج، التنويع، الكمية)
+    """
+    totals = defaultdict(int)
+    for product_id, variation_id, quantity in lines:
+        totals[(product_id, variation_id or None)] += quantity
+    return sorted(totals.items(), key=lambda item: lock_order(item[0]))
+
+
+def sharded_targets():
+    """
+    {(المنتج، التنويع): عدد الأجزاء} للمنتجات المقسمة، من الكاش
+    """
+    targets = cache.get(SHARDED_TARGETS_KEY)
+    if targets is None:
+        targets = {
+            (product_id, None): shards
+            for product_id, shards in Product.objects.filter(stock_shards__gt=0).values_list('id', 'stock_shards')
+        }
+        targets.update({
+            (product_id, variation_id): shards
+            for product_id, variation_id, shards in ProductVariation.objects.filter(stock_shards__gt=0)
+            .values_list('product_id', 'id', 'stock_shards')
+        })
+        cache.set(SHARDED_TARGETS_KEY, targets, SHARDED_TARGETS_TIMEOUT)
+    return targets
+
+
+def shard_rows(product_id, variation_id):
+    return StockShard.objects.filter(product_id=product_id, variation_id=variation_id)
+
+
+def decrement_shards(product_id, variation_id, quantity, shards):
+    """
+    الخصم من جزء عشوائي ثم من الأجزاء التالية له؛ وإذا لم يكفِ أي جزء وحده
+    تقفل كل الأجزاء بالترتيب ويجمع الخصم منها. تعيد None إذا لم توجد أجزاء
+    """
+    rows = shard_rows(product_id, variation_id)
+    start = random.randrange(shards)
+    for offset in range(shards):
+        shard = (start + offset) % shards
+        if rows.filter(shard=shard, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            stock_changed(stock_target(product_id, variation_id)[0])
+            return True
+
+    locked = list(rows.select_for_update().order_by('shard'))
+    if not locked:
+        return None
+    if sum(row.quantity for row in locked) < quantity:
+        return False
+    remaining = quantity
+    for row in locked:
+        take = min(row.quantity, remaining)
+        if take and not rows.filter(pk=row.pk, quantity__gte=take).update(quantity=F('quantity') - take):
+            return False
+        remaining -= take
+        if not remaining:
+            break
+    stock_changed(stock_target(product_id, variation_id)[0])
+    return True
+
+
+def decrement_stock(product_id, variation_id, quantity):
+    shards = sharded_targets().get((product_id, variation_id))
+    if shards:
+        decremented = decrement_shards(product_id, variation_id, quantity, shards)
+        if decremented is not None:
+            return decremented
+    model, pk = stock_target(product_id, variation_id)
+    if model.objects.filter(pk=pk, stock_shards=0, stock_quantity__gte=quantity).update(
+        stock_quantity=F('stock_quantity') - quantity
+    ):
+        stock_changed(model)
+        return True
+    # الكاش لم يعلم بعد بتقسيم هذا المنتج
+    shards = model.objects.filter(pk=pk).values_list('stock_shards', flat=True).first()
+    return bool(shards) and bool(decrement_shards(product_id, variation_id, quantity, shards))
+
+
+def increment_stock(product_id, variation_id, quantity):
+    model, pk = stock_target(product_id, variation_id)
+    if model.objects.filter(pk=pk, stock_shards=0).update(stock_quantity=F('stock_quantity') + quantity):
+        stock_changed(model)
+        return
+    rows = shard_rows(product_id, variation_id)
+    shards = rows.count()
+    if shards and rows.filter(shard=random.randrange(shards)).update(quantity=F('quantity') + quantity):
+        stock_changed(model)
+
+
+def decrement_rows(model, quantities):
+    """
+    خصم {المعرف: الكمية} من جدول واحد بجملة UPDATE واحدة؛ تعيد عدد الصفوف المعدلة
+    """
+    requested = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = model.objects.filter(pk__in=quantities, stock_shards=0, stock_quantity__gte=requested).update(
+        stock_quantity=F('stock_quantity') - requested
+    )
+    if updated:
+        stock_changed(model)
+    return updated
+
+
+def decrement_lines(lines):
+    """
+    خصم الأسطر المرتبة بجملة لكل جدول، والمنتجات المقسمة من أجزائها
+    ترفع StockUnavailable إذا لم تتوفر كل الكميات
+    """
+    targets = sharded_targets()
+    rows = {Product: {}, ProductVariation: {}}
+    for (product_id, variation_id), quantity in lines:
+        if (product_id, variation_id) in targets:
+            if not decrement_stock(product_id, variation_id, quantity):
+                raise StockUnavailable
+        else:
+            model, pk = stock_target(product_id, variation_id)
+            rows[model][pk] = quantity
+    for model, quantities in rows.items():
+        if quantities and decrement_rows(model, quantities) != len(quantities):
+            raise StockUnavailable
+
+
+def reserve_stock(lines, reference, ttl=None):
+    """
+    حجز كل الأسطر أو لا شيء؛ يرفع InsufficientStock عند أول سطر غير متوفر
+    """
+    if ttl is None:
+        ttl = getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_TTL)
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    lines = normalize_lines(lines)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                decrement_lines(lines)
+        except StockUnavailable:
+            # نقص في المخزون أو منتج قسم بعد قراءة الكاش: المسار البطيء يحدد السطر
+            for (product_id, variation_id), quantity in lines:
+                if not decrement_stock(product_id, variation_id, quantity):
+                    raise InsufficientStock(product_id, variation_id, quantity)
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=product_id, variation_id=variation_id, quantity=quantity,
+                reference=reference, expires_at=expires_at,
+            )
+            for (product_id, variation_id), quantity in lines
+        ])
+
+
+def commit_reservations(reference):
+    """
+    تأكيد حجوزات المرجع بعد إنشاء الطلب؛ تعيد عدد الحجوزات التي كانت ما تزال صالحة
+    """
+    return StockReservation.objects.filter(reference=reference, status='reserved').update(status='committed')
+
+
+def release_reservations(reservations):
+    """
+    إعادة كميات الحجوزات النشطة إلى المخزون
+    كل حجز يستلم بتحديث شرطي على حالته، فلا يعاد مخزونه مرتين لو تزامن الإلغاء
+    """
+    rows = list(
+        reservations.filter(status='reserved').order_by('id').values_list('id', 'product_id', 'variation_id', 'quantity')
+    )
+    released = []
+    with transaction.atomic():
+        for reservation_id, product_id, variation_id, quantity in rows:
+            if StockReservation.objects.filter(pk=reservation_id, status='reserved').update(status='released'):
+                released.append((product_id, variation_id, quantity))
+        for (product_id, variation_id), quantity in normalize_lines(released):
+            increment_stock(product_id, variation_id, quantity)
+    return len(released)
+
+
+def release_expired_reservations(now=None, batch_size=1000):
+    expired = StockReservation.objects.filter(status='reserved', expires_at__lte=now or timezone.now())
+    total = 0
+    while True:
+        ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += release_reservations(StockReservation.objects.filter(id__in=ids))
+
+
+def shard_stock(product_id, variation_id=None, shards=8):
+    """
+    توزيع مخزون المنتج أو التنويع على عدد من الأجزاء، أو دمجها في الصف الأصلي مع shards=0
+    """
+    model, pk = stock_target(product_id, variation_id)
+    with transaction.atomic():
+        row = model.objects.select_for_update().get(pk=pk)
+        rows = shard_rows(product_id, variation_id)
+        total = row.stock_quantity
+        if row.stock_shards:
+            total = rows.select_for_update().aggregate(total=Coalesce(Sum('quantity'), 0))['total']
+        rows.delete()
+        per_shard, extra = divmod(total, shards) if shards else (0, 0)
+        StockShard.objects.bulk_create([
+            StockShard(
+                product_id=product_id, variation_id=variation_id, shard=shard,
+                quantity=per_shard + (1 if shard < extra else 0),
+            )
+            for shard in range(shards)
+        ])
+        model.objects.filter(pk=pk).update(stock_shards=shards, stock_quantity=total)
+        stock_changed(model)
+    cache.delete_many([SHARDED_TARGETS_KEY, StockShard.cache_key(product_id, variation_id)])
+    return total
+
+
+def sync_sharded_stock():
+    """
+    كتابة مجموع الأجزاء في stock_quantity حتى تبقى فلاتر "متوفر" في القوائم صحيحة تقريباً
+    """
+    for model, variation_ref in ((Product, None), (ProductVariation, OuterRef('pk'))):
+        product_ref = OuterRef('pk') if model is Product else OuterRef('product_id')
+        total = StockShard.objects.filter(product_id=product_ref).order_by()
+        total = total.filter(variation_id=variation_ref) if variation_ref else total.filter(variation__isnull=True)
+        if model.objects.filter(stock_shards__gt=0).update(stock_quantity=Coalesce(Subquery(
+            total.values('product_id').annotate(total=Sum('quantity')).values('total')[:1]
+        ), 0)):
+            stock_changed(model)
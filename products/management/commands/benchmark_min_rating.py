@@ -0,0 +1,90 @@
+import random
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, measure
+from products.models import Category, Product
+from reviews.models import Review
+
+
+class Command(BaseCommand):
+    help = "قياس زمن فلترة min_rating مع الترتيب حسب التقييم قبل وبعد عمود التقييم المفهرس"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--min-rating', default='4')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            self.populate(options['products'], options['reviews'])
+            self.run(options['min_rating'], options['repeat'])
+
+    def populate(self, product_count, review_count):
+        self.stdout.write(f"إنشاء {product_count} منتج و {review_count} مراجعة...")
+        reviews_per_product = max(1, review_count // product_count)
+        now = timezone.now()
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                [User(username=f"bench-{i}") for i in range(reviews_per_product)]
+            )
+            category = Category.objects.create(name="قياس")
+            Product.objects.bulk_create(
+                [
+                    Product(name=f"منتج {i}", description="", sku=f"BENCH-{i}",
+                            category=category, price=random.randint(1, 1000))
+                    for i in range(product_count)
+                ],
+                batch_size=5000,
+            )
+            columns = (
+                'product_id', 'user_id', 'rating', 'title', 'comment', 'is_verified_purchase',
+                'is_approved', 'helpful_count', 'created_at', 'updated_at',
+            )
+            sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+                Review._meta.db_table, ', '.join(columns), ', '.join(['%s'] * len(columns))
+            )
+            product_ids = Product.objects.values_list('id', flat=True).iterator(chunk_size=5000)
+            rows = []
+            with connection.cursor() as cursor:
+                for product_id in product_ids:
+                    base = random.randint(1, 5)
+                    for user in users:
+                        rating = min(5, max(1, base + random.choice((-1, 0, 0, 1))))
+                        rows.append((product_id, user.id, rating, '', '', False, True, 0, now, now))
+                    if len(rows) >= 20000:
+                        cursor.executemany(sql, rows)
+                        rows = []
+                if rows:
+                    cursor.executemany(sql, rows)
+        call_command('rebuild_product_ratings', stdout=self.stdout)
+
+    def run(self, min_rating, repeat):
+        def before():
+            # الطريقة القديمة: تجميع المراجعات مع كل طلب
+            list(
+                Product.objects.filter(is_active=True)
+                .annotate(avg_rating=Avg('reviews__rating', filter=Q(reviews__is_approved=True)))
+                .filter(avg_rating__gte=min_rating)
+                .order_by('-avg_rating')[:20]
+            )
+
+        def after():
+            list(Product.objects.filter(is_active=True, rating__gte=min_rating).order_by('-rating')[:20])
+
+        client = APIClient()
+
+        def api():
+            response = client.get('/api/products/', {'min_rating': min_rating, 'ordering': '-rating'})
+            assert response.status_code == 200
+
+        self.stdout.write(format_stats("قبل (GROUP BY على المراجعات)", measure(before, repeat)))
+        self.stdout.write(format_stats("بعد (عمود rating المفهرس)", measure(after, repeat)))
+        self.stdout.write(format_stats("بعد (طلب API كامل)", measure(api, repeat)))
@@ -0,0 +1,102 @@
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, summarize
+from products.models import Brand, Category, Product
+from products.suggestions import suggestion_index
+from products.views import product_search_suggestions
+
+WORDS = [
+    'هاتف', 'ذكي', 'سامسونج', 'جالكسي', 'شاشة', 'حاسوب', 'محمول', 'سماعة', 'لاسلكية', 'كاميرا',
+    'رقمية', 'ساعة', 'حقيبة', 'جلدية', 'مكتبة', 'إسلامية', 'phone', 'laptop', 'galaxy', 'pro',
+    'max', 'ultra', 'mini', 'charger', 'cable', 'wireless', 'speaker', 'monitor', 'keyboard', 'mouse',
+]
+
+
+class Command(BaseCommand):
+    help = "قياس زمن اقتراحات البحث تحت ضغط كتابة متزامن من عدة خيوط"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--keystrokes', type=int, default=2000, help="عدد الطلبات لكل خيط")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            names = self.populate(options['products'])
+            started = time.perf_counter()
+            suggestion_index.reset()
+            suggestion_index.get_indexes()
+            self.stdout.write(f"بناء الفهرس: {(time.perf_counter() - started) * 1000:.0f}ms")
+            indexes = suggestion_index.get_indexes()
+            memory = sum(index.memory_usage() for index in indexes.values())
+            self.stdout.write(f"حجم الفهرس التقريبي: {memory / 1024 / 1024:.1f}MB")
+
+            queries = self.keystrokes(names, options['threads'] * options['keystrokes'])
+            self.stdout.write(format_stats(
+                "suggest() في الذاكرة",
+                self.run(lambda query: suggestion_index.suggest(query), queries, options['threads']),
+            ))
+            factory = APIRequestFactory()
+            self.stdout.write(format_stats(
+                "طلب API كامل",
+                self.run(
+                    lambda query: product_search_suggestions(factory.get('/', {'q': query})),
+                    queries, options['threads'],
+                ),
+            ))
+
+    def populate(self, count):
+        with transaction.atomic():
+            categories = Category.objects.bulk_create(
+                [Category(name=f"{word} {i}") for i, word in enumerate(WORDS)]
+            )
+            brands = Brand.objects.bulk_create([Brand(name=word.title()) for word in WORDS])
+            products = [
+                Product(
+                    name=' '.join(random.sample(WORDS, 3)) + f" {i}", description="", sku=f"S-{i}",
+                    category=random.choice(categories), brand=random.choice(brands), price=10,
+                )
+                for i in range(count)
+            ]
+            Product.objects.bulk_create(products, batch_size=5000)
+        return [product.name for product in products]
+
+    def keystrokes(self, names, count):
+        """
+        محاكاة الكتابة حرفاً حرفاً: كل بادئة من بادئات اسم عشوائي طلب مستقل
+        """
+        queries = []
+        while len(queries) < count:
+            word = random.choice(random.choice(names).split())
+            queries.extend(word[:length] for length in range(2, len(word) + 1))
+        return queries[:count]
+
+    def run(self, func, queries, thread_count):
+        timings = []
+        lock = threading.Lock()
+        chunks = [queries[i::thread_count] for i in range(thread_count)]
+
+        def worker(chunk):
+            local = []
+            for query in chunk:
+                start = time.perf_counter()
+                func(query)
+                local.append((time.perf_counter() - start) * 1000)
+            with lock:
+                timings.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  {len(queries)} طلب في {elapsed:.2f}s ({len(queries) / elapsed:.0f} طلب/ث)")
+        return summarize(timings)
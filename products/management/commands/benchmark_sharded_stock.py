@@ -0,0 +1,35 @@
+from django.db.models import Sum
+
+from ecommerce_platform.benchmarks import benchmark_database
+from products.inventory import shard_stock
+from products.models import Category, Product, StockShard
+
+from .benchmark_stock_reservations import Command as ReservationBenchmark
+
+
+class Command(ReservationBenchmark):
+    help = (
+        "مقارنة حجز منتج كثير الطلب بصف مخزون واحد وبعدة أجزاء. "
+        "SQLite يسلسل كل الكتابات فلا يظهر الفرق إلا على PostgreSQL حيث الأقفال على مستوى الصف"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--shards', type=int, default=8)
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True):
+            category = Category.objects.create(name="فئة")
+            for label, shards in (("صف واحد", 0), (f"{options['shards']} أجزاء", options['shards'])):
+                product = Product.objects.create(
+                    name=label, description="", sku=f"HOT-{shards}", category=category,
+                    price=10, stock_quantity=options['stock'],
+                )
+                if shards:
+                    shard_stock(product.id, shards=shards)
+                self.run(label, self.reserve, product.id, options)
+
+    def remaining(self, product_id):
+        if Product.objects.filter(pk=product_id, stock_shards=0).exists():
+            return super().remaining(product_id)
+        return StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('quantity'))['total']
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from ecommerce_platform.benchmarks import benchmark_database, format_stats, summarize
+from products.inventory import InsufficientStock, reserve_stock
+from products.models import Category, Product, StockReservation
+
+
+class Command(BaseCommand):
+    help = "قياس حجز المخزون بعدة خيوط على منتج واحد والتحقق من عدم البيع بأكثر من المخزون"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--stock', type=int, default=2000)
+        parser.add_argument('--quantity', type=int, default=1, help="الكمية في كل حجز")
+        parser.add_argument('--naive', action='store_true', help="مقارنة بالطريقة القديمة: قراءة المخزون ثم حفظه")
+
+    def handle(self, *args, **options):
+        with benchmark_database(on_disk=True):
+            category = Category.objects.create(name="فئة")
+            paths = [('reserve_stock()', self.reserve)]
+            if options['naive']:
+                paths.append(("قراءة ثم حفظ", self.naive))
+            for label, func in paths:
+                product = Product.objects.create(
+                    name=label, description="", sku=f"HOT-{len(label)}", category=category,
+                    price=10, stock_quantity=options['stock'],
+                )
+                self.run(label, func, product.id, options)
+
+    def reserve(self, product_id, quantity, reference):
+        reserve_stock([(product_id, None, quantity)], reference=reference)
+
+    def naive(self, product_id, quantity, reference):
+        product = Product.objects.get(pk=product_id)
+        if product.stock_quantity < quantity:
+            raise InsufficientStock(product_id, None, quantity)
+        product.stock_quantity -= quantity
+        product.save(update_fields=['stock_quantity'])
+
+    def remaining(self, product_id):
+        return Product.objects.get(pk=product_id).stock_quantity
+
+    def run(self, label, func, product_id, options):
+        timings = []
+        counters = {'sold': 0, 'retries': 0}
+        lock = threading.Lock()
+
+        def worker(number):
+            local, sold, retries = [], 0, 0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        func(product_id, options['quantity'], f"bench-{number}-{sold}")
+                    except InsufficientStock:
+                        break
+                    except OperationalError:
+                        # SQLite: "database is locked" عند تجاوز مهلة الانتظار
+                        retries += 1
+                        continue
+                    local.append((time.perf_counter() - start) * 1000)
+                    sold += options['quantity']
+            finally:
+                connection.close()
+            with lock:
+                timings.extend(local)
+                counters['sold'] += sold
+                counters['retries'] += retries
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        remaining = self.remaining(product_id)
+        reserved = sum(StockReservation.objects.filter(product_id=product_id).values_list('quantity', flat=True))
+        oversold = counters['sold'] - options['stock']
+        self.stdout.write(f"{label}:")
+        self.stdout.write(
+            f"  المباع {counters['sold']} من {options['stock']}، المتبقي {remaining}، "
+            f"المحجوز {reserved}، بيع زائد {max(oversold, 0)}، إعادة محاولات {counters['retries']}"
+        )
+        self.stdout.write(f"  {len(timings)} حجز في {elapsed:.2f}s ({len(timings) / elapsed:.0f} حجز/ث)")
+        if timings:
+            self.stdout.write("  " + format_stats("زمن الحجز", summarize(timings)))
+        if oversold > 0 or counters['sold'] + remaining != options['stock']:
+            self.stdout.write(self.style.ERROR("  المخزون غير متسق!"))
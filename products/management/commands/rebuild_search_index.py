@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء فهرس البحث النصي للمنتجات"
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.rebuild(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f"تمت إعادة فهرسة المنتجات باستخدام {type(backend).__name__}"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.inventory import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "إعادة مخزون حجوزات إتمام الطلب التي انتهت صلاحيتها دون تأكيد (يشغل دورياً)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"تم إلغاء {released} حجز منتهي الصلاحية"))
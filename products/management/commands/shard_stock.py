@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.inventory import shard_stock, sync_sharded_stock
+from products.models import Product, ProductVariation
+
+
+class Command(BaseCommand):
+    help = "توزيع مخزون منتج كثير الطلب على عدة أجزاء قبل عروض الفلاش، أو دمجها بعد انتهائها (--shards 0)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, help="معرف المنتج")
+        parser.add_argument('--variation', type=int, help="معرف التنويع بدلاً من المنتج")
+        parser.add_argument('--shards', type=int, default=8, help="عدد الأجزاء، و 0 للدمج")
+        parser.add_argument('--sync', action='store_true', help="كتابة مجموع الأجزاء في كمية المخزون فقط")
+
+    def handle(self, *args, **options):
+        if options['sync']:
+            sync_sharded_stock()
+            self.stdout.write(self.style.SUCCESS("تم تحديث كمية المخزون للمنتجات المقسمة"))
+            return
+
+        if options['variation']:
+            product_id = ProductVariation.objects.filter(pk=options['variation']).values_list('product_id', flat=True).first()
+        elif options['product']:
+            product_id = Product.objects.filter(pk=options['product']).values_list('id', flat=True).first()
+        else:
+            raise CommandError("يجب تحديد --product أو --variation")
+        if product_id is None:
+            raise CommandError("المنتج غير موجود")
+        if not 0 <= options['shards'] <= 256:
+            raise CommandError("عدد الأجزاء يجب أن يكون بين 0 و 256")
+
+        total = shard_stock(product_id, options['variation'], shards=options['shards'])
+        if options['shards']:
+            self.stdout.write(self.style.SUCCESS(f"تم توزيع {total} وحدة على {options['shards']} جزء"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"تم دمج الأجزاء: المخزون {total} وحدة"))
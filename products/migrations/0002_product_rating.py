@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:44
+
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Round
+
+
+def copy_ratings(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductRating = apps.get_model('reviews', 'ProductRating')
+    average = ProductRating.objects.filter(product=OuterRef('pk'), review_count__gt=0).annotate(
+        average=Round(Cast('rating_sum', FloatField()) / F('review_count'), 2)
+    ).values('average')
+    Product.objects.update(rating=Coalesce(Subquery(average), 0.0, output_field=models.DecimalField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('reviews', '0002_productrating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='متوسط التقييم'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rating'], name='product_active_rating_idx'),
+        ),
+        migrations.RunPython(copy_ratings, migrations.RunPython.noop),
+    ]
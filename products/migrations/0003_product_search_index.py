@@ -0,0 +1,90 @@
+import re
+
+from django.db import migrations
+
+# نسخة مجمدة من الجداول وتوحيد النص في products.search وقت كتابة هذا الترحيل، حتى لا
+# يتغير الترحيل أو يتعطل مع تعديل الكود لاحقاً. rebuild_search_index يعيد الفهرسة بالكود الحالي
+FIELDS = ('name', 'sku', 'short_description', 'description')
+
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts "
+        "USING fts5(name, sku, short_description, description, tokenize='porter unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS products_product_search ("
+        "product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE "
+        "DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS products_product_search_document_gin "
+        "ON products_product_search USING gin (document)",
+    ],
+}
+
+INSERT_SQL = {
+    'sqlite': (
+        "INSERT OR REPLACE INTO products_product_fts (rowid, name, sku, short_description, description) "
+        "VALUES (%s, %s, %s, %s, %s)"
+    ),
+    'postgresql': (
+        "INSERT INTO products_product_search (product_id, document) VALUES (%s, "
+        "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'C') || setweight(to_tsvector('simple', %s), 'D')) "
+        "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+    ),
+}
+
+DROP_SQL = {
+    'sqlite': "DROP TABLE IF EXISTS products_product_fts",
+    'postgresql': "DROP TABLE IF EXISTS products_product_search",
+}
+
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و', 'ئ': 'ي',
+})
+ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'ال', 'لل')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize_document(text):
+    text = ARABIC_DIACRITICS.sub('', text or '').translate(ARABIC_LETTER_MAP).lower()
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text):
+        for prefix in ARABIC_PREFIXES:
+            if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+                token = token[len(prefix):]
+                break
+        tokens.append(token)
+    return ' '.join(tokens)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    for statement in CREATE_SQL[vendor]:
+        schema_editor.execute(statement)
+    Product = apps.get_model('products', 'Product')
+    with schema_editor.connection.cursor() as cursor:
+        for row in Product.objects.values_list('pk', *FIELDS).iterator(chunk_size=1000):
+            cursor.execute(INSERT_SQL[vendor], [row[0], *(normalize_document(value) for value in row[1:])])
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor in DROP_SQL:
+        schema_editor.execute(DROP_SQL[vendor])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_rating'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
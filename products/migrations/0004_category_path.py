@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    Category = apps.get_model('products', 'Category')
+    paths = {}
+    level = list(Category.objects.filter(parent=None).values_list('id', flat=True))
+    depth = 0
+    while level:
+        children = []
+        for category in Category.objects.filter(id__in=level).values('id', 'parent_id'):
+            path = paths.get(category['parent_id'], '') + f"{category['id']:010d}/"
+            paths[category['id']] = path
+            Category.objects.filter(id=category['id']).update(path=path, depth=depth)
+            children.append(category['id'])
+        level = list(Category.objects.filter(parent_id__in=children).values_list('id', flat=True))
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='العمق'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='المسار'),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='الكمية')),
+                ('reference', models.CharField(max_length=64, verbose_name='المرجع')),
+                ('status', models.CharField(choices=[('reserved', 'محجوز'), ('committed', 'مؤكد'), ('released', 'ملغى')], default='reserved', max_length=20, verbose_name='الحالة')),
+                ('expires_at', models.DateTimeField(verbose_name='ينتهي في')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product', verbose_name='المنتج')),
+                ('variation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.productvariation', verbose_name='التنويع')),
+            ],
+            options={
+                'verbose_name': 'حجز مخزون',
+                'verbose_name_plural': 'حجوزات المخزون',
+                'indexes': [models.Index(fields=['reference', 'status'], name='reservation_reference_idx'), models.Index(condition=models.Q(('status', 'reserved')), fields=['expires_at'], name='reservation_expiry_idx')],
+            },
+        ),
+    ]
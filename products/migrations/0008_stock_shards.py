@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 04:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='أجزاء المخزون'),
+        ),
+        migrations.AddField(
+            model_name='productvariation',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='أجزاء المخزون'),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='رقم الجزء')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='الكمية')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shard_rows', to='products.product', verbose_name='المنتج')),
+                ('variation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.productvariation', verbose_name='التنويع')),
+            ],
+            options={
+                'verbose_name': 'جزء مخزون',
+                'verbose_name_plural': 'أجزاء المخزون',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('variation__isnull', True)), fields=('product', 'shard'), name='stock_shard_product_unique'), models.UniqueConstraint(condition=models.Q(('variation__isnull', False)), fields=('variation', 'shard'), name='stock_shard_variation_unique')],
+            },
+        ),
+    ]
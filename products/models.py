@@ -1,17 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Prefetch, Sum
+from django.db.models.functions import Coalesce, Concat, Substr
+
+class CategoryQuerySet(models.QuerySet):
+    def descendants_of(self, category, include_self=True):
+        """
+        الفئة وكل فروعها بمقارنة نطاق واحد على عمود المسار المفهرس
+        """
+        if not category.path:
+            return self.filter(pk=category.pk) if include_self else self.none()
+        start, end = category.path_range()
+        queryset = self.filter(path__gte=start, path__lt=end)
+        if not include_self:
+            queryset = queryset.exclude(pk=category.pk)
+        return queryset
+
+    def as_tree(self):
+        """
+        تجميع الفئات المجلوبة باستعلام واحد في شجرة؛ كل فئة تحصل على tree_children
+        وتعاد الفئات التي لا يوجد أبوها ضمن النتائج كجذور
+        """
+        nodes = list(self)
+        by_id = {node.pk: node for node in nodes}
+        roots = []
+        for node in nodes:
+            node.tree_children = []
+        for node in nodes:
+            parent = by_id.get(node.parent_id)
+            if parent is not None:
+                parent.tree_children.append(node)
+            else:
+                roots.append(node)
+        return roots
 
 class Category(models.Model):
+    PATH_SEGMENT_WIDTH = 10
+
     name = models.CharField(max_length=100, verbose_name="اسم الفئة")
     description = models.TextField(blank=True, verbose_name="وصف الفئة")
     image = models.ImageField(upload_to='categories/', blank=True, null=True, verbose_name="صورة الفئة")
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, verbose_name="الفئة الأب")
+    # المسار المادي: أرقام الفئات من الجذر حتى الفئة بعرض ثابت، مثل 0000000001/0000000007/
+    path = models.CharField(max_length=255, blank=True, db_index=True, editable=False, verbose_name="المسار")
+    depth = models.PositiveIntegerField(default=0, editable=False, verbose_name="العمق")
     is_active = models.BooleanField(default=True, verbose_name="نشط")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "فئة"
         verbose_name_plural = "الفئات"
@@ -20,6 +62,36 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+    def path_range(self):
+        # '0' هو الحرف التالي لـ '/' فيشمل النطاق كل المسارات التي تبدأ بمسار الفئة
+        return self.path, self.path[:-1] + '0'
+
+    def build_path(self):
+        parent_path = self.parent.path if self.parent_id else ''
+        return f"{parent_path}{self.pk:0{self.PATH_SEGMENT_WIDTH}d}/"
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        if old_path and self.parent_id and self.parent.path.startswith(old_path):
+            raise ValueError("لا يمكن نقل الفئة تحت إحدى فروعها.")
+        super().save(*args, **kwargs)
+        new_path = self.build_path()
+        if new_path == old_path:
+            return
+        new_depth = new_path.count('/') - 1
+        if old_path:
+            # نقل الفئة: تحديث مسارات الفئة وكل فروعها بعبارة واحدة
+            Category.objects.descendants_of(self).update(
+                path=Concat(models.Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=models.F('depth') + (new_depth - self.depth),
+            )
+        else:
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path, self.depth = new_path, new_depth
+
+    def get_descendant_ids(self):
+        return list(Category.objects.descendants_of(self).values_list('id', flat=True))
+
 class Brand(models.Model):
     name = models.CharField(max_length=100, verbose_name="اسم العلامة التجارية")
     description = models.TextField(blank=True, verbose_name="وصف العلامة التجارية")
@@ -36,6 +108,26 @@ class Brand(models.Model):
     def __str__(self):
         return self.name
 
+class ProductQuerySet(models.QuerySet):
+    def with_rating(self):
+        """
+        جلب ملخص التقييمات المعتمدة مع المنتج في نفس الاستعلام
+        """
+        return self.select_related('rating_summary')
+
+    def with_primary_image(self):
+        """
+        جلب صور المنتجات باستعلام واحد مرتبة بحيث تكون الصورة الرئيسية أولاً
+        """
+        return self.prefetch_related(Prefetch(
+            'images',
+            queryset=ProductImage.objects.order_by('-is_primary', 'order', 'created_at'),
+            to_attr='ordered_images',
+        ))
+
+    def for_listing(self):
+        return self.select_related('category', 'brand').with_rating().with_primary_image()
+
 class Product(models.Model):
     name = models.CharField(max_length=200, verbose_name="اسم المنتج")
     description = models.TextField(verbose_name="وصف المنتج")
@@ -48,6 +140,8 @@ class Product(models.Model):
     cost_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="سعر التكلفة")
     stock_quantity = models.PositiveIntegerField(default=0, verbose_name="كمية المخزون")
     low_stock_threshold = models.PositiveIntegerField(default=10, verbose_name="حد المخزون المنخفض")
+    # أكبر من صفر للمنتجات كثيرة الطلب التي يوزع مخزونها على صفوف StockShard
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="أجزاء المخزون")
     weight = models.DecimalField(max_digits=8, decimal_places=2, blank=True, null=True, verbose_name="الوزن (كجم)")
     dimensions = models.CharField(max_length=100, blank=True, verbose_name="الأبعاد")
     is_active = models.BooleanField(default=True, verbose_name="نشط")
@@ -56,24 +150,52 @@ class Product(models.Model):
     requires_shipping = models.BooleanField(default=True, verbose_name="يتطلب شحن")
     meta_title = models.CharField(max_length=200, blank=True, verbose_name="عنوان SEO")
     meta_description = models.CharField(max_length=300, blank=True, verbose_name="وصف SEO")
+    # نسخة مفهرسة من متوسط التقييم في ProductRating لاستخدامها في الفلترة والترتيب
+    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False, verbose_name="متوسط التقييم")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "منتج"
         verbose_name_plural = "المنتجات"
         ordering = ['-created_at']
+        indexes = [
+            # فهارس جزئية للمنتجات النشطة تطابق أعمدة الترتيب مع id لترقيم الصفحات بالمؤشر
+            models.Index(fields=['rating', 'id'], condition=models.Q(is_active=True), name='product_active_rating_idx'),
+            models.Index(fields=['price', 'id'], condition=models.Q(is_active=True), name='product_active_price_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True), name='product_active_created_idx'),
+            models.Index(fields=['name', 'id'], condition=models.Q(is_active=True), name='product_active_name_idx'),
+            # فلاتر القائمة الشائعة مع الترتيب الافتراضي حسب الأحدث
+            models.Index(fields=['category', '-created_at'], condition=models.Q(is_active=True), name='product_active_category_idx'),
+            models.Index(fields=['brand', '-created_at'], condition=models.Q(is_active=True), name='product_active_brand_idx'),
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_active=True, is_featured=True),
+                name='product_featured_created_idx',
+            ),
+            models.Index(
+                fields=['-created_at'], condition=models.Q(is_active=True, stock_quantity__gt=0),
+                name='product_in_stock_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def available_stock(self):
+        if self.stock_shards:
+            return StockShard.cached_total(self.pk, None)
+        return self.stock_quantity
+
     @property
     def is_in_stock(self):
-        return self.stock_quantity > 0
+        return self.available_stock > 0
 
     @property
     def is_low_stock(self):
-        return self.stock_quantity <= self.low_stock_threshold
+        return self.available_stock <= self.low_stock_threshold
 
     @property
     def discount_percentage(self):
@@ -132,6 +254,7 @@ class ProductVariation(models.Model):
     sku = models.CharField(max_length=100, unique=True, verbose_name="رمز التنويع")
     price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True, verbose_name="السعر")
     stock_quantity = models.PositiveIntegerField(default=0, verbose_name="كمية المخزون")
+    stock_shards = models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="أجزاء المخزون")
     is_active = models.BooleanField(default=True, verbose_name="نشط")
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -146,3 +269,85 @@ class ProductVariation(models.Model):
     def final_price(self):
         return self.price if self.price else self.product.price
 
+    @property
+    def available_stock(self):
+        if self.stock_shards:
+            return StockShard.cached_total(self.product_id, self.pk)
+        return self.stock_quantity
+
+
+class StockReservation(models.Model):
+    """
+    كمية محجوزة من مخزون منتج أو تنويع أثناء إتمام الطلب
+    المخزون يخصم عند الحجز، ويعاد إذا ألغي الحجز أو انتهت صلاحيته قبل تأكيده
+    """
+    STATUS_CHOICES = [
+        ('reserved', 'محجوز'),
+        ('committed', 'مؤكد'),
+        ('released', 'ملغى'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations', verbose_name="المنتج")
+    variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, blank=True, null=True, verbose_name="التنويع")
+    quantity = models.PositiveIntegerField(verbose_name="الكمية")
+    reference = models.CharField(max_length=64, verbose_name="المرجع")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='reserved', verbose_name="الحالة")
+    expires_at = models.DateTimeField(verbose_name="ينتهي في")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "حجز مخزون"
+        verbose_name_plural = "حجوزات المخزون"
+        indexes = [
+            models.Index(fields=['reference', 'status'], name='reservation_reference_idx'),
+            models.Index(fields=['expires_at'], condition=models.Q(status='reserved'), name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.reference} - {self.product_id} x {self.quantity}"
+
+
+class StockShard(models.Model):
+    """
+    جزء من مخزون منتج أو تنويع كثير الطلب
+    الخصم يصيب جزءاً عشوائياً فتتوزع أقفال الصفوف بدلاً من تزاحمها على صف واحد
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_rows', verbose_name="المنتج")
+    variation = models.ForeignKey(ProductVariation, on_delete=models.CASCADE, blank=True, null=True, verbose_name="التنويع")
+    shard = models.PositiveSmallIntegerField(verbose_name="رقم الجزء")
+    quantity = models.PositiveIntegerField(default=0, verbose_name="الكمية")
+
+    class Meta:
+        verbose_name = "جزء مخزون"
+        verbose_name_plural = "أجزاء المخزون"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'shard'], condition=models.Q(variation__isnull=True),
+                name='stock_shard_product_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['variation', 'shard'], condition=models.Q(variation__isnull=False),
+                name='stock_shard_variation_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}/{self.variation_id or '-'} #{self.shard}: {self.quantity}"
+
+    @staticmethod
+    def cache_key(product_id, variation_id):
+        return f"stock_shards:total:{product_id}:{variation_id or 0}"
+
+    @classmethod
+    def cached_total(cls, product_id, variation_id):
+        """
+        مجموع الأجزاء من الكاش لمدة قصيرة؛ للعرض فقط، أما الخصم فشرطي على كل جزء
+        """
+        key = cls.cache_key(product_id, variation_id)
+        total = cache.get(key)
+        if total is None:
+            total = cls.objects.filter(product_id=product_id, variation_id=variation_id).aggregate(
+                total=Coalesce(Sum('quantity'), 0)
+            )['total']
+            cache.set(key, total, getattr(settings, 'STOCK_SHARD_CACHE_TIMEOUT', 5))
+        return total
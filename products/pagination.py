@@ -0,0 +1,99 @@
+"""
+ترقيم صفحات قائمة المنتجات
+
+الوضع الافتراضي هو ترقيم الصفحات بالأرقام مع عدد إجمالي محفوظ في الكاش. عند
+تمرير cursor (أو pagination=cursor) يتحول إلى ترقيم بالمؤشر (keyset): الصفحة
+التالية تبدأ بعد آخر قيم الترتيب بدلاً من OFFSET، فتكلف الصفحة 5000 مثل الأولى.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param
+
+from ecommerce_platform.cache import get_model_versions
+from ecommerce_platform.pagination import KeysetPaginationMixin
+from reviews.models import Review
+
+from .models import Brand, Category, Product
+
+DEFAULT_COUNT_TIMEOUT = 300
+
+
+def cached_count(queryset, version_models=()):
+    """
+    عدد نتائج الاستعلام محفوظاً في الكاش حسب نص الاستعلام وإصدارات النماذج
+    """
+    sql, params = queryset.query.sql_with_params()
+    payload = json.dumps([sql, [str(param) for param in params], get_model_versions(version_models)])
+    key = f"queryset_count:{hashlib.md5(payload.encode()).hexdigest()}"
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', DEFAULT_COUNT_TIMEOUT))
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    version_models = ()
+
+    @cached_property
+    def count(self):
+        return cached_count(self.object_list, self.version_models)
+
+
+class ProductPagination(KeysetPaginationMixin, PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'with_count'
+    # أعمدة الترتيب المدعومة في وضع المؤشر؛ يضاف id دائماً لكسر التعادل
+    keyset_fields = ('price', 'created_at', 'name', 'rating', 'search_rank')
+    # search_rank ليس حقلاً في النموذج بل قيمة محسوبة عند البحث
+    computed_fields = {'search_rank': float}
+
+    # النماذج التي يعتمد عليها العدد الإجمالي المحفوظ في الكاش
+    version_models = (Product, Category, Brand, Review)
+
+    def django_paginator_class(self, *args, **kwargs):
+        paginator = CachedCountPaginator(*args, **kwargs)
+        paginator.version_models = self.version_models
+        return paginator
+
+    def is_keyset(self, request):
+        return (
+            self.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.is_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        queryset = self.order_keyset(queryset)
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() == 'true':
+            self.count = cached_count(queryset.order_by(), self.version_models)
+        return self.keyset_page(queryset, request)
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        return self.get_keyset_next_link(
+            remove_query_param(self.request.build_absolute_uri(), self.mode_query_param)
+        )
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
@@ -0,0 +1,198 @@
+"""
+محركات البحث النصي في المنتجات
+
+يتم اختيار المحرك من الإعداد PRODUCT_SEARCH_BACKEND، وإذا لم يحدد فحسب نوع
+قاعدة البيانات: FTS5 مع SQLite، و tsvector/GIN مع PostgreSQL، وإلا البحث
+التقليدي بـ icontains.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# التشكيل وعلامة المد والتطويل
+ARABIC_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و', 'ئ': 'ي',
+})
+ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'ال', 'لل')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalize_arabic(text):
+    """
+    توحيد أشكال الألف والتاء المربوطة والألف المقصورة وحذف التشكيل
+    """
+    if not text:
+        return ''
+    text = ARABIC_DIACRITICS.sub('', text)
+    return text.translate(ARABIC_LETTER_MAP).lower()
+
+
+def stem_token(token):
+    """
+    تجذيع خفيف: حذف أداة التعريف وما يسبقها من حروف العطف والجر
+    """
+    for prefix in ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(text):
+    return [stem_token(token) for token in TOKEN_PATTERN.findall(normalize_arabic(text))]
+
+
+def normalize_document(text):
+    return ' '.join(tokenize(text))
+
+
+class BaseSearchBackend:
+    """
+    الواجهة المشتركة لمحركات البحث
+    search() تعيد الاستعلام بعد الفلترة مع حقل search_rank (الأعلى هو الأكثر صلة)
+    """
+    # الحقول المفهرسة مع وزن كل منها في ترتيب النتائج
+    fields = (('name', 10.0), ('sku', 5.0), ('short_description', 2.0), ('description', 1.0))
+
+    def document(self, product):
+        return [normalize_document(getattr(product, field)) for field, _ in self.fields]
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self, products):
+        for product in products.iterator(chunk_size=1000):
+            self.index_product(product)
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def unranked(self, queryset):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    البحث التقليدي بـ icontains لقواعد البيانات التي لا تدعم البحث النصي
+    """
+
+    def search(self, queryset, query):
+        condition = Q()
+        for term in query.split():
+            term_condition = Q()
+            for field, _ in self.fields:
+                term_condition |= Q(**{f'{field}__icontains': term})
+            condition &= term_condition
+        return self.unranked(queryset.filter(condition))
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    فهرس FTS5 في جدول افتراضي منفصل، رقم الصف فيه هو رقم المنتج؛ ينشأ في الترحيل
+    products/0003_product_search_index
+    """
+    table = 'products_product_fts'
+
+    def index_product(self, product):
+        columns = ', '.join(field for field, _ in self.fields)
+        placeholders = ', '.join(['%s'] * len(self.fields))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {self.table} (rowid, {columns}) VALUES (%s, {placeholders})",
+                [product.pk, *self.document(product)],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid = %s", [product_id])
+
+    def match_expression(self, query):
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return self.unranked(queryset)
+        weights = ', '.join(str(weight) for _, weight in self.fields)
+        table = queryset.model._meta.db_table
+        # ربط جدول FTS مرة واحدة بدلا من استعلام فرعي لكل صف، فيحسب bm25
+        # من نفس عملية MATCH
+        return queryset.extra(
+            tables=[self.table],
+            where=[f"{self.table} MATCH %s", f"{self.table}.rowid = {table}.id"],
+            params=[expression],
+        ).annotate(search_rank=RawSQL(
+            # bm25 تعيد قيمة سالبة كلما زادت الصلة
+            f"-bm25({self.table}, {weights})", [], output_field=FloatField(),
+        ))
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """
+    عمود tsvector في جدول منفصل مع فهرس GIN، ينشآن في الترحيل products/0003_product_search_index
+    """
+    table = 'products_product_search'
+    config = 'simple'
+    weight_labels = ('A', 'B', 'C', 'D')
+
+    def document_sql(self):
+        return ' || '.join(
+            f"setweight(to_tsvector('{self.config}', %s), '{label}')"
+            for label in self.weight_labels[:len(self.fields)]
+        )
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} (product_id, document) VALUES (%s, {self.document_sql()}) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [product.pk, *self.document(product)],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE product_id = %s", [product_id])
+
+    def tsquery(self, query):
+        return ' & '.join(f"{token}:*" for token in tokenize(query))
+
+    def search(self, queryset, query):
+        tsquery = self.tsquery(query)
+        if not tsquery:
+            return self.unranked(queryset)
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[self.table],
+            where=[
+                f"{self.table}.document @@ to_tsquery('{self.config}', %s)",
+                f"{self.table}.product_id = {table}.id",
+            ],
+            params=[tsquery],
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank({self.table}.document, to_tsquery('{self.config}', %s))",
+            [tsquery],
+            output_field=FloatField(),
+        ))
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend():
+    backend_path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return VENDOR_BACKENDS.get(connection.vendor, LikeSearchBackend)()
@@ -1,8 +1,16 @@
 from rest_framework import serializers
+from django.db.models import Q
 from .models import (
     Category, Brand, Product, ProductImage, ProductAttribute, 
     ProductAttributeValue, ProductVariation
 )
+from reviews.models import ProductRating
+
+def get_rating_summary(product):
+    """
+    ملخص التقييمات المحفوظ للمنتج، أو ملخص فارغ إذا لم تكن له مراجعات
+    """
+    return getattr(product, 'rating_summary', None) or ProductRating(product=product)
 
 class CategorySerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
@@ -12,9 +20,13 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'image', 'parent', 'is_active', 'children']
     
     def get_children(self, obj):
-        if obj.category_set.exists():
-            return CategorySerializer(obj.category_set.filter(is_active=True), many=True).data
-        return []
+        children = getattr(obj, 'tree_children', None)
+        if children is None:
+            # تحميل الشجرة الفرعية كاملة باستعلام واحد ثم تجميعها في بايثون
+            nodes = Category.objects.descendants_of(obj).filter(Q(is_active=True) | Q(pk=obj.pk)).as_tree()
+            root = next((node for node in nodes if node.pk == obj.pk), None)
+            children = root.tree_children if root else []
+        return CategorySerializer(children, many=True).data
 
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
@@ -35,6 +47,8 @@ class ProductAttributeValueSerializer(serializers.ModelSerializer):
 
 class ProductVariationSerializer(serializers.ModelSerializer):
     attributes = ProductAttributeValueSerializer(many=True, read_only=True)
+    # مجموع أجزاء المخزون للتنويعات المجزأة، فحقل stock_quantity لا يحدث إلا بعد shard_stock --sync
+    stock_quantity = serializers.IntegerField(source='available_stock', read_only=True)
     final_price = serializers.ReadOnlyField()
     
     class Meta:
@@ -59,28 +73,28 @@ class ProductListSerializer(serializers.ModelSerializer):
         ]
     
     def get_primary_image(self, obj):
-        primary_image = obj.images.filter(is_primary=True).first()
+        # الصور مجلوبة مسبقاً عبر ProductQuerySet.with_primary_image()
+        if hasattr(obj, 'ordered_images'):
+            primary_image = obj.ordered_images[0] if obj.ordered_images else None
+        else:
+            primary_image = obj.images.order_by('-is_primary', 'order', 'created_at').first()
         if primary_image:
             return ProductImageSerializer(primary_image).data
-        first_image = obj.images.first()
-        if first_image:
-            return ProductImageSerializer(first_image).data
         return None
     
     def get_average_rating(self, obj):
-        reviews = obj.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 1)
-        return 0
+        return get_rating_summary(obj).average_rating
     
     def get_review_count(self, obj):
-        return obj.reviews.filter(is_approved=True).count()
+        return get_rating_summary(obj).review_count
 
 class ProductDetailSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     variations = ProductVariationSerializer(many=True, read_only=True)
+    # مثل التنويعات: المخزون المتاح من الأجزاء ليتفق مع ما يسمح به reserve_stock
+    stock_quantity = serializers.IntegerField(source='available_stock', read_only=True)
     is_in_stock = serializers.ReadOnlyField()
     is_low_stock = serializers.ReadOnlyField()
     discount_percentage = serializers.ReadOnlyField()
@@ -99,20 +113,13 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         ]
     
     def get_average_rating(self, obj):
-        reviews = obj.reviews.filter(is_approved=True)
-        if reviews.exists():
-            return round(sum(review.rating for review in reviews) / reviews.count(), 1)
-        return 0
+        return get_rating_summary(obj).average_rating
     
     def get_review_count(self, obj):
-        return obj.reviews.filter(is_approved=True).count()
+        return get_rating_summary(obj).review_count
     
     def get_rating_distribution(self, obj):
-        reviews = obj.reviews.filter(is_approved=True)
-        distribution = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-        for review in reviews:
-            distribution[review.rating] += 1
-        return distribution
+        return get_rating_summary(obj).rating_distribution
 
 class ProductCreateUpdateSerializer(serializers.ModelSerializer):
     class Meta:
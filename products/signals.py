@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from ecommerce_platform.cache import track_model_versions
+from reviews.models import Review
+from .models import (
+    Brand, Category, Product, ProductImage, ProductAttribute, ProductAttributeValue, ProductVariation
+)
+from .search import get_search_backend
+from .suggestions import suggestion_index
+
+SUGGESTION_KINDS = {Product: 'products', Category: 'categories', Brand: 'brands'}
+
+# أرقام الإصدارات المستخدمة في مفاتيح كاش الاستجابات و facets؛
+# المراجعات تغير ملخص التقييم و Product.rating عبر update() دون إشارات خاصة بها
+track_model_versions(
+    Category, Brand, Product, ProductImage, ProductAttribute, ProductAttributeValue,
+    ProductVariation, Review,
+)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Brand)
+def update_suggestions(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    kind = SUGGESTION_KINDS[sender]
+    transaction.on_commit(
+        lambda: suggestion_index.update(kind, instance.pk, instance.name, instance.is_active)
+    )
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Brand)
+def remove_from_suggestions(sender, instance, **kwargs):
+    kind, entry_id = SUGGESTION_KINDS[sender], instance.pk
+    transaction.on_commit(lambda: suggestion_index.remove(kind, entry_id))
+
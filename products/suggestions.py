@@ -0,0 +1,247 @@
+"""
+فهرس بادئات في الذاكرة لاقتراحات البحث
+
+يحمل كل نوع (منتجات، فئات، علامات تجارية) مصفوفة مرتبة من المفاتيح، والمفتاح
+هو الاسم بعد التوحيد بدءاً من كل كلمة فيه، فيتم البحث بـ bisect دون لمس قاعدة
+البيانات. يبنى الفهرس عند أول طلب ويحدّث تدريجياً عبر الإشارات، ويعاد بناؤه
+بعد SUGGESTION_INDEX_TTL ثانية لالتقاط تغييرات العمليات الأخرى.
+"""
+import heapq
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+
+from .search import normalize_arabic
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_MAX_ENTRIES = 100_000
+DEFAULT_MAX_CACHED_RESULTS = 1024
+DEFAULT_TTL = 300
+
+
+def index_keys(name):
+    """
+    مفاتيح الاسم: النص الموحد بدءاً من كل كلمة
+    """
+    words = normalize_arabic(name).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """
+    مصفوفة مرتبة من (المفتاح، المعرف) مع جدول للأسماء والشعبية
+
+    التعديلات تتم في مكانها تحت قفل بدلاً من نسخ المصفوفة والجدول مع كل حفظ: الإضافة
+    والحذف بـ bisect (إزاحة في المصفوفة فقط)، وأضعف عنصر عند امتلاء الفهرس من كومة
+    الشعبية بدلاً من المرور على كل العناصر. نتائج البحث الأخيرة تحفظ في كاش LRU
+    محدود الحجم يفرغ مع كل تعديل.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_cached_results=DEFAULT_MAX_CACHED_RESULTS):
+        self.max_entries = max_entries
+        self.max_cached_results = max_cached_results
+        self._lock = threading.Lock()
+        self._keys = []
+        self._entries = {}
+        # (الشعبية، المعرف)؛ العناصر المحذوفة أو المعدلة تبقى حتى تصل لرأس الكومة
+        self._weakest = []
+        self._results = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, rows):
+        """
+        rows: (المعرف، الاسم، الشعبية)، يحتفظ بالأكثر شعبية فقط عند تجاوز الحد
+        """
+        rows = heapq.nlargest(self.max_entries, rows, key=lambda row: row[2])
+        entries = {entry_id: (name, popularity) for entry_id, name, popularity in rows}
+        keys = sorted((key, entry_id) for entry_id, name, _ in rows for key in index_keys(name))
+        weakest = [(popularity, entry_id) for entry_id, (_, popularity) in entries.items()]
+        heapq.heapify(weakest)
+        with self._lock:
+            self._keys, self._entries, self._weakest = keys, entries, weakest
+            self._results.clear()
+
+    def add(self, entry_id, name, popularity=None):
+        with self._lock:
+            entries = self._entries
+            if entry_id in entries:
+                if popularity is None:
+                    popularity = entries[entry_id][1]
+                self._discard(entry_id)
+            popularity = popularity or 0
+            if len(entries) >= self.max_entries:
+                weakest = self._pop_weakest()
+                if entries[weakest][1] >= popularity:
+                    return
+                self._discard(weakest)
+            entries[entry_id] = (name, popularity)
+            for key in index_keys(name):
+                insort(self._keys, (key, entry_id))
+            self._push_weakest(popularity, entry_id)
+            self._results.clear()
+
+    def remove(self, entry_id):
+        with self._lock:
+            if entry_id in self._entries:
+                self._discard(entry_id)
+                self._results.clear()
+
+    def _discard(self, entry_id):
+        keys = self._keys
+        name, _ = self._entries.pop(entry_id)
+        for key in index_keys(name):
+            position = bisect_left(keys, (key, entry_id))
+            if position < len(keys) and keys[position] == (key, entry_id):
+                del keys[position]
+
+    def _push_weakest(self, popularity, entry_id):
+        heapq.heappush(self._weakest, (popularity, entry_id))
+        if len(self._weakest) > 2 * len(self._entries) + 16:
+            # تنظيف العناصر القديمة من الكومة بين حين وآخر حتى لا تكبر مع التعديلات
+            self._weakest = [(value, key) for key, (_, value) in self._entries.items()]
+            heapq.heapify(self._weakest)
+
+    def _pop_weakest(self):
+        """
+        معرف أقل العناصر شعبية مع إبقائه في الكومة؛ يتخطى العناصر القديمة
+        """
+        weakest, entries = self._weakest, self._entries
+        while True:
+            popularity, entry_id = weakest[0]
+            if entry_id in entries and entries[entry_id][1] == popularity:
+                return entry_id
+            heapq.heappop(weakest)
+
+    def search(self, prefix, limit):
+        with self._lock:
+            results = self._results.get((prefix, limit))
+            if results is not None:
+                self._results.move_to_end((prefix, limit))
+                return results
+            keys, entries = self._keys, self._entries
+            start = bisect_left(keys, (prefix,))
+            end = bisect_left(keys, (prefix + '\uffff',))
+            matches = {entry_id for _, entry_id in keys[start:end]}
+            best = heapq.nlargest(limit, matches, key=lambda entry_id: (entries[entry_id][1], -entry_id))
+            results = [{'id': entry_id, 'name': entries[entry_id][0]} for entry_id in best]
+            if self.max_cached_results:
+                self._results[(prefix, limit)] = results
+                if len(self._results) > self.max_cached_results:
+                    self._results.popitem(last=False)
+            return results
+
+    def memory_usage(self):
+        """
+        تقدير تقريبي لحجم الفهرس مع كاش النتائج بالبايت
+        """
+        with self._lock:
+            keys, entries, results = self._keys, self._entries, self._results
+            size = sys.getsizeof(keys) + sys.getsizeof(entries) + sys.getsizeof(self._weakest)
+            size += sum(sys.getsizeof(item) + sys.getsizeof(item[0]) for item in keys)
+            size += sum(sys.getsizeof(entry) + sys.getsizeof(entry[0]) for entry in entries.values())
+            size += sum(sys.getsizeof(item) for item in self._weakest)
+            size += sys.getsizeof(results)
+            for (prefix, _), items in results.items():
+                size += sys.getsizeof(prefix) + sys.getsizeof(items)
+                size += sum(sys.getsizeof(item) + sys.getsizeof(item['name']) for item in items)
+            return size
+
+
+class SuggestionIndex:
+    """
+    فهارس المنتجات والفئات والعلامات التجارية مع حدود النتائج لكل نوع
+    """
+    limits = {'products': 5, 'categories': 3, 'brands': 3}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._indexes = None
+        self._built_at = 0
+
+    @property
+    def max_entries(self):
+        return getattr(settings, 'SUGGESTION_INDEX_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+    @property
+    def max_cached_results(self):
+        return getattr(settings, 'SUGGESTION_RESULT_CACHE_SIZE', DEFAULT_MAX_CACHED_RESULTS)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'SUGGESTION_INDEX_TTL', DEFAULT_TTL)
+
+    def build(self):
+        from orders.models import OrderItem
+        from .models import Brand, Category, Product
+
+        # الشعبية: الكمية المباعة للمنتجات، وعدد المنتجات النشطة للفئات والعلامات
+        sales = dict(
+            OrderItem.objects.order_by().values_list('product_id').annotate(sold=Sum('quantity'))
+        )
+        active_products = Count('product', filter=Q(product__is_active=True))
+        indexes = {name: PrefixIndex(self.max_entries, self.max_cached_results) for name in self.limits}
+        indexes['products'].load(
+            (product_id, name, sales.get(product_id, 0))
+            for product_id, name in Product.objects.filter(is_active=True).values_list('id', 'name')
+        )
+        indexes['categories'].load(
+            Category.objects.filter(is_active=True).annotate(popularity=active_products)
+            .values_list('id', 'name', 'popularity')
+        )
+        indexes['brands'].load(
+            Brand.objects.filter(is_active=True).annotate(popularity=active_products)
+            .values_list('id', 'name', 'popularity')
+        )
+        with self._lock:
+            self._indexes = indexes
+            self._built_at = time.monotonic()
+        return indexes
+
+    def get_indexes(self):
+        indexes = self._indexes
+        if indexes is None:
+            with self._build_lock:
+                indexes = self._indexes or self.build()
+        elif time.monotonic() - self._built_at > self.ttl and self._build_lock.acquire(blocking=False):
+            # خيط واحد يعيد البناء بينما يستمر الباقون على الفهرس الحالي
+            try:
+                indexes = self.build()
+            finally:
+                self._build_lock.release()
+        return indexes
+
+    def suggest(self, query):
+        prefix = ' '.join(normalize_arabic(query).split())
+        indexes = self.get_indexes()
+        return {name: indexes[name].search(prefix, limit) for name, limit in self.limits.items()}
+
+    def update(self, kind, entry_id, name, is_active):
+        """
+        تحديث عنصر واحد عند حفظه؛ لا شيء قبل بناء الفهرس لأول مرة
+        """
+        if self._indexes is None:
+            return
+        with self._lock:
+            index = self._indexes[kind]
+            if is_active:
+                index.add(entry_id, name)
+            else:
+                index.remove(entry_id)
+
+    def remove(self, kind, entry_id):
+        self.update(kind, entry_id, None, is_active=False)
+
+    def reset(self):
+        with self._lock:
+            self._indexes = None
+
+
+suggestion_index = SuggestionIndex()
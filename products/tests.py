@@ -1,3 +1,644 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ecommerce_platform.testing import ProductFactoryMixin, QueryPlanTestMixin
+from reviews.models import Review
+from .filters import ProductFilter, filter_products
+from .inventory import (
+    InsufficientStock, commit_reservations, release_expired_reservations, release_reservations, reserve_stock,
+    shard_stock, sync_sharded_stock,
+)
+from .models import Category, Brand, Product, ProductImage, ProductVariation, StockReservation, StockShard
+from .search import normalize_arabic, tokenize
+from .suggestions import PrefixIndex, suggestion_index
+
+
+class CatalogTestMixin(ProductFactoryMixin):
+    """
+    أدوات مشتركة لإنشاء بيانات الكتالوج في الاختبارات
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="إلكترونيات")
+        self.brand = Brand.objects.create(name="سامسونج")
+
+    def create_reviews(self, product, ratings, is_approved=True):
+        for rating in ratings:
+            user = User.objects.create_user(username=f"user-{product.id}-{User.objects.count()}")
+            Review.objects.create(
+                product=product, user=user, rating=rating,
+                title="عنوان", comment="تعليق", is_approved=is_approved,
+            )
+
+
+class ProductListQueryCountTests(CatalogTestMixin, TestCase):
+    def create_catalog(self, size, start=0):
+        for index in range(start, start + size):
+            product = self.create_product(index, is_featured=True)
+            ProductImage.objects.create(product=product, image='products/a.jpg', order=1)
+            ProductImage.objects.create(product=product, image='products/b.jpg', is_primary=True, order=2)
+            self.create_reviews(product, [4, 5])
+            self.create_reviews(product, [1], is_approved=False)
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.create_catalog(2)
+        small = {
+            name: self.count_queries(reverse(name))
+            for name in ['products:product-list', 'products:featured-products']
+        }
+        self.create_catalog(10, start=100)
+        for name, expected in small.items():
+            self.assertEqual(self.count_queries(reverse(name)), expected)
+
+    def test_related_products_query_count(self):
+        self.create_catalog(3)
+        product = Product.objects.first()
+        url = reverse('products:related-products', args=[product.id])
+        expected = self.count_queries(url)
+        self.create_catalog(6, start=100)
+        self.assertEqual(self.count_queries(url), expected)
+
+    def test_rating_and_primary_image_values(self):
+        self.create_catalog(1)
+        response = self.client.get(reverse('products:product-list'))
+        item = response.data['results'][0]
+        self.assertEqual(item['average_rating'], 4.5)
+        self.assertEqual(item['review_count'], 2)
+        self.assertTrue(item['primary_image']['is_primary'])
+
+    def test_product_without_reviews_or_images(self):
+        self.create_product(1)
+        response = self.client.get(reverse('products:product-list'))
+        item = response.data['results'][0]
+        self.assertEqual(item['average_rating'], 0)
+        self.assertEqual(item['review_count'], 0)
+        self.assertIsNone(item['primary_image'])
+
+
+class ProductRatingFilterTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.low = self.create_product(1)
+        self.high = self.create_product(2)
+        self.top = self.create_product(3)
+        self.create_reviews(self.low, [2, 3])
+        self.create_reviews(self.high, [4, 4, 5])
+        self.create_reviews(self.top, [5])
+
+    def test_rating_column_follows_reviews(self):
+        self.high.refresh_from_db()
+        self.assertEqual(self.high.rating, Decimal('4.33'))
+        self.high.reviews.filter(rating=4).delete()
+        self.high.refresh_from_db()
+        self.assertEqual(self.high.rating, Decimal('5.00'))
+
+    def test_min_rating_with_rating_ordering(self):
+        response = self.client.get(reverse('products:product-list'), {'min_rating': '4', 'ordering': '-rating'})
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, [self.top.id, self.high.id])
+
+    def test_invalid_min_rating_is_ignored(self):
+        response = self.client.get(reverse('products:product-list'), {'min_rating': 'abc'})
+        self.assertEqual(response.data['count'], 3)
+
+    def test_min_rating_query_uses_index(self):
+        queryset = Product.objects.filter(is_active=True, rating__gte=4).order_by('-rating')
+        self.assertIn('product_active_rating_idx', queryset.explain())
+
+
+class ProductSearchTests(CatalogTestMixin, TestCase):
+    def search(self, query, **params):
+        response = self.client.get(reverse('products:product-list'), {'search': query, **params})
+        return [item['id'] for item in response.data['results']]
+
+    def test_normalize_arabic(self):
+        self.assertEqual(normalize_arabic('إِسْلامِيّةٌ'), 'اسلاميه')
+        self.assertEqual(normalize_arabic('آمنة'), 'امنه')
+        self.assertEqual(tokenize('المكتبة'), ['مكتبه'])
+
+    def test_arabic_variants_match(self):
+        product = self.create_product(1, name="مكتبة أحمد الإسلامية")
+        self.create_product(2, name="هاتف ذكي")
+        self.assertEqual(self.search('اسلاميه'), [product.id])
+        self.assertEqual(self.search('مَكْتَبَة احمد'), [product.id])
+
+    def test_prefix_and_sku_match(self):
+        product = self.create_product(1, name="Galaxy phone", sku="GX-900")
+        self.assertEqual(self.search('gal'), [product.id])
+        self.assertEqual(self.search('GX-900'), [product.id])
+
+    def test_results_ranked_by_relevance(self):
+        in_description = self.create_product(1, name="حقيبة", description="مناسبة للكاميرا")
+        in_name = self.create_product(2, name="كاميرا رقمية")
+        self.assertEqual(self.search('كاميرا'), [in_name.id, in_description.id])
+        self.assertEqual(
+            self.search('كاميرا', ordering='created_at'), [in_description.id, in_name.id]
+        )
+
+    def test_rank_computed_in_single_match(self):
+        for index in range(3):
+            self.create_product(index, name=f"كاميرا {index}")
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(self.search('كاميرا')), 3)
+        listing = [query['sql'] for query in context.captured_queries if 'bm25' in query['sql']]
+        self.assertEqual(len(listing), 1)
+        self.assertEqual(listing[0].count('MATCH'), 1)
+
+    def test_index_follows_save_and_delete(self):
+        product = self.create_product(1, name="ساعة")
+        product.name = "نظارة"
+        product.save()
+        self.assertEqual(self.search('ساعة'), [])
+        self.assertEqual(self.search('نظارة'), [product.id])
+        product.delete()
+        self.assertEqual(self.search('نظارة'), [])
+
+    def test_query_without_terms(self):
+        self.create_product(1)
+        self.assertEqual(len(self.search('!!')), 1)
+
+
+class SearchSuggestionTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        suggestion_index.reset()
+        self.addCleanup(suggestion_index.reset)
+
+    def suggest(self, query):
+        return self.client.get(reverse('products:search-suggestions'), {'q': query}).data
+
+    def test_prefix_of_any_word_with_normalization(self):
+        product = self.create_product(1, name="مكتبة أحمد الإسلامية")
+        self.create_product(2, name="هاتف")
+        data = self.suggest('احم')
+        self.assertEqual(data['products'], [{'id': product.id, 'name': product.name}])
+        self.assertEqual(self.suggest('الاسلاميه')['products'][0]['id'], product.id)
+        self.assertEqual(data['brands'], [])
+
+    def test_warm_index_does_not_query_database(self):
+        self.create_product(1, name="Galaxy")
+        self.suggest('ga')
+        with self.assertNumQueries(0):
+            data = self.suggest('gal')
+        self.assertEqual(len(data['products']), 1)
+        self.assertEqual(data['brands'], [])
+
+    def test_signals_refresh_index(self):
+        product = self.create_product(1, name="Camera")
+        self.suggest('ca')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = "Lens"
+            product.save()
+            Brand.objects.create(name="Canon")
+        self.assertEqual(self.suggest('ca')['products'], [])
+        self.assertEqual(self.suggest('le')['products'][0]['id'], product.id)
+        self.assertEqual(self.suggest('ca')['brands'][0]['name'], "Canon")
+        with self.captureOnCommitCallbacks(execute=True):
+            product.is_active = False
+            product.save()
+        self.assertEqual(self.suggest('le')['products'], [])
+
+    def test_short_query(self):
+        self.assertEqual(self.suggest('a'), [])
+
+
+class PrefixIndexTests(TestCase):
+    def test_ranked_by_popularity(self):
+        index = PrefixIndex()
+        index.load([(1, "Phone basic", 3), (2, "Phone pro", 10), (3, "Tablet", 50)])
+        self.assertEqual([item['id'] for item in index.search('phone', 5)], [2, 1])
+        self.assertEqual([item['id'] for item in index.search('pro', 5)], [2])
+
+    def test_max_entries_keeps_most_popular(self):
+        index = PrefixIndex(max_entries=2)
+        index.load([(1, "a1", 1), (2, "a2", 5), (3, "a3", 9)])
+        self.assertEqual(len(index), 2)
+        index.add(4, "a4", popularity=0)
+        self.assertEqual([item['id'] for item in index.search('a', 5)], [3, 2])
+        index.add(5, "a5", popularity=7)
+        self.assertEqual([item['id'] for item in index.search('a', 5)], [3, 5])
+        self.assertGreater(index.memory_usage(), 0)
+
+    def test_weakest_entry_follows_updates(self):
+        index = PrefixIndex(max_entries=3)
+        index.load([(1, "a1", 1), (2, "a2", 5), (3, "a3", 9)])
+        # رفع شعبية الأضعف يجعل التالي هو المستبعد
+        index.add(1, "a1", popularity=8)
+        index.remove(3)
+        index.add(3, "a3", popularity=9)
+        index.add(4, "a4", popularity=6)
+        self.assertEqual([item['id'] for item in index.search('a', 5)], [3, 1, 4])
+        index.add(5, "a5", popularity=2)
+        self.assertEqual(len(index), 3)
+        self.assertEqual([item['id'] for item in index.search('a', 5)], [3, 1, 4])
+
+    def test_result_cache_is_bounded_lru(self):
+        index = PrefixIndex(max_cached_results=2)
+        index.load([(1, "alpha", 1), (2, "beta", 2), (3, "gamma", 3)])
+        empty = index.memory_usage()
+        index.search('al', 5)
+        index.search('be', 5)
+        index.search('al', 5)
+        index.search('ga', 5)
+        self.assertEqual(list(index._results), [('al', 5), ('ga', 5)])
+        self.assertGreater(index.memory_usage(), empty)
+
+        for number in range(100):
+            index.search(f"x{number}", 5)
+        self.assertEqual(len(index._results), 2)
+
+        index.add(4, "alps", popularity=4)
+        self.assertEqual(len(index._results), 0)
+        self.assertEqual([item['id'] for item in index.search('al', 5)], [4, 1])
+
+
+class ProductFacetTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_brand = Brand.objects.create(name="أبل")
+        self.create_product(1, price=Decimal('30.00'), is_featured=True)
+        self.create_product(2, price=Decimal('120.00'), stock_quantity=0)
+        self.create_product(3, price=Decimal('700.00'), brand=self.other_brand)
+
+    def facets(self, **params):
+        return self.client.get(reverse('products:product-filters'), params).data
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            data = self.facets()
+        self.assertEqual(data['total'], 3)
+        self.assertEqual(data['price_range'], {'min_price': Decimal('30.00'), 'max_price': Decimal('700.00')})
+        self.assertEqual(
+            [(bucket['min'], bucket['count']) for bucket in data['price_buckets']],
+            [(0, 1), (100, 1), (500, 1)],
+        )
+        self.assertEqual(
+            [(brand['id'], brand['count']) for brand in data['brands']],
+            [(self.brand.id, 2), (self.other_brand.id, 1)],
+        )
+        self.assertEqual(data['in_stock'], {'true': 2, 'false': 1})
+        self.assertEqual(data['featured'], {'true': 1, 'false': 2})
+
+    def test_active_filters_apply_to_other_facets(self):
+        data = self.facets(brand=self.brand.id, in_stock_only='true')
+        self.assertEqual(data['total'], 1)
+        # عدد العلامات التجارية يتجاهل فلتر العلامة نفسه
+        self.assertEqual([brand['count'] for brand in data['brands']], [1, 1])
+        self.assertEqual(data['in_stock'], {'true': 1, 'false': 1})
+        self.assertEqual(self.facets(max_price='100')['total'], 1)
+
+    def test_cached_by_normalized_filters_and_invalidated(self):
+        self.facets(min_price='10')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets(min_price='10.00')['total'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(4, price=Decimal('15.00'))
+        self.assertEqual(self.facets(min_price='10')['total'], 4)
+
+    def test_search_total_matches_product_list(self):
+        self.create_product(4, name="كتاب بر الوالدين")
+        # "الوالدين" إذا جذع مرتين يصبح "دين" فيطابق هذين بدلاً منه
+        self.create_product(5, name="دينار قديم")
+        self.create_product(6, name="دين عام")
+        listed = self.client.get(reverse('products:product-list'), {'search': "الوالدين"}).data
+        self.assertEqual([product['name'] for product in listed['results']], ["كتاب بر الوالدين"])
+        self.assertEqual(self.facets(search="الوالدين")['total'], 1)
+
+    def test_search_cache_key_ignores_spelling_variants(self):
+        self.create_product(4, name="أحمد")
+        self.assertEqual(self.facets(search="أحمد")['total'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.facets(search="  احمد ")['total'], 1)
+
+
+class CategoryTreeTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.phones = Category.objects.create(name="هواتف", parent=self.category)
+        self.smart = Category.objects.create(name="ذكية", parent=self.phones)
+        self.hidden = Category.objects.create(name="مخفية", parent=self.category, is_active=False)
+        self.orphan = Category.objects.create(name="تحت المخفية", parent=self.hidden)
+
+    def test_paths_and_depth(self):
+        self.assertEqual(self.smart.path, f"{self.category.pk:010d}/{self.phones.pk:010d}/{self.smart.pk:010d}/")
+        self.assertEqual(self.smart.depth, 2)
+        self.assertCountEqual(
+            self.category.get_descendant_ids(),
+            [self.category.pk, self.phones.pk, self.smart.pk, self.hidden.pk, self.orphan.pk],
+        )
+
+    def test_moving_category_updates_subtree(self):
+        other = Category.objects.create(name="أخرى")
+        self.phones.parent = other
+        self.phones.save()
+        self.smart.refresh_from_db()
+        self.assertTrue(self.smart.path.startswith(other.path))
+        self.assertEqual(self.smart.depth, 2)
+        self.assertNotIn(self.smart.pk, self.category.get_descendant_ids())
+
+    def test_cannot_move_under_descendant(self):
+        self.category.parent = self.smart
+        with self.assertRaises(ValueError):
+            self.category.save()
+
+    def test_category_list_loads_tree_in_one_query(self):
+        Category.objects.create(name="جذر آخر")
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('products:category-list'))
+        roots = response.data['results']
+        self.assertEqual([root['name'] for root in roots], ["إلكترونيات", "جذر آخر"])
+        self.assertEqual([child['name'] for child in roots[0]['children']], ["هواتف"])
+        self.assertEqual(roots[0]['children'][0]['children'][0]['name'], "ذكية")
+
+    def test_category_detail_subtree(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('products:category-detail', args=[self.phones.pk]))
+        self.assertEqual([child['name'] for child in response.data['children']], ["ذكية"])
+
+    def test_product_filter_includes_subcategories(self):
+        in_parent = self.create_product(1)
+        in_child = self.create_product(2, category=self.smart)
+        self.create_product(3, category=Category.objects.create(name="منفصلة"))
+        response = self.client.get(reverse('products:product-list'), {'category': self.category.pk})
+        self.assertCountEqual([item['id'] for item in response.data['results']], [in_parent.id, in_child.id])
+        response = self.client.get(reverse('products:product-filters'), {'category': self.phones.pk})
+        self.assertEqual(response.data['total'], 1)
+
+
+class ProductCursorPaginationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # أسعار مكررة لاختبار كسر التعادل بـ id
+        for index in range(7):
+            self.create_product(index, name=f"منتج {index % 3}", price=Decimal(10 + index % 3))
+
+    def walk(self, params, page_size=3):
+        url = reverse('products:product-list')
+        params = {'pagination': 'cursor', 'page_size': page_size, **params}
+        ids = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url, params = response.data['next'], None
+        return ids
+
+    def test_every_ordering_matches_full_listing(self):
+        for ordering in ['price', '-price', 'name', '-name', 'created_at', '-created_at', 'rating']:
+            with self.subTest(ordering=ordering):
+                tiebreak = '-id' if ordering.startswith('-') else 'id'
+                expected = list(
+                    Product.objects.order_by(ordering, tiebreak).values_list('id', flat=True)
+                )
+                self.assertEqual(self.walk({'ordering': ordering}, page_size=2), expected)
+
+    def test_search_ordering_by_rank(self):
+        expected = self.walk({'search': 'منتج'}, page_size=100)
+        self.assertEqual(self.walk({'search': 'منتج'}, page_size=2), expected)
+        self.assertEqual(len(expected), 7)
+
+    def test_deep_page_uses_keyset_without_offset_or_count(self):
+        response = self.client.get(reverse('products:product-list'), {'pagination': 'cursor', 'page_size': 3})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(response.data['next'])
+        self.assertNotIn('count', response.data)
+        sql = ' '.join(query['sql'] for query in context.captured_queries)
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_optional_count_is_cached(self):
+        params = {'pagination': 'cursor', 'with_count': 'true'}
+        url = reverse('products:product-list')
+        self.assertEqual(self.client.get(url, params).data['count'], 7)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url, params).data['count'], 7)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in context.captured_queries))
+
+        # إضافة منتج تغير إصدار النموذج فيعاد الحساب
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product(99)
+        self.assertEqual(self.client.get(url, params).data['count'], 8)
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse('products:product-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get(reverse('products:product-list'))
+        self.assertEqual(response.data['count'], 7)
+        self.assertIn('previous', response.data)
+
+
+class ProductQueryPlanTests(CatalogTestMixin, QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.active = Product.objects.filter(is_active=True)
+
+    def test_listing_orderings_use_indexes(self):
+        for ordering, index_name in [
+            ('-created_at', 'product_active_created_idx'),
+            ('price', 'product_active_price_idx'),
+            ('-name', 'product_active_name_idx'),
+            ('-rating', 'product_active_rating_idx'),
+        ]:
+            with self.subTest(ordering=ordering):
+                self.assertUsesIndex(self.active.for_listing().order_by(ordering, 'id'), index_name)
+
+    def test_listing_filters_use_indexes(self):
+        params = [{'in_stock_only': 'true'}, {'min_rating': '4'}, {'min_price': '10', 'max_price': '50'}]
+        for query in params:
+            with self.subTest(params=query):
+                self.assertUsesIndex(filter_products(self.active, query).order_by('-created_at'))
+
+        self.assertUsesIndex(self.active.filter(brand=self.brand))
+        self.assertUsesIndex(self.active.filter(is_featured=True), 'product_featured_created_idx')
+        self.assertUsesIndex(ProductFilter({'category': self.category.id}, queryset=self.active).qs)
+
+    def test_category_subtree_uses_path_index(self):
+        self.assertUsesIndex(Category.objects.descendants_of(self.category))
+
+
+class StockReservationTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = self.create_product(1, stock_quantity=5)
+        self.second = self.create_product(2, stock_quantity=2)
+        self.variation = ProductVariation.objects.create(product=self.second, sku="VAR-2", stock_quantity=3)
+
+    def stock(self, obj):
+        obj.refresh_from_db(fields=['stock_quantity'])
+        return obj.stock_quantity
+
+    def test_reserve_decrements_all_lines(self):
+        reservations = reserve_stock([
+            (self.first.id, None, 2), (self.second.id, self.variation.id, 3), (self.first.id, None, 1),
+        ], reference="cart-1")
+        self.assertEqual(len(reservations), 2)
+        self.assertEqual(self.stock(self.first), 2)
+        self.assertEqual(self.stock(self.variation), 0)
+        self.assertEqual(self.stock(self.second), 2)
+
+    def test_insufficient_line_rolls_back_whole_order(self):
+        with self.assertRaises(InsufficientStock) as context:
+            reserve_stock([(self.first.id, None, 2), (self.second.id, None, 3)], reference="cart-1")
+        self.assertEqual(context.exception.product_id, self.second.id)
+        self.assertEqual(self.stock(self.first), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_one_update_per_table_in_deterministic_order(self):
+        extra = [self.create_product(index, stock_quantity=5) for index in range(3, 13)]
+        with CaptureQueriesContext(connection) as context:
+            reserve_stock([
+                (self.second.id, self.variation.id, 1), (self.second.id, None, 1), (self.first.id, None, 1),
+                *[(product.id, None, 1) for product in extra],
+            ], reference="cart-1")
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertIn('"products_product"', updates[0])
+        self.assertIn('"products_productvariation"', updates[1])
+        self.assertEqual(self.stock(extra[0]), 4)
+        self.assertEqual(self.stock(self.variation), 2)
+
+    def test_release_restores_stock_once(self):
+        reserve_stock([(self.first.id, None, 4)], reference="cart-1")
+        reservations = StockReservation.objects.filter(reference="cart-1")
+        self.assertEqual(release_reservations(reservations), 1)
+        self.assertEqual(release_reservations(reservations), 0)
+        self.assertEqual(self.stock(self.first), 5)
+
+    def test_expired_reservations_are_released_unless_committed(self):
+        reserve_stock([(self.first.id, None, 2)], reference="expired", ttl=-1)
+        reserve_stock([(self.first.id, None, 1)], reference="committed", ttl=-1)
+        reserve_stock([(self.second.id, None, 1)], reference="active")
+        self.assertEqual(commit_reservations("committed"), 1)
+
+        self.assertEqual(release_expired_reservations(), 1)
+        self.assertEqual(self.stock(self.first), 4)
+        self.assertEqual(self.stock(self.second), 1)
+        self.assertEqual(
+            dict(StockReservation.objects.values_list('reference', 'status')),
+            {'expired': 'released', 'committed': 'committed', 'active': 'reserved'},
+        )
+
+    def test_cached_product_detail_reflects_reserved_stock(self):
+        url = reverse('products:product-detail', args=[self.first.id])
+        self.assertEqual(self.client.get(url).data['stock_quantity'], 5)
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock([(self.first.id, None, 5)], reference="cart-1")
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['stock_quantity'], 0)
+        self.assertFalse(response.data['is_in_stock'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservations(StockReservation.objects.filter(reference="cart-1"))
+        self.assertEqual(self.client.get(url).data['stock_quantity'], 5)
+
+    def test_variation_stock_change_invalidates_product_detail(self):
+        url = reverse('products:product-detail', args=[self.second.id])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock([(self.second.id, self.variation.id, 3)], reference="cart-1")
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['variations'][0]['stock_quantity'], 0)
+
+    def test_failed_reservation_keeps_cache(self):
+        url = reverse('products:product-detail', args=[self.first.id])
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(InsufficientStock):
+                reserve_stock([(self.first.id, None, 2), (self.second.id, None, 3)], reference="cart-1")
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+
+class StockShardTests(CatalogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.create_product(1, stock_quantity=10)
+        self.variation = ProductVariation.objects.create(product=self.product, sku="VAR-1", stock_quantity=5)
+
+    def shards(self, variation_id=None):
+        return list(
+            StockShard.objects.filter(product=self.product, variation_id=variation_id)
+            .order_by('shard').values_list('quantity', flat=True)
+        )
+
+    def test_shard_and_merge_keep_total(self):
+        self.assertEqual(shard_stock(self.product.id, shards=4), 10)
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_shards, 4)
+        self.assertEqual(self.product.available_stock, 10)
+
+        reserve_stock([(self.product.id, None, 3)], reference="cart-1")
+        self.assertEqual(sum(self.shards()), 7)
+        self.assertEqual(shard_stock(self.product.id, shards=0), 7)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_shards, self.product.stock_quantity), (0, 7))
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_decrement_spans_shards_and_never_oversells(self):
+        shard_stock(self.product.id, shards=4)
+        reserve_stock([(self.product.id, None, 9)], reference="cart-1")
+        self.assertEqual(sum(self.shards()), 1)
+        with self.assertRaises(InsufficientStock):
+            reserve_stock([(self.product.id, None, 2)], reference="cart-2")
+        self.assertEqual(sum(self.shards()), 1)
+
+    def test_release_returns_stock_to_shards(self):
+        shard_stock(self.product.id, self.variation.id, shards=2)
+        reserve_stock([(self.product.id, self.variation.id, 5)], reference="cart-1")
+        self.assertEqual(sum(self.shards(self.variation.id)), 0)
+        release_reservations(StockReservation.objects.filter(reference="cart-1"))
+        self.assertEqual(sum(self.shards(self.variation.id)), 5)
+        self.variation.refresh_from_db()
+        self.assertEqual(self.variation.stock_quantity, 5)
+
+    def test_stale_targets_cache_never_touches_sharded_row(self):
+        reserve_stock([(self.product.id, None, 1)], reference="warm-cache")
+        shard_stock(self.product.id, shards=2)
+        cache.set('stock_shards:targets', {})
+        reserve_stock([(self.product.id, None, 4)], reference="cart-1")
+        self.assertEqual(sum(self.shards()), 5)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, 9)
+
+    def test_sync_writes_shard_totals(self):
+        shard_stock(self.product.id, shards=2)
+        shard_stock(self.product.id, self.variation.id, shards=2)
+        reserve_stock([(self.product.id, None, 4), (self.product.id, self.variation.id, 2)], reference="cart-1")
+        sync_sharded_stock()
+        self.product.refresh_from_db()
+        self.variation.refresh_from_db()
+        self.assertEqual((self.product.stock_quantity, self.variation.stock_quantity), (6, 3))
 
-# Create your tests here.
+    def test_detail_reports_shard_totals_before_sync(self):
+        Product.objects.filter(pk=self.product.pk).update(low_stock_threshold=5)
+        shard_stock(self.product.id, shards=2)
+        shard_stock(self.product.id, self.variation.id, shards=2)
+        reserve_stock([(self.product.id, None, 8), (self.product.id, self.variation.id, 2)], reference="cart-1")
+        cache.clear()
+        response = self.client.get(reverse('products:product-detail', args=[self.product.id]))
+        self.assertEqual(response.data['stock_quantity'], 2)
+        self.assertTrue(response.data['is_low_stock'])
+        self.assertEqual(response.data['variations'][0]['stock_quantity'], 3)
@@ -1,21 +1,39 @@
-from rest_framework import generics, filters, status
+from rest_framework import generics
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Avg, Count
-from .models import Category, Brand, Product
+from django.db.models import Q
+from django.utils.decorators import method_decorator
+from ecommerce_platform.cache import cache_response
+from reviews.models import Review
+from .models import (
+    Category, Brand, Product, ProductImage, ProductAttribute, ProductAttributeValue, ProductVariation
+)
+from .filters import ProductFilter, ProductSearchFilter, ProductOrderingFilter, filter_products
+from .suggestions import MIN_QUERY_LENGTH, suggestion_index
+from .facets import get_facets
+from .pagination import ProductPagination
 from .serializers import (
     CategorySerializer, BrandSerializer, ProductListSerializer, 
     ProductDetailSerializer, ProductCreateUpdateSerializer
 )
 
+# النماذج التي تعتمد عليها الاستجابات المخزنة في الكاش
+PRODUCT_LIST_MODELS = (Product, Category, Brand, ProductImage, Review)
+PRODUCT_DETAIL_MODELS = PRODUCT_LIST_MODELS + (ProductVariation, ProductAttribute, ProductAttributeValue)
+
+@method_decorator(cache_response(Category), name='dispatch')
 class CategoryListView(generics.ListAPIView):
     """
     API endpoint لعرض قائمة الفئات
     """
-    queryset = Category.objects.filter(is_active=True, parent=None)
     serializer_class = CategorySerializer
 
+    def get_queryset(self):
+        # الشجرة النشطة كاملة باستعلام واحد؛ الجذور فقط في القائمة وفروعها في tree_children
+        roots = Category.objects.filter(is_active=True).as_tree()
+        return [root for root in roots if root.parent_id is None]
+
 class CategoryDetailView(generics.RetrieveAPIView):
     """
     API endpoint لعرض تفاصيل فئة محددة
@@ -23,6 +41,7 @@ class CategoryDetailView(generics.RetrieveAPIView):
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
 
+@method_decorator(cache_response(Brand), name='dispatch')
 class BrandListView(generics.ListAPIView):
     """
     API endpoint لعرض قائمة العلامات التجارية
@@ -35,49 +54,30 @@ class ProductListView(generics.ListAPIView):
     API endpoint لعرض قائمة المنتجات مع إمكانية البحث والفلترة
     """
     serializer_class = ProductListSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['category', 'brand', 'is_featured']
-    search_fields = ['name', 'description', 'short_description', 'sku']
-    ordering_fields = ['price', 'created_at', 'name']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
+    filterset_class = ProductFilter
+    pagination_class = ProductPagination
+    ordering_fields = ['price', 'created_at', 'name', 'rating']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True).select_related('category', 'brand')
-        
-        # فلترة حسب السعر
-        min_price = self.request.query_params.get('min_price')
-        max_price = self.request.query_params.get('max_price')
-        
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        
-        # فلترة المنتجات المتوفرة فقط
-        in_stock_only = self.request.query_params.get('in_stock_only')
-        if in_stock_only and in_stock_only.lower() == 'true':
-            queryset = queryset.filter(stock_quantity__gt=0)
-        
-        # فلترة حسب التقييم
-        min_rating = self.request.query_params.get('min_rating')
-        if min_rating:
-            # هذا يتطلب تعديل أكثر تعقيداً للاستعلام
-            pass
-        
-        return queryset
+        queryset = Product.objects.filter(is_active=True).for_listing()
+        return filter_products(queryset, self.request.query_params)
 
+@method_decorator(cache_response(*PRODUCT_DETAIL_MODELS), name='dispatch')
 class ProductDetailView(generics.RetrieveAPIView):
     """
     API endpoint لعرض تفاصيل منتج محدد
     """
-    queryset = Product.objects.filter(is_active=True)
+    queryset = Product.objects.filter(is_active=True).select_related('category', 'brand').with_rating()
     serializer_class = ProductDetailSerializer
 
+@method_decorator(cache_response(*PRODUCT_LIST_MODELS), name='dispatch')
 class FeaturedProductsView(generics.ListAPIView):
     """
     API endpoint لعرض المنتجات المميزة
     """
-    queryset = Product.objects.filter(is_active=True, is_featured=True)
+    queryset = Product.objects.filter(is_active=True, is_featured=True).for_listing().order_by('-created_at')
     serializer_class = ProductListSerializer
 
 class RelatedProductsView(generics.ListAPIView):
@@ -94,7 +94,7 @@ class RelatedProductsView(generics.ListAPIView):
             related_products = Product.objects.filter(
                 Q(category=product.category) | Q(brand=product.brand),
                 is_active=True
-            ).exclude(id=product_id)[:8]
+            ).exclude(id=product_id).for_listing().order_by('-created_at')[:8]
             return related_products
         except Product.DoesNotExist:
             return Product.objects.none()
@@ -104,75 +104,20 @@ def product_search_suggestions(request):
     """
     API endpoint لاقتراحات البحث
     """
-    query = request.GET.get('q', '')
-    if len(query) < 2:
+    query = request.GET.get('q', '').strip()
+    if len(query) < MIN_QUERY_LENGTH:
         return Response([])
     
-    # البحث في أسماء المنتجات
-    products = Product.objects.filter(
-        name__icontains=query,
-        is_active=True
-    ).values('id', 'name')[:5]
-    
-    # البحث في الفئات
-    categories = Category.objects.filter(
-        name__icontains=query,
-        is_active=True
-    ).values('id', 'name')[:3]
-    
-    # البحث في العلامات التجارية
-    brands = Brand.objects.filter(
-        name__icontains=query,
-        is_active=True
-    ).values('id', 'name')[:3]
-    
-    suggestions = {
-        'products': list(products),
-        'categories': list(categories),
-        'brands': list(brands)
-    }
-    
-    return Response(suggestions)
+    # البحث في فهرس البادئات المحفوظ في الذاكرة دون الرجوع لقاعدة البيانات
+    return Response(suggestion_index.suggest(query))
 
 @api_view(['GET'])
 def product_filters(request):
     """
-    API endpoint لإرجاع خيارات الفلترة المتاحة
+    API endpoint لإرجاع خيارات الفلترة المتاحة مع أعداد المنتجات لكل خيار
+    يقبل نفس فلاتر قائمة المنتجات ويعيد النتيجة من الكاش إن وجدت
     """
-    category_id = request.GET.get('category')
-    
-    # بناء الاستعلام الأساسي
-    queryset = Product.objects.filter(is_active=True)
-    if category_id:
-        queryset = queryset.filter(category_id=category_id)
-    
-    # نطاق الأسعار
-    price_range = queryset.aggregate(
-        min_price=models.Min('price'),
-        max_price=models.Max('price')
-    )
-    
-    # العلامات التجارية المتاحة
-    brands = Brand.objects.filter(
-        product__in=queryset,
-        is_active=True
-    ).distinct().values('id', 'name')
-    
-    # الفئات المتاحة (إذا لم يتم تحديد فئة)
-    categories = []
-    if not category_id:
-        categories = Category.objects.filter(
-            product__in=queryset,
-            is_active=True
-        ).distinct().values('id', 'name')
-    
-    filters = {
-        'price_range': price_range,
-        'brands': list(brands),
-        'categories': list(categories)
-    }
-    
-    return Response(filters)
+    return Response(get_facets(request.GET))
 
 # Admin Views (تتطلب صلاحيات إدارية)
 class ProductCreateView(generics.CreateAPIView):
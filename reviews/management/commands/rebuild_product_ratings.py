@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from reviews.models import Review, ProductRating
+
+
+class Command(BaseCommand):
+    help = "إعادة بناء ملخصات تقييمات المنتجات من جدول المراجعات لإصلاح أي انحراف"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        rows = (
+            Review.objects.order_by()
+            .values('product_id')
+            .annotate(**ProductRating.aggregate_fields())
+            .filter(review_count__gt=0)
+        )
+        fields = list(ProductRating.aggregate_fields()) + ['updated_at']
+
+        with transaction.atomic():
+            # حذف ملخصات المنتجات التي لم تعد لها مراجعات معتمدة
+            ProductRating.objects.exclude(
+                product_id__in=Review.objects.filter(is_approved=True).values('product_id')
+            ).delete()
+            created = 0
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(ProductRating(**row))
+                if len(batch) >= batch_size:
+                    created += self._write(batch, fields)
+                    batch = []
+            if batch:
+                created += self._write(batch, fields)
+            ProductRating.sync_product_ratings(Product.objects.all())
+
+        self.stdout.write(self.style.SUCCESS(f"تمت إعادة بناء {created} ملخص تقييم"))
+
+    def _write(self, batch, fields):
+        ProductRating.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=fields,
+        )
+        return len(batch)
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-17 03:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_rating_summaries(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    ProductRating = apps.get_model('reviews', 'ProductRating')
+    approved = Q(is_approved=True)
+    counts = {
+        f'rating_{rating}_count': Count('id', filter=approved & Q(rating=rating))
+        for rating in range(1, 6)
+    }
+    rows = (
+        Review.objects.filter(approved).order_by().values('product_id')
+        .annotate(review_count=Count('id'), rating_sum=Sum('rating'), **counts)
+    )
+    ProductRating.objects.bulk_create([ProductRating(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_count', models.PositiveIntegerField(default=0, verbose_name='عدد المراجعات')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='مجموع التقييمات')),
+                ('rating_1_count', models.PositiveIntegerField(default=0, verbose_name='عدد تقييمات نجمة واحدة')),
+                ('rating_2_count', models.PositiveIntegerField(default=0, verbose_name='عدد تقييمات نجمتين')),
+                ('rating_3_count', models.PositiveIntegerField(default=0, verbose_name='عدد تقييمات ثلاث نجوم')),
+                ('rating_4_count', models.PositiveIntegerField(default=0, verbose_name='عدد تقييمات أربع نجوم')),
+                ('rating_5_count', models.PositiveIntegerField(default=0, verbose_name='عدد تقييمات خمس نجوم')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_summary', to='products.product', verbose_name='المنتج')),
+            ],
+            options={
+                'verbose_name': 'ملخص تقييم منتج',
+                'verbose_name_plural': 'ملخصات تقييمات المنتجات',
+            },
+        ),
+        migrations.RunPython(build_rating_summaries, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Cast, Coalesce, Round
 from django.utils import timezone
 
+from products.models import Product
+
 class Review(models.Model):
     product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='reviews', verbose_name="المنتج")
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="المستخدم")
@@ -24,6 +27,18 @@ class Review(models.Model):
         verbose_name_plural = "المراجعات"
         unique_together = ['product', 'user']
         ordering = ['-created_at']
+        indexes = [
+            # مراجعات المنتج المعتمدة تقرأ مرتبة حسب الأحدث أو الأكثر فائدة؛ id آخر الفهرس
+            # لأن ترقيم المراجعات بالمؤشر يرتب به عند التعادل
+            models.Index(
+                fields=['product', '-created_at', '-id'], condition=models.Q(is_approved=True),
+                name='review_product_approved_idx',
+            ),
+            models.Index(
+                fields=['product', '-helpful_count', '-id'], condition=models.Q(is_approved=True),
+                name='review_product_helpful_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.user.username} ({self.rating}/5)"
@@ -88,3 +103,96 @@ class Answer(models.Model):
     def __str__(self):
         return f"إجابة على سؤال حول {self.question.product.name}"
 
+
+class ProductRating(models.Model):
+    """
+    ملخص تقييمات المنتج المعتمدة، يتم تحديثه تدريجياً عند كتابة المراجعات
+    """
+    product = models.OneToOneField('products.Product', on_delete=models.CASCADE, related_name='rating_summary', verbose_name="المنتج")
+    review_count = models.PositiveIntegerField(default=0, verbose_name="عدد المراجعات")
+    rating_sum = models.PositiveIntegerField(default=0, verbose_name="مجموع التقييمات")
+    rating_1_count = models.PositiveIntegerField(default=0, verbose_name="عدد تقييمات نجمة واحدة")
+    rating_2_count = models.PositiveIntegerField(default=0, verbose_name="عدد تقييمات نجمتين")
+    rating_3_count = models.PositiveIntegerField(default=0, verbose_name="عدد تقييمات ثلاث نجوم")
+    rating_4_count = models.PositiveIntegerField(default=0, verbose_name="عدد تقييمات أربع نجوم")
+    rating_5_count = models.PositiveIntegerField(default=0, verbose_name="عدد تقييمات خمس نجوم")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    RATINGS = (1, 2, 3, 4, 5)
+
+    class Meta:
+        verbose_name = "ملخص تقييم منتج"
+        verbose_name_plural = "ملخصات تقييمات المنتجات"
+
+    def __str__(self):
+        return f"{self.product.name} ({self.average_rating}/5)"
+
+    @staticmethod
+    def count_field(rating):
+        return f"rating_{rating}_count"
+
+    @property
+    def average_rating(self):
+        if self.review_count:
+            return round(self.rating_sum / self.review_count, 1)
+        return 0
+
+    @property
+    def rating_distribution(self):
+        return {rating: getattr(self, self.count_field(rating)) for rating in self.RATINGS}
+
+    @classmethod
+    def aggregate_fields(cls):
+        """
+        التجميعات اللازمة لحساب الملخص من جدول المراجعات مباشرة
+        """
+        approved = models.Q(is_approved=True)
+        fields = {
+            'review_count': models.Count('id', filter=approved),
+            'rating_sum': Coalesce(models.Sum('rating', filter=approved), 0, output_field=models.IntegerField()),
+        }
+        for rating in cls.RATINGS:
+            fields[cls.count_field(rating)] = models.Count('id', filter=approved & models.Q(rating=rating))
+        return fields
+
+    @classmethod
+    def rebuild_for_product(cls, product_id):
+        """
+        إعادة حساب ملخص منتج واحد من المراجعات
+        """
+        values = Review.objects.filter(product_id=product_id).aggregate(**cls.aggregate_fields())
+        summary, _ = cls.objects.update_or_create(product_id=product_id, defaults=values)
+        return summary
+
+    @classmethod
+    def sync_product_ratings(cls, products):
+        """
+        نسخ متوسط التقييم من الملخص إلى عمود Product.rating المفهرس بتحديث واحد
+        """
+        average = cls.objects.filter(product=models.OuterRef('pk'), review_count__gt=0).annotate(
+            average=Round(Cast('rating_sum', models.FloatField()) / models.F('review_count'), 2)
+        ).values('average')
+        return products.update(rating=Coalesce(models.Subquery(average), 0.0, output_field=models.DecimalField()))
+
+    @classmethod
+    def apply_changes(cls, product_id, changes, create_missing=True):
+        """
+        تطبيق تغييرات على الملخص بتحديث ذري واحد
+        changes: قاموس {التقييم: التغير في العدد}
+        """
+        changes = {rating: delta for rating, delta in changes.items() if delta}
+        if not changes:
+            return
+        updates = {
+            'review_count': models.F('review_count') + sum(changes.values()),
+            'rating_sum': models.F('rating_sum') + sum(rating * delta for rating, delta in changes.items()),
+            'updated_at': timezone.now(),
+        }
+        for rating, delta in changes.items():
+            field = cls.count_field(rating)
+            updates[field] = models.F(field) + delta
+        updated = cls.objects.filter(product_id=product_id).update(**updates)
+        if not updated and create_missing:
+            # لا يوجد ملخص بعد: نحسبه من المراجعات (بما فيها التغيير الحالي)
+            cls.rebuild_for_product(product_id)
+        cls.sync_product_ratings(Product.objects.filter(pk=product_id))
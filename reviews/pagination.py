@@ -0,0 +1,10 @@
+from ecommerce_platform.pagination import KeysetPagination
+
+
+class ReviewPagination(KeysetPagination):
+    """
+    مراجعات المنتج بالمؤشر على (helpful_count, id) أو (created_at, id) تنازلياً؛ يستخدم
+    فهرسي review_product_helpful_idx و review_product_approved_idx
+    """
+    page_size = 20
+    keyset_fields = ('helpful_count', 'created_at')
@@ -0,0 +1,24 @@
+from rest_framework import serializers
+from .models import Review, ReviewImage
+
+class ReviewImageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReviewImage
+        fields = ['id', 'image', 'caption']
+
+class ReviewSerializer(serializers.ModelSerializer):
+    """
+    لقائمة مراجعات المنتج: المستخدم محمل بـ select_related والصور بـ prefetch_related
+    """
+    user_name = serializers.CharField(source='user.username', read_only=True)
+    images = ReviewImageSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Review
+        fields = [
+            'id', 'user_name', 'rating', 'title', 'comment', 'is_verified_purchase', 'helpful_count', 'images',
+            'created_at',
+        ]
+
+class HelpfulVoteSerializer(serializers.Serializer):
+    is_helpful = serializers.BooleanField(default=True)
@@ -0,0 +1,70 @@
+"""
+تصويتات "مفيد" على المراجعات
+
+Review.helpful_count يخزن عدد التصويتات المفيدة حتى ترتب المراجعات به من الفهرس بدلاً
+من عد صفوف ReviewHelpful لكل مراجعة. كل تغيير في التصويت يعدل العداد بزيادة أو نقص
+ذري بـ F() في نفس المعاملة التي تكتب التصويت، فلا يختلف العداد عن الصفوف مهما تزامنت
+التصويتات: تغيير القيمة يتم بـ UPDATE مشروط لا ينجح إلا لطلب واحد، والتصويت الجديد
+يحميه قيد (review, user) الفريد.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Review, ReviewHelpful
+
+
+class VoteError(Exception):
+    pass
+
+
+def _change_vote(review_id, user, is_helpful):
+    # لا يحدث صفاً إلا إذا كانت القيمة مختلفة، فعدد الصفوف يحدد التغيير في العداد
+    return ReviewHelpful.objects.filter(review_id=review_id, user=user).exclude(
+        is_helpful=is_helpful
+    ).update(is_helpful=is_helpful)
+
+
+def _add_to_count(review_id, delta):
+    reviews = Review.objects.filter(pk=review_id)
+    if delta < 0:
+        reviews = reviews.filter(helpful_count__gte=-delta)
+    reviews.update(helpful_count=F('helpful_count') + delta)
+
+
+def helpful_count(review_id):
+    return Review.objects.filter(pk=review_id).values_list('helpful_count', flat=True).first()
+
+
+def vote(review, user, is_helpful=True):
+    """
+    إضافة تصويت المستخدم أو تغييره؛ تعيد عدد التصويتات المفيدة بعد التصويت
+    """
+    if review.user_id == user.pk:
+        raise VoteError("لا يمكنك التصويت على مراجعتك")
+    step = 1 if is_helpful else -1
+    with transaction.atomic():
+        delta = step if _change_vote(review.pk, user, is_helpful) else 0
+        if not delta and not ReviewHelpful.objects.filter(review_id=review.pk, user=user).exists():
+            try:
+                with transaction.atomic():
+                    ReviewHelpful.objects.create(review_id=review.pk, user=user, is_helpful=is_helpful)
+                delta = 1 if is_helpful else 0
+            except IntegrityError:
+                # طلب متزامن أضاف التصويت أولاً
+                delta = step if _change_vote(review.pk, user, is_helpful) else 0
+        if delta:
+            _add_to_count(review.pk, delta)
+        return helpful_count(review.pk)
+
+
+def remove_vote(review, user):
+    """
+    حذف تصويت المستخدم إن وجد؛ تعيد عدد التصويتات المفيدة بعد الحذف
+    """
+    with transaction.atomic():
+        deleted, _ = ReviewHelpful.objects.filter(review_id=review.pk, user=user, is_helpful=True).delete()
+        if deleted:
+            _add_to_count(review.pk, -deleted)
+        else:
+            ReviewHelpful.objects.filter(review_id=review.pk, user=user).delete()
+        return helpful_count(review.pk)
@@ -0,0 +1,49 @@
+from collections import defaultdict
+
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Review, ProductRating
+
+
+def _apply_rating_changes(removed, added, create_missing=True):
+    """
+    removed/added: أزواج (المنتج، التقييم) للمراجعات المعتمدة قبل وبعد التغيير
+    """
+    changes = defaultdict(lambda: defaultdict(int))
+    for product_id, rating in removed:
+        changes[product_id][rating] -= 1
+    for product_id, rating in added:
+        changes[product_id][rating] += 1
+    for product_id, product_changes in changes.items():
+        ProductRating.apply_changes(product_id, product_changes, create_missing)
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list(
+        'product_id', 'rating', 'is_approved'
+    ).first()
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    removed, added = [], []
+    previous = getattr(instance, '_previous_rating', None)
+    if previous and previous[2]:
+        removed.append(previous[:2])
+    if instance.is_approved:
+        added.append((instance.product_id, instance.rating))
+    _apply_rating_changes(removed, added)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    if instance.is_approved:
+        # لا ننشئ ملخصاً جديداً هنا، فقد يكون الحذف ناتجاً عن حذف المنتج نفسه
+        _apply_rating_changes([(instance.product_id, instance.rating)], [], create_missing=False)
@@ -1,3 +1,218 @@
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from ecommerce_platform.testing import QueryPlanTestMixin
+from products.models import Category, Product
+from .models import Review, ReviewHelpful, ReviewImage, ProductRating
+from .services import VoteError, remove_vote, vote
+
+
+class ReviewTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="كتب")
+        self.product = Product.objects.create(
+            name="كتاب", description="وصف", sku="BOOK-1",
+            category=self.category, price=Decimal('50.00'),
+        )
+
+    def create_review(self, rating, product=None, **kwargs):
+        user = User.objects.create_user(username=f"reviewer-{User.objects.count()}")
+        return Review.objects.create(
+            product=product or self.product, user=user, rating=rating,
+            title="عنوان", comment="تعليق", **kwargs
+        )
+
+    def summary(self, product=None):
+        return ProductRating.objects.get(product=product or self.product)
+
+
+class ProductRatingSignalTests(ReviewTestMixin, TestCase):
+    def test_create_updates_summary(self):
+        self.create_review(5)
+        self.create_review(3)
+        summary = self.summary()
+        self.assertEqual(summary.review_count, 2)
+        self.assertEqual(summary.rating_sum, 8)
+        self.assertEqual(summary.average_rating, 4.0)
+        self.assertEqual(summary.rating_distribution, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1})
+
+    def test_unapproved_review_is_ignored_until_approved(self):
+        review = self.create_review(2, is_approved=False)
+        self.assertFalse(ProductRating.objects.filter(product=self.product).exists())
+
+        review.is_approved = True
+        review.save()
+        self.assertEqual(self.summary().rating_2_count, 1)
+
+        review.is_approved = False
+        review.save()
+        self.assertEqual(self.summary().review_count, 0)
+
+    def test_rating_change_moves_histogram_bucket(self):
+        review = self.create_review(1)
+        review.rating = 4
+        review.save()
+        summary = self.summary()
+        self.assertEqual(summary.review_count, 1)
+        self.assertEqual(summary.rating_sum, 4)
+        self.assertEqual(summary.rating_1_count, 0)
+        self.assertEqual(summary.rating_4_count, 1)
+
+    def test_delete_updates_summary(self):
+        review = self.create_review(5)
+        self.create_review(4)
+        review.delete()
+        summary = self.summary()
+        self.assertEqual(summary.review_count, 1)
+        self.assertEqual(summary.rating_5_count, 0)
+
+    def test_deleting_product_removes_summary(self):
+        self.create_review(5)
+        self.product.delete()
+        self.assertFalse(ProductRating.objects.exists())
+
+    def test_rebuild_command_repairs_drift(self):
+        self.create_review(5)
+        self.create_review(2)
+        ProductRating.objects.update(review_count=10, rating_sum=1, rating_5_count=0)
+        other = Product.objects.create(
+            name="آخر", description="وصف", sku="BOOK-2",
+            category=self.category, price=Decimal('10.00'),
+        )
+        ProductRating.objects.create(product=other, review_count=3, rating_sum=9)
+
+        call_command('rebuild_product_ratings', stdout=StringIO())
+
+        summary = self.summary()
+        self.assertEqual(summary.review_count, 2)
+        self.assertEqual(summary.rating_sum, 7)
+        self.assertEqual(summary.rating_5_count, 1)
+        self.assertFalse(ProductRating.objects.filter(product=other).exists())
+
+    def test_product_detail_reads_summary(self):
+        self.create_review(5)
+        self.create_review(4)
+        url = reverse('products:product-detail', args=[self.product.id])
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        # لا قراءة لجدول المراجعات عند عرض تفاصيل المنتج
+        self.assertFalse(any('"reviews_review"' in query['sql'] for query in context.captured_queries))
+        self.assertEqual(response.data['average_rating'], 4.5)
+        self.assertEqual(response.data['review_count'], 2)
+        self.assertEqual(response.data['rating_distribution'][5], 1)
+
+
+class ReviewQueryPlanTests(ReviewTestMixin, QueryPlanTestMixin, TestCase):
+    def test_approved_reviews_of_product_use_index(self):
+        queryset = Review.objects.filter(product=self.product, is_approved=True)
+        self.assertUsesIndex(queryset, 'review_product_approved_idx')
+
+    def test_keyset_orderings_read_index_without_sorting(self):
+        reviews = Review.objects.filter(product=self.product, is_approved=True)
+        plan = self.assertUsesIndex(reviews.order_by('-helpful_count', '-id')[:21], 'review_product_helpful_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.assertUsesIndex(reviews.order_by('-created_at', '-id')[:21], 'review_product_approved_idx')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class ReviewListTests(ReviewTestMixin, TestCase):
+    def url(self, product=None):
+        return reverse('reviews:product-reviews', args=[(product or self.product).id])
+
+    def test_most_helpful_first_with_cursor_pages(self):
+        reviews = [self.create_review(5, helpful_count=count) for count in (3, 7, 3, 0, 7)]
+        self.create_review(5, helpful_count=100, is_approved=False)
+
+        response = self.client.get(self.url(), {'page_size': 2})
+        ids = [review['id'] for review in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [review['id'] for review in response.data['results']]
+
+        expected = sorted(reviews, key=lambda review: (-review.helpful_count, -review.id))
+        self.assertEqual(ids, [review.id for review in expected])
+
+    def test_newest_ordering(self):
+        reviews = [self.create_review(4, helpful_count=count) for count in (5, 0, 2)]
+        response = self.client.get(self.url(), {'ordering': '-created_at'})
+        self.assertEqual([review['id'] for review in response.data['results']], [review.id for review in reversed(reviews)])
+
+    def test_unsupported_ordering_is_rejected(self):
+        self.assertEqual(self.client.get(self.url(), {'ordering': 'rating'}).status_code, 400)
+
+    def test_unknown_product(self):
+        self.assertEqual(self.client.get(reverse('reviews:product-reviews', args=[0])).status_code, 404)
+
+    def test_query_count_does_not_grow_with_reviews(self):
+        for _ in range(5):
+            review = self.create_review(5)
+            ReviewImage.objects.create(review=review, image='reviews/r.gif', caption="صورة")
+        # المنتج، المراجعات مع المستخدمين، الصور
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url())
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertEqual(response.data['results'][0]['images'][0]['caption'], "صورة")
+        self.assertTrue(response.data['results'][0]['user_name'].startswith('reviewer-'))
+
+
+class ReviewHelpfulTests(ReviewTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.review = self.create_review(5)
+        self.voter = User.objects.create_user(username="voter")
+
+    def count(self):
+        self.review.refresh_from_db()
+        return self.review.helpful_count
+
+    def test_vote_transitions_keep_count_in_sync(self):
+        other = User.objects.create_user(username="other")
+        self.assertEqual(vote(self.review, self.voter), 1)
+        self.assertEqual(vote(self.review, self.voter), 1)
+        self.assertEqual(vote(self.review, other), 2)
+        self.assertEqual(vote(self.review, self.voter, False), 1)
+        self.assertEqual(vote(self.review, self.voter, False), 1)
+        self.assertEqual(vote(self.review, self.voter, True), 2)
+        self.assertEqual(remove_vote(self.review, other), 1)
+        self.assertEqual(remove_vote(self.review, other), 1)
+        self.assertEqual(
+            self.count(), ReviewHelpful.objects.filter(review=self.review, is_helpful=True).count()
+        )
+
+    def test_not_helpful_vote_does_not_change_count(self):
+        self.assertEqual(vote(self.review, self.voter, False), 0)
+        self.assertEqual(remove_vote(self.review, self.voter), 0)
+        self.assertFalse(ReviewHelpful.objects.exists())
+
+    def test_cannot_vote_on_own_review(self):
+        with self.assertRaises(VoteError):
+            vote(self.review, self.review.user)
+        self.assertEqual(self.count(), 0)
+
+    def test_count_is_incremented_atomically(self):
+        # زيادة من قاعدة البيانات لا من القيمة المقروءة في Python
+        Review.objects.filter(pk=self.review.pk).update(helpful_count=10)
+        self.assertEqual(vote(self.review, self.voter), 11)
+
+    def test_endpoint(self):
+        url = reverse('reviews:review-helpful', args=[self.review.id])
+        self.assertIn(self.client.post(url).status_code, (401, 403))
+
+        self.client.force_authenticate(self.voter)
+        self.assertEqual(self.client.post(url).data, {'helpful_count': 1})
+        self.assertEqual(self.client.post(url, {'is_helpful': False}, format='json').data, {'helpful_count': 0})
+        self.assertEqual(self.client.delete(url).data, {'helpful_count': 0})
 
-# Create your tests here.
+        self.client.force_authenticate(self.review.user)
+        self.assertEqual(self.client.post(url).status_code, 400)
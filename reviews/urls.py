@@ -1,8 +1,9 @@
 from django.urls import path
+from . import views
 
 app_name = 'reviews'
 
 urlpatterns = [
-    # سيتم إضافة URLs لاحقاً
+    path('products/<int:product_id>/', views.product_reviews, name='product-reviews'),
+    path('<int:review_id>/helpful/', views.review_helpful, name='review-helpful'),
 ]
-
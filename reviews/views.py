@@ -1,3 +1,47 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from products.models import Product
+from .models import Review, ReviewImage
+from .pagination import ReviewPagination
+from .serializers import HelpfulVoteSerializer, ReviewSerializer
+from .services import VoteError, remove_vote, vote
 
-# Create your views here.
+ORDERINGS = ('-helpful_count', '-created_at')
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def product_reviews(request, product_id):
+    """
+    API endpoint لمراجعات المنتج المعتمدة، الأكثر فائدة أولاً أو الأحدث (?ordering=-created_at)
+    """
+    ordering = request.query_params.get('ordering', ORDERINGS[0])
+    if ordering not in ORDERINGS:
+        return Response({'ordering': ["الترتيب غير مدعوم."]}, status=status.HTTP_400_BAD_REQUEST)
+    get_object_or_404(Product.objects.filter(is_active=True).values('pk'), pk=product_id)
+    queryset = Review.objects.filter(product_id=product_id, is_approved=True).select_related('user').prefetch_related(
+        Prefetch('images', queryset=ReviewImage.objects.order_by('id'))
+    )
+    paginator = ReviewPagination()
+    page = paginator.paginate_queryset(queryset.order_by(ordering), request)
+    return paginator.get_paginated_response(ReviewSerializer(page, many=True).data)
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def review_helpful(request, review_id):
+    """
+    API endpoint لتصويت المستخدم على فائدة مراجعة (POST) أو سحب تصويته (DELETE)
+    """
+    review = get_object_or_404(Review.objects.filter(is_approved=True).only('id', 'user_id'), pk=review_id)
+    if request.method == 'DELETE':
+        return Response({'helpful_count': remove_vote(review, request.user)})
+    serializer = HelpfulVoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    try:
+        count = vote(review, request.user, serializer.validated_data['is_helpful'])
+    except VoteError as exc:
+        return Response({'review': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'helpful_count': count})